@@ -1,5 +1,9 @@
 import streamlit as st
-from utils import project_id, run_query
+from admin import show_admin_page
+from bills import bill_count
+from profiling import profiling_mode, start_page_profile
+from queries import run_registered_query
+from utils import is_admin_request, run_concurrently
 from millify import millify
 
 st.set_page_config(
@@ -8,56 +12,53 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
+if is_admin_request() and not profiling_mode():
+    show_admin_page()
+    st.stop()
+
+profile = start_page_profile("Singapore_Parliament_Speeches")
+
 ### BACKEND
 
 
 def get_dataset_overview():
-    query = f"""
-    select min(date) as earliest_date, max(date) as latest_date, count(*) as count_sittings
-    from `{project_id}.prod_fact.fact_sittings`
-    """
-    return run_query(query)[0]
+    return run_registered_query("dataset_overview", as_dataframe=False)[0]
 
 
-def get_member_counts(latest_date):
-    query = f"""
-    select
-        countif(latest_sitting = '{latest_date}') as count_current_members,
-        count(*) as count_members
-    from `{project_id}.prod_dim.dim_members`
-    where member_name != ''
-    """
-    return run_query(query)[0]
+def get_member_counts():
+    return run_registered_query("member_counts", as_dataframe=False)[0]
 
 
 def get_speech_counts():
-    query = f"""
-    select
-        countif(is_primary_question) as count_primary_questions,
-        count(distinct topic_id) as count_topics,
-        count(*) as count_speeches
-    from `{project_id}.prod_mart.mart_speeches`
-
-    """
-    return run_query(query)[0]
+    return run_registered_query("speech_counts", as_dataframe=False)[0]
 
 
 def get_bill_counts():
-    query = f"""
-    select count(*) as count_bills from `{project_id}.prod_mart.mart_bills`
-    """
-    return run_query(query)[0]
+    # from the table metadata, without scanning mart_bills
+    return {"count_bills": bill_count()}
 
 
 # Fetch data
-min_max_sittings = get_dataset_overview()
+profile.phase("data load")
+overview = dict(
+    run_concurrently(
+        {
+            "min_max_sittings": get_dataset_overview,
+            "count_members": get_member_counts,
+            "count_speeches": get_speech_counts,
+            "count_bills": get_bill_counts,
+        }
+    )
+)
+min_max_sittings = overview["min_max_sittings"]
 earliest_date = min_max_sittings["earliest_date"].strftime("%Y-%m-%d")
 latest_date = min_max_sittings["latest_date"].strftime("%Y-%m-%d")
-count_members = get_member_counts(latest_date)
-count_speeches = get_speech_counts()
-count_bills = get_bill_counts()
+count_members = overview["count_members"]
+count_speeches = overview["count_speeches"]
+count_bills = overview["count_bills"]
 
 ### FRONTEND
+profile.phase("render")
 st.title("Singapore Parliament Speeches")
 st.markdown(
     "This webapp is built to help Singaporeans understand the legislative outputs of their elected representatives."
@@ -99,3 +100,5 @@ st.markdown(
             * Data visualisation: [Looker Studio Dashboard](https://lookerstudio.google.com/u/1/reporting/e41e239f-a88a-45b9-b133-5c91bb1f3f13/page/p_jniba4ngfd).
             """
 )
+
+profile.finish()
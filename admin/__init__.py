@@ -0,0 +1,59 @@
+import streamlit as st
+
+from charts import chart_payloads
+from guard import guard_state
+from instrumentation import metrics_text, query_events, query_summary
+from profiling import page_timings
+from queries import cache_freshness, query_stats
+
+LATEST_CALLS = 500
+
+
+def show_admin_page():
+    """Shows the query metrics recorded by this server process."""
+    st.title("Admin: Queries")
+
+    st.subheader("Calls by query and page")
+    st.caption("Slowest first. Hit rate is over calls that can be cached.")
+    st.dataframe(query_summary(), use_container_width=True, hide_index=True)
+
+    st.subheader("Registered query executions")
+    freshness = cache_freshness()
+    st.caption(
+        f"Cache mode {freshness['cache_mode']}: {freshness['results']} results kept, "
+        f"data last checked {freshness['last_checked']}, "
+        f"last changed {freshness['last_changed']}."
+    )
+    st.dataframe(query_stats(), use_container_width=True, hide_index=True)
+
+    st.subheader("Latest calls")
+    st.dataframe(
+        query_events().tail(LATEST_CALLS).iloc[::-1],
+        use_container_width=True,
+        hide_index=True,
+    )
+
+    st.subheader("Page render timings")
+    st.caption("Milliseconds per phase of the latest reruns, see `profiling`.")
+    st.dataframe(page_timings().iloc[::-1], use_container_width=True, hide_index=True)
+
+    st.subheader("Chart payloads")
+    st.caption(
+        "Bytes sent to the browser per chart (spec and data) and build time, "
+        "of the latest build, see `charts`."
+    )
+    st.dataframe(chart_payloads(), use_container_width=True, hide_index=True)
+
+    st.subheader("Query guard")
+    st.caption(
+        "Byte budgets (from dry runs) and result row limit of BigQuery queries, "
+        "enabled with PARL_QUERY_GUARD=1, see `guard`."
+    )
+    st.dataframe(guard_state(), use_container_width=True, hide_index=True)
+
+    text = metrics_text()
+    st.download_button(
+        "Download metrics", text, file_name="query_metrics.txt", mime="text/plain"
+    )
+    with st.expander("Metrics dump"):
+        st.code(text, language="text")
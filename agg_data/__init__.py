@@ -1,62 +1,169 @@
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
 import streamlit as st
-from utils import project_id, query_to_dataframe
+from cube import MetricCube
+from incremental import CHECK_INTERVAL_SECONDS, IncrementalTable
+from members import MemberIndex
+from parties import build_party_comparisons
+from queries import on_data_change, run_registered_query, warm_up as warm_up_queries
+from ranks import MetricRanks, build_metric_ranks
+from search import SpeechIndex
+from thumbnails import refresh_member_images
+from topics import TopicTrends
+from utils import CACHE_MODE, PARLIAMENTS, run_concurrently
+
+# With CACHE_MODE "swr", the structures below are rebuilt when the data
+# changes (see `_on_data_change`) rather than after a fixed time.
+RESOURCE_TTL = None if CACHE_MODE == "swr" else 6000
 
 
 def get_member_list():
-    query = f"""
-    select
-        member_name,
-        member_birth_year,
-        member_image_link,
-        trim(latest_member_constituency) as constituency,
-        party,
-        earliest_sitting,
-        latest_sitting,
-        count_sittings_present,
-        count_sittings_total,
-        latest_sitting = max(latest_sitting) over() as is_active
-    from `{project_id}.prod_dim.dim_members`
-    where member_name != '' and member_name is not null
-    """
-    return query_to_dataframe(query)
+    return run_registered_query("member_list")
 
 
 def get_member_positions():
-    query = f"""
-    select * from `{project_id}.prod_fact.fact_member_positions`
-    """
-    return query_to_dataframe(query)
+    return run_registered_query("member_positions")
+
+
+@st.cache_resource
+def _member_speech_metrics_table() -> IncrementalTable:
+    return IncrementalTable(
+        "agg_speech_metrics_by_member",
+        full_query="member_speech_metrics",
+        since_query="member_speech_metrics_since",
+        check_interval=None if CACHE_MODE == "swr" else CHECK_INTERVAL_SECONDS,
+    )
 
 
 def get_all_member_speeches():
-    query = f"""
-      select
-          parliament,
-          year,
-          month,
-          member_name,
-          member_party,
-          member_constituency,
-
-          count_sittings_total,
-          count_sittings_present as count_sittings_attended,
-          count_sittings_spoken,
-          count_topics,
-          count_pri_questions,
-          count_speeches,
-
-          count_words,
-          count_sentences,
-          count_syllables
-      from `{project_id}.prod_agg.agg_speech_metrics_by_member`
-    """
-    return query_to_dataframe(query)
+    # refreshed incrementally by month, see IncrementalTable
+    return _member_speech_metrics_table().get()
 
 
 def primary_question_topics():
-    query = f"""
-        select member_name, ministry_addressed, count(*) as count_pri_questions
-        from `{project_id}.prod_agg.agg_pri_questions_topics_by_member`
-        group by all
+    return run_registered_query("primary_question_topics")
+
+
+@st.cache_resource(ttl=RESOURCE_TTL)
+def get_metric_cube() -> MetricCube:
+    """
+    Returns the metric cube of all member speech metrics, built once per data
+    refresh and shared by all sessions. Pages roll it up instead of grouping
+    the raw table.
+    """
+    return MetricCube(get_all_member_speeches())
+
+
+@st.cache_resource(ttl=RESOURCE_TTL)
+def get_member_index() -> MemberIndex:
+    """
+    Returns the member index over the member list, member positions and
+    metrics aggregated by member. Built once per data refresh and shared by
+    all sessions, so its frames must not be modified.
+    """
+    datasets = dict(
+        run_concurrently(
+            {
+                "members": get_member_list,
+                "positions": get_member_positions,
+                "cube": get_metric_cube,
+            }
+        )
+    )
+    return MemberIndex(
+        datasets["members"],
+        datasets["positions"],
+        datasets["cube"].rollup(["member_name"]),
+    )
+
+
+# Arguments pages get metric ranks with (the By Members page and the
+# Leaderboard), as passed: they are the keys of the cached ranks.
+RANKED_GROUPINGS = [
+    (),
+    (("member_name", "member_party", "member_constituency"),),
+]
+
+
+@st.cache_resource(ttl=RESOURCE_TTL)
+def get_metric_ranks(
+    group_by_fields: Tuple[str, ...] = ("member_name",)
+) -> Dict[Optional[str], MetricRanks]:
+    """
+    Returns metric ranks for every selection in `PARLIAMENTS` (and None for all
+    data), built once per data refresh and shared by all sessions.
+    """
+    return build_metric_ranks(get_metric_cube(), list(group_by_fields), PARLIAMENTS)
+
+
+@st.cache_resource(ttl=RESOURCE_TTL)
+def get_party_comparisons() -> Dict[str, pd.DataFrame]:
+    """
+    Returns party metrics with bootstrap confidence intervals for every
+    selection in `PARLIAMENTS`, computed once per data refresh and shared by
+    all sessions.
+    """
+    return build_party_comparisons(get_metric_cube(), PARLIAMENTS)
+
+
+@st.cache_resource(ttl=RESOURCE_TTL)
+def get_speech_index() -> SpeechIndex:
+    """
+    Returns the full-text index over speeches, opened from disk and brought up
+    to date with the sittings since it was last updated. Shared by all
+    sessions.
+    """
+    index = SpeechIndex()
+    index.update()
+    return index
+
+
+@st.cache_resource(ttl=RESOURCE_TTL)
+def get_topic_trends() -> TopicTrends:
+    """
+    Returns the topic matrix of all speeches, loaded once and then updated
+    with the new months when the data changes. Shared by all sessions.
+    """
+    trends = TopicTrends()
+    trends.update()
+    return trends
+
+
+def _on_data_change():
+    # fetch the new months, then rebuild what is built from them
+    _member_speech_metrics_table().update()
+    get_metric_cube.clear()
+    get_member_index.clear()
+    get_metric_ranks.clear()
+    get_party_comparisons.clear()
+    get_metric_cube()
+    get_member_index()
+    for args in RANKED_GROUPINGS:
+        get_metric_ranks(*args)
+    get_party_comparisons()
+    get_speech_index().update()
+    get_topic_trends().update()
+    refresh_member_images(get_member_list())
+
+
+on_data_change(_on_data_change)
+
+
+def warm_up():
+    """
+    Runs the registered queries pages read, loads the local speech metrics,
+    builds the metric cube, member index, metric ranks and party comparisons,
+    updates the speech index and topic matrix and downloads the member
+    photos' thumbnails, so that no visitor waits for them. Called when the server starts, see `serve`.
     """
-    return query_to_dataframe(query)
+    table = _member_speech_metrics_table()
+    warm_up_queries(exclude=(table.full_query, table.since_query))
+    get_metric_cube()
+    get_member_index()
+    for args in RANKED_GROUPINGS:
+        get_metric_ranks(*args)
+    get_party_comparisons()
+    get_speech_index()
+    get_topic_trends()
+    refresh_member_images(get_member_list())
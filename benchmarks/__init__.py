@@ -0,0 +1,62 @@
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict
+
+import pyarrow as pa
+
+# Benchmarks run on synthetic data and never reach BigQuery.
+os.environ.setdefault("PARL_DATA_BACKEND", "snapshot")
+
+
+def measure(func: Callable, *args, repeat: int = 3) -> Dict[str, float]:
+    """
+    Measures a function call.
+
+    Parameters:
+    - func (Callable): Function to measure.
+    - *args: Arguments passed to the function.
+    - repeat (int): Number of timed calls; the fastest one is reported.
+
+    Returns:
+    - Dict[str, float]: `seconds` (fastest wall time) and `peak_mb`, the peak
+      memory allocated during one call by Python objects, NumPy and Arrow.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+
+    # traced separately, as tracing slows down allocation-heavy code
+    pool = pa.default_memory_pool()
+    arrow_before = pool.bytes_allocated()
+    tracemalloc.start()
+    result = func(*args)
+    _, python_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # the Arrow pool only reports its process-wide peak, hence `run_isolated`
+    arrow_peak = max(pool.max_memory() - arrow_before, 0)
+    del result
+
+    return {
+        "seconds": min(timings),
+        "peak_mb": (python_peak + arrow_peak) / 1e6,
+    }
+
+
+def run_isolated(module: str, *args: str) -> dict:
+    """
+    Runs `python -m module *args` in a fresh interpreter and returns the JSON
+    object it prints last, so that each measurement starts from a clean heap.
+    """
+    output = subprocess.run(
+        [sys.executable, "-m", module, *args],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
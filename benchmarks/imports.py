@@ -0,0 +1,108 @@
+"""
+Reports the import time of the app's entry points: the landing page and each
+page script, as a cold start pays it before the first element is drawn.
+
+Each entry point's module-level imports are run in a fresh interpreter under
+`python -X importtime`; imports inside functions and page sections (e.g. the
+chart libraries) are not counted, as they only run when that code does. The
+cost of each module is its own import time, summed by top-level package.
+
+Usage:
+    python -m benchmarks.imports                           # every entry point
+    python -m benchmarks.imports pages/archive/0_Leaderboard.py --top 20
+    python -m benchmarks.imports --output imports.json
+"""
+import argparse
+import ast
+import glob
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = ["Singapore_Parliament_Speeches.py"] + sorted(
+    os.path.relpath(path, ROOT)
+    for path in glob.glob(os.path.join(ROOT, "pages", "**", "*.py"), recursive=True)
+)
+
+TOP_MODULES = 10
+
+
+def module_imports(script: str) -> str:
+    """Returns the module-level import statements of a script, as source code."""
+    with open(os.path.join(ROOT, script)) as f:
+        tree = ast.parse(f.read())
+    return "\n".join(
+        ast.unparse(node)
+        for node in tree.body
+        if isinstance(node, (ast.Import, ast.ImportFrom))
+    )
+
+
+def import_times(script: str) -> Dict[str, float]:
+    """
+    Runs the module-level imports of a script in a fresh interpreter.
+
+    Parameters:
+    - script (str): Path of the entry point, relative to the repository root.
+
+    Returns:
+    - Dict[str, float]: Milliseconds spent importing each module, excluding
+      the modules it imported, by module name.
+    """
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", module_imports(script)],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stderr
+
+    times = {}
+    for line in stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        times[name.strip()] = times.get(name.strip(), 0) + int(self_us) / 1000
+    return times
+
+
+def report(script: str, top: int = TOP_MODULES) -> dict:
+    """
+    Returns the total import time of an entry point, and its `top` most
+    expensive top-level packages (e.g. 'pandas', 'google', 'utils').
+    """
+    packages = defaultdict(float)
+    for name, ms in import_times(script).items():
+        packages[name.split(".")[0]] += ms
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+    return {
+        "entry_point": script,
+        "total_ms": sum(packages.values()),
+        "modules": [{"module": name, "ms": ms} for name, ms in ranked[:top]],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("entry_points", nargs="*", default=ENTRY_POINTS)
+    parser.add_argument("--top", type=int, default=TOP_MODULES)
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results: List[dict] = []
+    for script in args.entry_points:
+        result = report(script, args.top)
+        results.append(result)
+        print(f"{result['entry_point']}: {result['total_ms']:,.0f} ms")
+        for module in result["modules"]:
+            print(f"    {module['module']:<30} {module['ms']:>9,.1f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,95 @@
+"""
+Compares the two ways of turning a query result into a cached DataFrame:
+
+- dict: the previous path. Every row becomes a `bigquery.Row` and then a
+  `dict`, the list of dicts is cached by `run_query`, and `query_to_dataframe`
+  caches a second copy as a DataFrame.
+- arrow: `query_to_arrow` + `arrow_to_dataframe`, cached once as a DataFrame.
+
+The input is an Arrow table shaped like `agg_speech_metrics_by_member`.
+
+Usage:
+    python -m benchmarks.ingestion [rows ...]
+"""
+import json
+import pickle
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from google.cloud.bigquery.table import Row
+
+from benchmarks import measure, run_isolated
+from utils import arrow_to_dataframe
+
+DEFAULT_ROWS = [50_000, 500_000]
+
+
+def speech_metrics_table(rows: int, seed: int = 0) -> pa.Table:
+    rng = np.random.default_rng(seed)
+    count_columns = [
+        "count_sittings_total",
+        "count_sittings_attended",
+        "count_sittings_spoken",
+        "count_topics",
+        "count_pri_questions",
+        "count_speeches",
+        "count_words",
+        "count_sentences",
+        "count_syllables",
+    ]
+    columns = {
+        "parliament": rng.integers(12, 15, rows),
+        "year": rng.integers(2012, 2025, rows),
+        "month": rng.integers(1, 13, rows),
+        "member_name": pd.Series(rng.integers(0, 300, rows)).map("Member {}".format),
+        "member_party": rng.choice(["PAP", "WP", "PSP", "NMP", "SPP"], rows),
+        "member_constituency": pd.Series(rng.integers(0, 40, rows)).map(
+            "Constituency {}".format
+        ),
+    }
+    for col in count_columns:
+        columns[col] = rng.integers(0, 5000, rows)
+    return pa.table(columns)
+
+
+def dict_path(field_to_index, values):
+    rows = [dict(Row(row, field_to_index)) for row in values]
+    return rows, pd.DataFrame(rows)
+
+
+def arrow_path(arrow_table):
+    # arrow_to_dataframe releases the table it converts, so convert a copy
+    return arrow_to_dataframe(pa.Table.from_batches(arrow_table.to_batches()))
+
+
+def run(path: str, rows: int) -> dict:
+    arrow_table = speech_metrics_table(rows)
+    if path == "dict":
+        field_to_index = {name: i for i, name in enumerate(arrow_table.column_names)}
+        values = list(zip(*(col.to_pylist() for col in arrow_table.columns)))
+        args = (field_to_index, values)
+        func = dict_path
+    else:
+        args = (arrow_table,)
+        func = arrow_path
+
+    result = measure(func, *args)
+    result["cached_mb"] = len(pickle.dumps(func(*args))) / 1e6
+    return result
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        print(json.dumps(run(sys.argv[2], int(sys.argv[3]))))
+        sys.exit()
+
+    print(f"{'rows':>9} {'path':>6} {'seconds':>8} {'peak MB':>8} {'cached MB':>10}")
+    for rows in [int(arg) for arg in sys.argv[1:]] or DEFAULT_ROWS:
+        for path in ["dict", "arrow"]:
+            result = run_isolated("benchmarks.ingestion", "--child", path, str(rows))
+            print(
+                f"{rows:>9} {path:>6} {result['seconds']:>8.3f} "
+                f"{result['peak_mb']:>8.1f} {result['cached_mb']:>10.1f}"
+            )
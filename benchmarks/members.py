@@ -0,0 +1,218 @@
+"""
+Benchmarks the members and aggregation hot paths on synthetic data
+(`benchmarks.synthetic`) at multiples of today's size, without BigQuery.
+
+Inputs are loaded the way the app loads them: through the registered
+queries (on DuckDB over Parquet snapshots of the synthetic tables) and
+`schema.compact_dtypes`. Each function and scale is measured in a fresh
+interpreter. The scaling exponent is the slope of log(time) against
+log(scale) from the previous scale: 1 is linear.
+
+Usage:
+    python -m benchmarks.members                           # every function and scale
+    python -m benchmarks.members --scales 1 10 --functions leaderboard
+    python -m benchmarks.members --output results.json
+"""
+import argparse
+import json
+import math
+import sys
+import tempfile
+from typing import Callable, Dict, List, Tuple
+
+import pandas as pd
+
+from benchmarks import measure, run_isolated
+from benchmarks.synthetic import write_synthetic_snapshots
+from cube import MetricCube
+from members import (
+    aggregate_by_year,
+    aggregate_member_metrics,
+    categorise_active_members_with_appointments,
+)
+from queries import REGISTRY
+from ranks import build_metric_ranks
+from schema import compact_dtypes
+from snapshots import query_snapshot
+from tables import table_page
+from utils import PARLIAMENTS, arrow_to_dataframe, project_id
+
+SCALES = [1, 10, 100, 1000]
+
+LEADERBOARD_COLUMNS = {
+    "member_name": "Member Name",
+    "participation_rate": "Participation (%)",
+    "attendance": "Attendance (%)",
+    "count_sittings_spoken": "# Spoken",
+    "count_sittings_attended": "# Attended",
+    "count_sittings_total": "# Total",
+    "member_party": "Party",
+    "member_constituency": "Constituency",
+}
+
+
+def load_dataset(name: str, snapshot_dir: str) -> pd.DataFrame:
+    """Runs a registered query on snapshots, as the app would with `PARL_DATA_BACKEND=snapshot`."""
+    return compact_dtypes(
+        arrow_to_dataframe(query_snapshot(REGISTRY[name].sql, project_id, snapshot_dir))
+    )
+
+
+def leaderboard(all_members_speech_summary: pd.DataFrame) -> List[pd.DataFrame]:
+    """
+    The Leaderboard participation table for every parliament, from the speech
+    summary: `agg_data.get_metric_ranks` and the processing in `0_Leaderboard`.
+    """
+    group_by_fields = ["member_name", "member_party", "member_constituency"]
+    metric_ranks = build_metric_ranks(
+        MetricCube(all_members_speech_summary), group_by_fields, PARLIAMENTS
+    )
+
+    tables = []
+    for select_parliament in PARLIAMENTS:
+        leaderboard_ranks = metric_ranks[select_parliament]
+        processed = leaderboard_ranks.frame[LEADERBOARD_COLUMNS.keys()].copy()
+        processed["# Rank"] = leaderboard_ranks.all_ranks("participation_rate")
+        processed.rename(columns=LEADERBOARD_COLUMNS, inplace=True)
+        tables.append(processed.sort_values("# Rank"))
+    return tables
+
+
+def leaderboard_table(to_display: pd.DataFrame) -> bytes:
+    """
+    Renders the first page of the Leaderboard table with two members
+    highlighted, as `tables.show_table` sends it to the browser.
+    """
+    from streamlit.elements.arrow import marshall
+    from streamlit.proto.Arrow_pb2 import Arrow
+
+    selected_rows = (
+        to_display["Member Name"]
+        .isin(to_display["Member Name"].iloc[[0, -1]])
+        .to_numpy()
+    )
+    proto = Arrow()
+    marshall(proto, table_page(to_display, 1, highlight=selected_rows), "leaderboard")
+    return proto.SerializeToString()
+
+
+def _aggregate_member_metrics(snapshot_dir: str) -> Tuple[Callable, tuple]:
+    speech_summary = load_dataset("member_speech_metrics", snapshot_dir)
+    group_by_fields = [
+        "member_name",
+        "member_party",
+        "member_constituency",
+        "parliament",
+    ]
+    return aggregate_member_metrics, (speech_summary, None, group_by_fields)
+
+
+def _categorise_active_members(snapshot_dir: str) -> Tuple[Callable, tuple]:
+    # as on the constituencies page, for every active member at once
+    members = load_dataset("member_list", snapshot_dir)
+    positions = load_dataset("member_positions", snapshot_dir)
+    active_members = sorted(members[members["is_active"]]["member_name"].tolist())
+    current_member_appointments = positions[
+        (positions["type"] == "appointment") & (positions["is_latest_position"])
+    ]
+    return categorise_active_members_with_appointments, (
+        active_members,
+        current_member_appointments,
+    )
+
+
+def _prepare_aggregated_data(snapshot_dir: str) -> Tuple[Callable, tuple]:
+    # prepare_aggregated_data of the members page, with the cube already built
+    speech_summary = load_dataset("member_speech_metrics", snapshot_dir)
+    return aggregate_by_year, (speech_summary, MetricCube(speech_summary))
+
+
+def _leaderboard(snapshot_dir: str) -> Tuple[Callable, tuple]:
+    return leaderboard, (load_dataset("member_speech_metrics", snapshot_dir),)
+
+
+def _leaderboard_table(snapshot_dir: str) -> Tuple[Callable, tuple]:
+    # the "All" parliaments table, the longest
+    all_parliaments = leaderboard(load_dataset("member_speech_metrics", snapshot_dir))
+    return leaderboard_table, (all_parliaments[-1],)
+
+
+# benchmark name -> setup returning the function to measure and its arguments
+BENCHMARKS: Dict[str, Callable[[str], Tuple[Callable, tuple]]] = {
+    "aggregate_member_metrics": _aggregate_member_metrics,
+    "categorise_active_members": _categorise_active_members,
+    "prepare_aggregated_data": _prepare_aggregated_data,
+    "leaderboard": _leaderboard,
+    "leaderboard_table": _leaderboard_table,
+}
+
+
+def run(benchmark: str, snapshot_dir: str) -> dict:
+    func, args = BENCHMARKS[benchmark](snapshot_dir)
+    result = measure(func, *args)
+    result["input_rows"] = max(len(arg) for arg in args if hasattr(arg, "__len__"))
+    return result
+
+
+def scaling_exponents(results: List[dict]) -> List[float]:
+    """
+    Returns, for each result after the first, the slope of log(seconds)
+    against log(scale) from the previous scale of the same benchmark.
+    """
+    exponents = []
+    previous = {}
+    for result in results:
+        before = previous.get(result["benchmark"])
+        if before is None or before["seconds"] <= 0:
+            exponents.append(math.nan)
+        else:
+            exponents.append(
+                math.log(result["seconds"] / before["seconds"])
+                / math.log(result["scale"] / before["scale"])
+            )
+        previous[result["benchmark"]] = result
+    return exponents
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        print(json.dumps(run(sys.argv[2], sys.argv[3])))
+        sys.exit()
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scales", nargs="+", type=int, default=SCALES)
+    parser.add_argument(
+        "--functions", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS)
+    )
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in sorted(args.scales):
+            snapshot_dir = f"{directory}/scale_{scale}"
+            write_synthetic_snapshots(snapshot_dir, scale)
+            for benchmark in args.functions:
+                result = run_isolated(
+                    "benchmarks.members", "--child", benchmark, snapshot_dir
+                )
+                results.append({"benchmark": benchmark, "scale": scale, **result})
+
+    results.sort(key=lambda result: (result["benchmark"], result["scale"]))
+    for result, exponent in zip(results, scaling_exponents(results)):
+        result["scaling_exponent"] = exponent
+
+    print(
+        f"{'benchmark':<27} {'scale':>6} {'rows':>10} {'seconds':>9} "
+        f"{'peak MB':>9} {'exponent':>9}"
+    )
+    for result in results:
+        print(
+            f"{result['benchmark']:<27} {result['scale']:>6} {result['input_rows']:>10} "
+            f"{result['seconds']:>9.3f} {result['peak_mb']:>9.1f} "
+            f"{result['scaling_exponent']:>9.2f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
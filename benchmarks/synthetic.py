@@ -0,0 +1,224 @@
+"""
+Synthetic tables with the columns of the BigQuery tables behind the members
+pages, at a multiple of today's size.
+
+At scale 1 there are about as many members, constituencies, positions and
+member-months as in the real data (the 12th to 14th Parliaments). Larger
+scales add members and constituencies over the same sittings, so every
+per-member table grows linearly with the scale.
+
+Usage:
+    python -m benchmarks.synthetic SCALE DIRECTORY   # write Parquet snapshots
+"""
+import os
+import sys
+from datetime import date
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from snapshots import COMPRESSION, snapshot_path, write_manifest
+
+MEMBERS = 200
+CONSTITUENCIES = 30
+APPOINTMENT_SHARE = 0.3
+QUESTIONS_PER_SITTING_SPOKEN = 0.7
+
+FIRST_MONTH = date(2012, 9, 1)
+MONTHS = 144
+
+PARTIES = ["PAP", "WP", "PSP", "NMP", "SPP"]
+PARTY_WEIGHTS = [0.8, 0.1, 0.03, 0.06, 0.01]
+APPOINTMENTS = [
+    "Minister for Health",
+    "Minister for Education",
+    "Minister of State for Finance",
+    "Senior Parliamentary Secretary for Transport",
+    "Mayor of Central Singapore District",
+]
+MINISTRIES = [
+    "Ministry of Health",
+    "Ministry of Education",
+    "Ministry of Finance",
+    "Ministry of Transport",
+    "Ministry of National Development",
+    "Ministry of Manpower",
+    "Ministry of Home Affairs",
+    "Ministry of Defence",
+]
+
+# (parliament, first month index) of the parliaments covered by MONTHS
+PARLIAMENT_STARTS = [(12, 0), (13, 40), (14, 95)]
+
+
+def _month_starts(month_index: np.ndarray) -> pd.DatetimeIndex:
+    return pd.DatetimeIndex(
+        pd.Timestamp(FIRST_MONTH) + pd.to_timedelta(month_index * 30.44, unit="D")
+    ).normalize()
+
+
+def synthetic_tables(scale: int = 1, seed: int = 0) -> Dict[str, pd.DataFrame]:
+    """
+    Generates the members tables.
+
+    Parameters:
+    - scale (int): Multiple of today's size.
+    - seed (int): Seed of the random generator; the same seed gives the same tables.
+
+    Returns:
+    - Dict[str, pd.DataFrame]: `prod_dim.dim_members`,
+      `prod_fact.fact_member_positions`, `prod_agg.agg_speech_metrics_by_member`
+      and `prod_agg.agg_pri_questions_topics_by_member`, by table name.
+    """
+    rng = np.random.default_rng(seed)
+    n_members = MEMBERS * scale
+    n_constituencies = CONSTITUENCIES * scale
+
+    member_names = np.array([f"Member {i}" for i in range(n_members)], dtype=object)
+    constituency_names = np.array(
+        [f"Constituency {i}" for i in range(n_constituencies)], dtype=object
+    )
+    parties = rng.choice(PARTIES, n_members, p=PARTY_WEIGHTS).astype(object)
+    constituencies = rng.choice(constituency_names, n_members)
+
+    # tenure in months; a quarter of the members sit until the latest sitting
+    first_month = rng.integers(0, MONTHS - 12, n_members)
+    last_month = np.minimum(
+        first_month + rng.integers(12, MONTHS, n_members), MONTHS - 1
+    )
+    last_month[rng.random(n_members) < 0.25] = MONTHS - 1
+    earliest_sitting = _month_starts(first_month)
+    latest_sitting = _month_starts(last_month)
+
+    dim_members = pd.DataFrame(
+        {
+            "member_name": member_names,
+            "member_birth_year": rng.integers(1950, 1990, n_members).astype("float64"),
+            "member_image_link": [
+                f"https://www.parliament.gov.sg/images/{name}.jpg"
+                for name in member_names
+            ],
+            "latest_member_constituency": constituencies,
+            "party": parties,
+            "earliest_sitting": earliest_sitting.date,
+            "latest_sitting": latest_sitting.date,
+        }
+    )
+
+    # one row per member and month of their tenure
+    tenure = last_month - first_month + 1
+    member_of_row = np.repeat(np.arange(n_members), tenure)
+    month_of_row = (
+        np.arange(tenure.sum())
+        - np.repeat(np.cumsum(tenure) - tenure, tenure)
+        + np.repeat(first_month, tenure)
+    )
+    rows = len(member_of_row)
+    month_starts = _month_starts(month_of_row)
+    parliament_starts = [start for _, start in PARLIAMENT_STARTS]
+    parliament = np.array([number for number, _ in PARLIAMENT_STARTS])[
+        np.searchsorted(parliament_starts, month_of_row, side="right") - 1
+    ]
+
+    sittings_total = rng.integers(2, 7, rows)
+    sittings_attended = rng.binomial(sittings_total, 0.92)
+    sittings_spoken = rng.binomial(sittings_attended, 0.6)
+    topics = rng.poisson(sittings_spoken * 1.5)
+    speeches = topics + rng.poisson(sittings_spoken * 0.5)
+    pri_questions = rng.poisson(sittings_spoken * QUESTIONS_PER_SITTING_SPOKEN)
+    words = rng.poisson(speeches * 450)
+    sentences = rng.poisson(words / 22)
+    syllables = rng.poisson(words * 1.55)
+
+    speech_metrics = pd.DataFrame(
+        {
+            "parliament": parliament,
+            "year": month_starts.year.to_numpy(),
+            "month": month_starts.month.to_numpy(),
+            "member_name": member_names[member_of_row],
+            "member_party": parties[member_of_row],
+            "member_constituency": constituencies[member_of_row],
+            "count_sittings_total": sittings_total,
+            "count_sittings_present": sittings_attended,
+            "count_sittings_spoken": sittings_spoken,
+            "count_topics": topics,
+            "count_pri_questions": pri_questions,
+            "count_speeches": speeches,
+            "count_words": words,
+            "count_sentences": sentences,
+            "count_syllables": syllables,
+        }
+    )
+
+    totals = speech_metrics.groupby("member_name", sort=False)[
+        ["count_sittings_present", "count_sittings_total"]
+    ].sum()
+    dim_members = dim_members.join(totals, on="member_name")
+
+    # a constituency for every member, and appointments for some of them
+    appointed = np.flatnonzero(rng.random(n_members) < APPOINTMENT_SHARE)
+    appointment_start = first_month[appointed] + rng.integers(
+        0, tenure[appointed], len(appointed)
+    )
+    member_positions = pd.DataFrame(
+        {
+            "member_name": np.concatenate([member_names, member_names[appointed]]),
+            "member_position": np.concatenate(
+                [constituencies, rng.choice(APPOINTMENTS, len(appointed))]
+            ),
+            "type": ["constituency"] * n_members + ["appointment"] * len(appointed),
+            "effective_from_date": np.concatenate(
+                [earliest_sitting.date, _month_starts(appointment_start).date]
+            ),
+            "effective_to_date": np.concatenate(
+                [latest_sitting.date, latest_sitting[appointed].date]
+            ),
+            "is_latest_position": True,
+        }
+    )
+
+    # one row per primary question
+    questions = speech_metrics["count_pri_questions"].to_numpy()
+    pri_questions_topics = pd.DataFrame(
+        {
+            "member_name": np.repeat(
+                speech_metrics["member_name"].to_numpy(), questions
+            ),
+            "ministry_addressed": rng.choice(MINISTRIES, questions.sum()),
+        }
+    )
+
+    return {
+        "prod_dim.dim_members": dim_members,
+        "prod_fact.fact_member_positions": member_positions,
+        "prod_agg.agg_speech_metrics_by_member": speech_metrics,
+        "prod_agg.agg_pri_questions_topics_by_member": pri_questions_topics,
+    }
+
+
+def write_synthetic_snapshots(directory: str, scale: int = 1, seed: int = 0):
+    """
+    Writes the synthetic tables as snapshots, so that the app and the
+    registered queries can run on them with `PARL_DATA_BACKEND=snapshot`.
+    """
+    manifest = {}
+    for table, frame in synthetic_tables(scale, seed).items():
+        os.makedirs(directory, exist_ok=True)
+        path = snapshot_path(table, directory)
+        frame.to_parquet(path, compression=COMPRESSION, index=False)
+        manifest[table] = {
+            "file": os.path.basename(path),
+            "rows": len(frame),
+            "bytes": os.path.getsize(path),
+            "compression": COMPRESSION,
+            "snapshot_at": f"synthetic, scale {scale}, seed {seed}",
+        }
+    write_manifest(manifest, directory)
+    return manifest
+
+
+if __name__ == "__main__":
+    scale, directory = int(sys.argv[1]), sys.argv[2]
+    for table, entry in write_synthetic_snapshots(directory, scale).items():
+        print(f"{table}: {entry['rows']} rows, {entry['bytes'] / 1e6:.1f} MB")
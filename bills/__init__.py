@@ -0,0 +1,118 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional, Tuple
+
+import pandas as pd
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from queries import BILLS_PAGE_SIZE, run_registered_query, table_row_count
+
+BILLS_TABLE = "prod_mart.mart_bills"
+
+PAGE_SIZE = BILLS_PAGE_SIZE
+
+# Pages fetched in the background after the one shown, as the next ones are
+# the likeliest to be viewed.
+PREFETCH_PAGES = 2
+
+EARLIEST_DATE = date(1, 1, 1)
+LATEST_DATE = date(9999, 12, 31)
+
+# sort -> registered query, and the cursor of its first page
+SORTS = {
+    "Newest first": ("bills_newest_first", LATEST_DATE),
+    "Oldest first": ("bills_oldest_first", EARLIEST_DATE),
+}
+
+_prefetcher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="parl-prefetch")
+
+
+@dataclass(frozen=True)
+class BillFilters:
+    """Filters applied by the warehouse: a title substring and a date range."""
+
+    title: str = ""
+    start_date: date = EARLIEST_DATE
+    end_date: date = LATEST_DATE
+
+
+@dataclass(frozen=True)
+class Cursor:
+    """
+    Position in a sorted list of bills: the sort key of the last bill of the
+    previous page. The next page holds the bills after it, whatever their
+    offset, so fetching any page reads `PAGE_SIZE` rows.
+    """
+
+    date_introduced: date
+    bill_number: str
+
+
+def first_cursor(sort: str) -> Cursor:
+    """Returns the cursor of the first page in a sort order."""
+    return Cursor(SORTS[sort][1], "")
+
+
+def fetch_page(
+    sort: str, filters: BillFilters, cursor: Cursor
+) -> Tuple[pd.DataFrame, Optional[Cursor]]:
+    """
+    Fetches the page of bills after `cursor`, filtered and sorted by the
+    warehouse. Each page is cached, by sort, filters and cursor.
+
+    Parameters:
+    - sort (str): One of `SORTS`.
+    - filters (BillFilters): Filters to apply.
+    - cursor (Cursor): Cursor of the page, from `first_cursor` or a previous
+      page.
+
+    Returns:
+    - Tuple[pd.DataFrame, Optional[Cursor]]: The bills, and the cursor of the
+      next page (None on the last page).
+    """
+    bills = run_registered_query(
+        SORTS[sort][0],
+        title=filters.title,
+        start_date=filters.start_date,
+        end_date=filters.end_date,
+        after_date=cursor.date_introduced,
+        after_bill_number=cursor.bill_number,
+    )
+    # one row more than a page is fetched, to tell whether there is a next page
+    page = bills.iloc[:PAGE_SIZE]
+    if len(bills) <= PAGE_SIZE:
+        return page, None
+    last = page.iloc[-1]
+    return page, Cursor(last["date_introduced"], last["bill_number"])
+
+
+def prefetch(
+    sort: str,
+    filters: BillFilters,
+    cursor: Optional[Cursor],
+    pages: int = PREFETCH_PAGES,
+):
+    """
+    Fetches the `pages` pages from `cursor` onwards in the background, so
+    that they are cached by the time they are viewed.
+    """
+    if cursor is None:
+        return
+    # recorded as calls from the page that asked for them
+    ctx = get_script_run_ctx(suppress_warning=True)
+
+    def fetch_pages(cursor: Optional[Cursor]):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        for _ in range(pages):
+            if cursor is None:
+                break
+            _, cursor = fetch_page(sort, filters, cursor)
+
+    _prefetcher.submit(fetch_pages, cursor)
+
+
+def bill_count() -> int:
+    """Returns the number of bills, from the table metadata."""
+    return table_row_count(BILLS_TABLE)
@@ -0,0 +1,192 @@
+import io
+import json
+import threading
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+from derived import derived_frame
+
+VEGA_LITE = "vega-lite"
+PLOTLY = "plotly"
+
+# name -> payload of the latest spec built for that chart
+_payloads: Dict[str, dict] = {}
+_payloads_lock = threading.Lock()
+
+# Altair's data transformers and themes are global: one chart is converted at
+# a time, so that concurrent sessions do not use each other's.
+_altair_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class ChartSpec:
+    """
+    A chart ready to send to the browser: a Vega-Lite spec with its data as
+    named datasets, or a Plotly figure.
+
+    Specs are shared by every session: do not modify them.
+    """
+
+    name: str
+    library: str
+    spec: Any
+    payload_bytes: int
+    build_ms: float
+
+
+def chart_data(
+    df: pd.DataFrame,
+    fields: List[str],
+    decimals: Optional[Union[int, Dict[str, int]]] = None,
+) -> pd.DataFrame:
+    """
+    Returns only the columns a chart encodes, so that no other column is sent
+    to the browser, with numbers rounded to what the chart shows.
+
+    Parameters:
+    - df (pd.DataFrame): Data of the chart.
+    - fields (List[str]): Columns used by the chart's encodings and tooltips.
+    - decimals (Optional[Union[int, Dict[str, int]]]): Decimal places of the
+      float columns, for all of them or by column.
+
+    Returns:
+    - pd.DataFrame: The projected (and rounded) data.
+    """
+    data = df[list(dict.fromkeys(fields))].reset_index(drop=True)
+    if decimals is not None:
+        if isinstance(decimals, int):
+            decimals = {
+                column: decimals
+                for column in data.columns
+                if pd.api.types.is_float_dtype(data[column])
+            }
+        data = data.round(decimals)
+    return data
+
+
+def _arrow_bytes(df: pd.DataFrame) -> int:
+    # size of the data as Streamlit sends it, an Arrow IPC stream
+    table = pa.Table.from_pandas(df)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.tell()
+
+
+def vega_lite_spec(chart) -> dict:
+    """
+    Returns the Vega-Lite spec of an Altair chart as `st.altair_chart` builds
+    it: without the default theme's sizes, and with each data frame as a named
+    dataset (under 'datasets') rather than inlined as JSON values. Pages draw
+    Altair charts through this (with `cached_chart`), not `st.altair_chart`,
+    which converts them with the same global state unguarded.
+    """
+    import altair as alt
+
+    datasets = {}
+
+    def to_named_dataset(data) -> dict:
+        name = f"data-{len(datasets)}"
+        datasets[name] = data
+        return {"name": name}
+
+    themes = getattr(alt, "theme", None)
+    if not hasattr(themes, "enable"):
+        themes = alt.themes
+    with _altair_lock:
+        alt.data_transformers.register("parl_named", to_named_dataset)
+        with themes.enable("none") if themes.active == "default" else nullcontext():
+            with alt.data_transformers.enable("parl_named"):
+                spec = chart.to_dict()
+    spec["datasets"] = datasets
+    return spec
+
+
+def _payload_bytes(library: str, spec: Any) -> int:
+    if library == PLOTLY:
+        import plotly.io
+
+        return len(plotly.io.to_json(spec, validate=False).encode())
+    frames = spec.get("datasets", {})
+    layout = {key: value for key, value in spec.items() if key != "datasets"}
+    return len(json.dumps(layout).encode()) + sum(
+        _arrow_bytes(frame) for frame in frames.values()
+    )
+
+
+def cached_chart(
+    name: str,
+    source: pd.DataFrame,
+    build: Callable[[], Any],
+    **params,
+) -> ChartSpec:
+    """
+    Returns a chart built once per version of its source data and view
+    parameters, e.g.
+    `cached_chart("leaderboard_scatter", cube.cells, build, parliament=...)`.
+    Reruns with the same data and parameters reuse the built spec rather than
+    building and serialising the chart again.
+
+    Parameters:
+    - name (str): Name of the chart.
+    - source (pd.DataFrame): Dataset the chart is built from; its version is
+      part of the key, see `derived.derived_frame`.
+    - build (Callable[[], Any]): Builds the chart, an Altair chart or a
+      Plotly figure, from data projected with `chart_data`.
+    - **params: View parameters the chart depends on, e.g. the parliament and
+      the selected members.
+
+    Returns:
+    - ChartSpec: The chart, with the size of its payload.
+    """
+
+    def build_spec() -> ChartSpec:
+        start = time.perf_counter()
+        chart = build()
+        if type(chart).__module__.startswith("plotly"):
+            library, spec = PLOTLY, chart
+        else:
+            library, spec = VEGA_LITE, vega_lite_spec(chart)
+        chart_spec = ChartSpec(
+            name,
+            library,
+            spec,
+            _payload_bytes(library, spec),
+            (time.perf_counter() - start) * 1000,
+        )
+        with _payloads_lock:
+            _payloads[name] = {
+                "chart": name,
+                "library": library,
+                "payload_bytes": chart_spec.payload_bytes,
+                "build_ms": chart_spec.build_ms,
+            }
+        return chart_spec
+
+    return derived_frame(f"chart:{name}", source, build_spec, **params)
+
+
+def show_chart(chart: ChartSpec, use_container_width: bool = True):
+    """Draws a chart from `cached_chart`."""
+    if chart.library == PLOTLY:
+        st.plotly_chart(chart.spec, use_container_width=use_container_width)
+    else:
+        st.vega_lite_chart(chart.spec, use_container_width=use_container_width)
+
+
+def chart_payloads() -> pd.DataFrame:
+    """
+    Returns the payload size (spec and Arrow-encoded data) and build time of
+    the latest spec of every chart built by `cached_chart`.
+    """
+    with _payloads_lock:
+        return pd.DataFrame(
+            list(_payloads.values()),
+            columns=["chart", "library", "payload_bytes", "build_ms"],
+        )
@@ -0,0 +1,109 @@
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from derived import dataset_version
+from metrics import COUNT_COLUMNS, add_ratio_metrics
+
+CUBE_DIMENSIONS = [
+    "member_name",
+    "member_party",
+    "member_constituency",
+    "parliament",
+    "year",
+    "month",
+]
+
+
+class MetricCube:
+    """
+    The additive count_* columns of the speech summary, summed once per
+    combination of `CUBE_DIMENSIONS`. Any rollup over a subset of the
+    dimensions, with any filter, is a sum over cells of the cube; ratio
+    metrics and readability are derived only after rolling up. The cube, its
+    cells and its rollups carry the version of the summary they come from.
+
+    Parameters:
+    - all_members_speech_summary (pd.DataFrame): Speech summary data for all
+      members, with the dimension and count_* columns.
+    """
+
+    def __init__(self, all_members_speech_summary: pd.DataFrame):
+        self.cells = (
+            all_members_speech_summary.groupby(
+                CUBE_DIMENSIONS, dropna=False, observed=True, sort=False
+            )[COUNT_COLUMNS]
+            .sum()
+            .reset_index()
+        )
+        self.version = dataset_version(all_members_speech_summary)
+        self.cells.attrs["version"] = self.version
+        self._positions: Dict[str, dict] = {}
+
+    def _positions_by(self, dimension: str) -> dict:
+        # built on first use of each dimension as a filter
+        if dimension not in self._positions:
+            self._positions[dimension] = self.cells.groupby(
+                dimension, observed=True
+            ).indices
+        return self._positions[dimension]
+
+    def slice(self, filters: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+        """
+        Returns the cells matching every filter, a value or a list of values per
+        dimension, e.g. `{"parliament": [13, 14], "member_name": "..."}`.
+        Filtered cells are looked up by position rather than by scanning.
+        """
+        if not filters:
+            return self.cells
+
+        positions = None
+        for dimension, values in filters.items():
+            if not isinstance(values, (list, tuple, set, np.ndarray, pd.Series)):
+                values = [values]
+            index = self._positions_by(dimension)
+            matches = [index[value] for value in values if value in index]
+            matched = np.concatenate(matches) if matches else np.empty(0, dtype="int64")
+            positions = (
+                matched if positions is None else np.intersect1d(positions, matched)
+            )
+        return self.cells.iloc[np.sort(positions)]
+
+    def rollup(
+        self,
+        group_by_fields: List[str],
+        filters: Optional[Dict[str, Any]] = None,
+        attended_within: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        """
+        Aggregates the cube by `group_by_fields` and derives the metrics. Same
+        output as `aggregate_member_metrics` on the matching raw rows.
+
+        Parameters:
+        - group_by_fields (List[str]): Dimensions to group by.
+        - filters (Optional[Dict[str, Any]]): Filters, as for `slice`.
+        - attended_within (Optional[List[str]]): Further dimensions within which
+          groups without attended sittings are dropped before rolling up, e.g.
+          ['parliament'] for a member's totals over the parliaments they
+          attended, as when `aggregate_member_metrics` is applied twice.
+
+        Returns:
+        - pd.DataFrame: One row per group with attended sittings.
+        """
+        cells = self.slice(filters)
+
+        if attended_within:
+            cells = cells.groupby(group_by_fields + attended_within, observed=True)[
+                COUNT_COLUMNS
+            ].sum()
+            cells = cells[cells["count_sittings_attended"] != 0].reset_index()
+
+        aggregated = (
+            cells.groupby(group_by_fields, observed=True)[COUNT_COLUMNS]
+            .sum()
+            .reset_index()
+        )
+        aggregated = add_ratio_metrics(aggregated)
+        aggregated.attrs["version"] = self.version
+        return aggregated[aggregated["count_sittings_attended"] != 0]
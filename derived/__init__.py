@@ -0,0 +1,121 @@
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+import pandas as pd
+
+# Upper bound on the number of derived frames kept, for all pages and sessions.
+MAX_DERIVED_FRAMES = 128
+
+VERSION_ATTR = "version"
+
+
+def dataset_version(df: pd.DataFrame) -> str:
+    """
+    Returns the version of a dataset, from `df.attrs["version"]`. Loaders set
+    it when they (re)load data, and pandas carries it over to frames derived
+    with copies, selections and filters. A frame without one is given a
+    new, unique version, so its derived frames are never shared with another
+    frame's.
+    """
+    if VERSION_ATTR not in df.attrs:
+        df.attrs[VERSION_ATTR] = uuid.uuid4().hex
+    return df.attrs[VERSION_ATTR]
+
+
+def _freeze(value: Any) -> Hashable:
+    # lists (e.g. of columns or parliaments) and dicts as hashable key parts
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set, frozenset)) or hasattr(value, "tolist"):
+        items = value.tolist() if hasattr(value, "tolist") else value
+        frozen = tuple(_freeze(item) for item in items)
+        return tuple(sorted(frozen)) if isinstance(value, (set, frozenset)) else frozen
+    return value
+
+
+class DerivedFrameCache:
+    """
+    A bounded cache of frames derived from datasets, evicting the least
+    recently used frame first. Keys are the name of the derivation, the
+    version of its source dataset and its view parameters, so a new version
+    of the data is a cache miss and its old frames age out.
+
+    Frames are shared by every session: treat them as read-only and copy them
+    before modifying them.
+
+    Parameters:
+    - max_entries (int): Number of frames kept.
+    """
+
+    def __init__(self, max_entries: int = MAX_DERIVED_FRAMES):
+        self.max_entries = max_entries
+        self._frames: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(
+        self,
+        name: str,
+        version: str,
+        params: Dict[str, Any],
+        compute: Callable[[], Any],
+    ) -> Any:
+        """
+        Returns the derived frame for `name`, `version` and `params`,
+        calling `compute` (outside of the lock) when it is not cached.
+        """
+        key = (name, version, _freeze(params))
+        with self._lock:
+            if key in self._frames:
+                self._frames.move_to_end(key)
+                self.hits += 1
+                return self._frames[key]
+            self.misses += 1
+
+        frame = compute()
+
+        with self._lock:
+            self._frames[key] = frame
+            self._frames.move_to_end(key)
+            while len(self._frames) > self.max_entries:
+                self._frames.popitem(last=False)
+        return frame
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+
+_cache = DerivedFrameCache()
+
+
+def derived_frame(
+    name: str,
+    source: pd.DataFrame,
+    compute: Callable[[], Any],
+    **params,
+) -> Any:
+    """
+    Returns a frame derived from `source`, computed once per version of the
+    source and view parameters, e.g.
+    `derived_frame("leaderboard", cube.cells, build, parliament="All")`.
+
+    Parameters:
+    - name (str): Name of the derivation.
+    - source (pd.DataFrame): Dataset the frame is derived from; its version
+      (`dataset_version`) is part of the key.
+    - compute (Callable[[], Any]): Builds the frame from the current data and
+      parameters.
+    - **params: View parameters the frame depends on, e.g. group-by fields,
+      parliament selection or columns.
+
+    Returns:
+    - Any: The derived frame, shared and read-only.
+    """
+    return _cache.get(name, dataset_version(source), params, compute)
@@ -0,0 +1,269 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Hashable, Iterable, List, Optional, Set
+
+logger = logging.getLogger("parl.freshness")
+
+# How often the refresher checks whether the data changed.
+CHECK_INTERVAL_SECONDS = int(os.environ.get("PARL_CHECK_INTERVAL", 300))
+
+# Upper bound on the number of results kept; the least recently used result
+# not marked for revalidation is dropped first.
+MAX_ENTRIES = 256
+
+# Most checks between retries of failed reloads: the wait doubles from one
+# check after each failed retry, up to this.
+MAX_RETRY_CHECKS = 12
+
+
+class StaleWhileRevalidateCache:
+    """
+    Results of loaders (e.g. query results), kept until the data they are
+    computed from changes rather than for a fixed time.
+
+    A result is loaded on first use and then always served from memory. A
+    background refresher checks `data_version` every `check_interval` seconds
+    and, when it changed, reloads the results marked for revalidation and
+    swaps each one in once it is loaded: readers keep getting the last good
+    result meanwhile and never wait on a refresh. If a reload (or an
+    `on_change` function) fails, the previous result is kept and only that
+    reload is retried, at the next check and then less and less often. The
+    other results (e.g. of queries with parameters, which few readers may ask
+    for again) are dropped instead, and loaded again on their next use.
+
+    Beyond `max_entries` results, the least recently used of those other
+    results is dropped: the results marked for revalidation (warmed at boot)
+    are never, so that readers do not wait for them to load again.
+
+    Parameters:
+    - data_version (Callable[[], Hashable]): Returns a token that changes when
+      the data does, e.g. the last modified time of the tables.
+    - check_interval (float): Seconds between checks.
+    - max_entries (int): Number of results kept, unless more are marked for
+      revalidation.
+    """
+
+    def __init__(
+        self,
+        data_version: Callable[[], Hashable],
+        check_interval: float = CHECK_INTERVAL_SECONDS,
+        max_entries: int = MAX_ENTRIES,
+    ):
+        self.data_version = data_version
+        self.check_interval = check_interval
+        self.max_entries = max_entries
+        self.version: Optional[Hashable] = None
+        # the latest version seen, which `version` becomes once the results
+        # are reloaded for it
+        self.latest_version: Optional[Hashable] = None
+        self.last_checked: Optional[str] = None
+        self.last_changed: Optional[str] = None
+
+        # key -> (result, loader, revalidate), least recently used first
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: dict = {}
+        self._listeners: List[Callable[[], None]] = []
+        # what failed at the last reload, retried after `_checks_to_retry`
+        # more checks
+        self._failed_keys: Set[Hashable] = set()
+        self._failed_listeners: List[Callable[[], None]] = []
+        self._retry_backoff = 0
+        self._checks_to_retry = 0
+        self._refresher: Optional[threading.Thread] = None
+
+    def get(
+        self, key: Hashable, load: Callable[[], Any], revalidate: bool = True
+    ) -> Any:
+        """
+        Returns the result for `key`, calling `load` to get it the first time
+        (once, however many threads ask at once). If `revalidate`, `load` is
+        kept to reload the result when the data changes; otherwise the result
+        is dropped then.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+            return entry[0]
+
+        self.start()
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        with load_lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = (load(), load, revalidate)
+                with self._lock:
+                    self._entries[key] = entry
+                    self._evict()
+        return entry[0]
+
+    def _evict(self):
+        # call with `_lock` held
+        while len(self._entries) > self.max_entries:
+            evicted = next(
+                (
+                    key
+                    for key, (_, _, revalidate) in self._entries.items()
+                    if not revalidate
+                ),
+                None,
+            )
+            if evicted is None:
+                return
+            del self._entries[evicted]
+            self._load_locks.pop(evicted, None)
+
+    def current_version(self) -> Hashable:
+        """
+        Returns the latest data version seen by the refresher (checking it if
+        it has not run yet): the version results loaded now are for.
+        """
+        if self.latest_version is None:
+            self.latest_version = self.data_version()
+        return self.latest_version
+
+    def on_change(self, callback: Callable[[], None]):
+        """
+        Registers a function called by the refresher after the results were
+        reloaded for new data, e.g. to rebuild what is derived from them.
+        """
+        self._listeners.append(callback)
+
+    def _reload(self, keys: Iterable[Hashable]) -> Set[Hashable]:
+        # reloads the results of `keys` marked for revalidation, returning
+        # those that failed
+        failed = set()
+        for key in keys:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is None or not entry[2]:
+                continue
+            _, load, revalidate = entry
+            try:
+                result = load()
+            except Exception:
+                logger.exception(
+                    "Reloading %r failed, keeping the previous result", key
+                )
+                failed.add(key)
+                continue
+            with self._lock:
+                if key in self._entries:
+                    self._entries[key] = (result, load, revalidate)
+        return failed
+
+    def _notify(self, listeners: List[Callable[[], None]]) -> List[Callable[[], None]]:
+        # calls `listeners`, returning those that failed
+        failed = []
+        for callback in listeners:
+            try:
+                callback()
+            except Exception:
+                logger.exception("Data change callback %r failed", callback)
+                failed.append(callback)
+        return failed
+
+    def _record_failures(
+        self, keys: Set[Hashable], listeners: List[Callable[[], None]]
+    ) -> bool:
+        self._failed_keys = keys
+        self._failed_listeners = listeners
+        if not (keys or listeners):
+            self._retry_backoff = 0
+            return True
+        self._retry_backoff = min(max(2 * self._retry_backoff, 1), MAX_RETRY_CHECKS)
+        self._checks_to_retry = self._retry_backoff
+        return False
+
+    def revalidate(self) -> bool:
+        """
+        Reloads the results marked for revalidation, least recently used first,
+        drops the others, then calls the `on_change` functions. Returns
+        whether everything was reloaded; what failed is retried by `retry`.
+        """
+        with self._lock:
+            entries = list(self._entries.items())
+
+        failed_keys = self._reload(
+            key for key, (_, _, revalidate) in entries if revalidate
+        )
+
+        # dropped once the others are reloaded, so that readers see the old
+        # data or the new, not a mix, for as long as possible
+        with self._lock:
+            for key, (_, _, revalidate) in entries:
+                if not revalidate:
+                    self._entries.pop(key, None)
+                    self._load_locks.pop(key, None)
+
+        failed_listeners = self._notify(self._listeners)
+        return self._record_failures(failed_keys, failed_listeners)
+
+    def retry(self) -> bool:
+        """
+        Reloads the results, and calls the `on_change` functions, that failed
+        at the last reload. Returns whether they all succeeded.
+        """
+        failed_keys = self._reload(self._failed_keys)
+        if len(failed_keys) < len(self._failed_keys):
+            # what is derived from the reloaded results is rebuilt with them
+            listeners = self._listeners
+        else:
+            listeners = self._failed_listeners
+        failed_listeners = self._notify(listeners)
+        return self._record_failures(failed_keys, failed_listeners)
+
+    def check(self) -> bool:
+        """
+        Reloads the results if `data_version` changed since the last check,
+        and otherwise retries what failed at the last reload when it is due.
+        Returns whether the data changed.
+        """
+        version = self.data_version()
+        self.latest_version = version
+        self.last_checked = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        if self.version is None:
+            self.version = version
+            return False
+        if version != self.version:
+            logger.info("Data changed (%r -> %r), reloading", self.version, version)
+            # the version moves on even if some reloads fail: only those are
+            # retried, rather than everything at every check
+            self.revalidate()
+            self.version = version
+            self.last_changed = self.last_checked
+            return True
+
+        if self._failed_keys or self._failed_listeners:
+            self._checks_to_retry -= 1
+            if self._checks_to_retry <= 0:
+                self.retry()
+        return False
+
+    def start(self):
+        """Starts the background refresher, if it is not running yet."""
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(
+                target=self._run, name="parl-refresher", daemon=True
+            )
+        self._refresher.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Checking for new data failed")
+            time.sleep(self.check_interval)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,216 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger("parl.guard")
+
+# Checks BigQuery queries against the budgets below before running them
+# (PARL_QUERY_GUARD=1). Off by default.
+QUERY_GUARD = os.environ.get("PARL_QUERY_GUARD") == "1"
+
+# Most bytes one query may scan, and all queries of this process in an hour,
+# as estimated by a dry run (what on-demand pricing bills).
+MAX_QUERY_BYTES = int(os.environ.get("PARL_MAX_QUERY_BYTES", 2 * 1024**3))
+MAX_HOURLY_BYTES = int(os.environ.get("PARL_MAX_HOURLY_BYTES", 20 * 1024**3))
+BUDGET_WINDOW_SECONDS = 3600
+
+# Most rows a query may return, on any backend.
+MAX_RESULT_ROWS = int(os.environ.get("PARL_MAX_RESULT_ROWS", 500_000))
+
+# Upper bound on the number of estimates kept (query shapes and parameter
+# values).
+MAX_ESTIMATES = 1024
+
+
+class QueryBudgetError(RuntimeError):
+    """A query was refused by the cost guard."""
+
+
+class QueryTooLarge(QueryBudgetError):
+    """A query would scan more than the per-query budget."""
+
+
+class HourlyBudgetExceeded(QueryBudgetError):
+    """A query would take the bytes scanned in the last hour over budget."""
+
+
+class ResultTooLarge(QueryBudgetError):
+    """A query returned more rows than the result limit."""
+
+
+def normalise_query(query: str) -> str:
+    """Collapses whitespace, so that formatting does not make a new query shape."""
+    return " ".join(query.split())
+
+
+def _size(num_bytes: int) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if num_bytes < 1024 or unit == "GiB":
+            break
+        num_bytes /= 1024
+    return f"{num_bytes:,.1f} {unit}"
+
+
+class CostGuard:
+    """
+    Budgets of the bytes scanned and rows returned by queries.
+
+    A query's bytes are estimated by a dry run (free, and with no slots used)
+    the first time its shape, i.e. its normalised text, is seen with its
+    parameter values: repeat calls add no latency, and a call with other
+    values (e.g. a wider date range over a partitioned table) is estimated
+    again. The estimate is charged to a sliding hourly window when the query
+    is admitted.
+
+    Parameters:
+    - max_query_bytes (int): Most bytes one query may scan.
+    - max_hourly_bytes (int): Most bytes all admitted queries may scan in
+      `window_seconds`.
+    - max_result_rows (int): Most rows a query may return.
+    - window_seconds (float): Length of the budget window.
+    """
+
+    def __init__(
+        self,
+        max_query_bytes: int = MAX_QUERY_BYTES,
+        max_hourly_bytes: int = MAX_HOURLY_BYTES,
+        max_result_rows: int = MAX_RESULT_ROWS,
+        window_seconds: float = BUDGET_WINDOW_SECONDS,
+    ):
+        self.max_query_bytes = max_query_bytes
+        self.max_hourly_bytes = max_hourly_bytes
+        self.max_result_rows = max_result_rows
+        self.window_seconds = window_seconds
+
+        # (normalised query, parameter values) -> estimated bytes, in order
+        # of first estimate
+        self._estimates: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        # (time admitted, estimated bytes) of the queries in the window
+        self._charges: Deque[Tuple[float, int]] = deque()
+        self._lock = threading.Lock()
+        self.refused = 0
+        self.fallbacks = 0
+
+    def estimate(
+        self,
+        query: str,
+        dry_run: Callable[[], int],
+        params: Optional[Dict[str, Any]] = None,
+    ) -> int:
+        """
+        Returns the bytes a query scans with parameter values `params`, from
+        `dry_run` the first time its shape is seen with them and from memory
+        afterwards.
+        """
+        shape = (normalise_query(query), repr(sorted((params or {}).items())))
+        with self._lock:
+            if shape in self._estimates:
+                return self._estimates[shape]
+        estimated_bytes = dry_run() or 0
+        with self._lock:
+            self._estimates[shape] = estimated_bytes
+            while len(self._estimates) > MAX_ESTIMATES:
+                self._estimates.popitem(last=False)
+        return estimated_bytes
+
+    def _expire(self, now: float):
+        while self._charges and self._charges[0][0] <= now - self.window_seconds:
+            self._charges.popleft()
+
+    def spent(self) -> int:
+        """Returns the bytes charged in the current window."""
+        with self._lock:
+            self._expire(time.monotonic())
+            return sum(charge for _, charge in self._charges)
+
+    def admit(self, query: str, estimated_bytes: int):
+        """
+        Charges a query's estimate to the window, or raises `QueryTooLarge` or
+        `HourlyBudgetExceeded` (charging nothing) if it is over budget.
+        """
+        if estimated_bytes > self.max_query_bytes:
+            with self._lock:
+                self.refused += 1
+            raise QueryTooLarge(
+                f"Query would scan {_size(estimated_bytes)}, over the per-query "
+                f"budget of {_size(self.max_query_bytes)} (PARL_MAX_QUERY_BYTES): "
+                f"{normalise_query(query)[:200]}"
+            )
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            spent = sum(charge for _, charge in self._charges)
+            if spent + estimated_bytes > self.max_hourly_bytes:
+                self.refused += 1
+                raise HourlyBudgetExceeded(
+                    f"Query would scan {_size(estimated_bytes)} with "
+                    f"{_size(spent)} scanned in the last hour, over the budget "
+                    f"of {_size(self.max_hourly_bytes)} (PARL_MAX_HOURLY_BYTES)"
+                )
+            self._charges.append((now, estimated_bytes))
+
+    def check_rows(self, query: str, rows: int):
+        """Raises `ResultTooLarge` if a query returned more rows than allowed."""
+        if rows > self.max_result_rows:
+            with self._lock:
+                self.refused += 1
+            raise ResultTooLarge(
+                f"Query returned {rows:,} rows, over the limit of "
+                f"{self.max_result_rows:,} (PARL_MAX_RESULT_ROWS): "
+                f"{normalise_query(query)[:200]}"
+            )
+
+    def count_fallback(self):
+        """Counts a refused query served from a fallback."""
+        with self._lock:
+            self.fallbacks += 1
+
+    def state(self) -> Dict[str, int]:
+        """Returns the budgets, bytes spent in the window and refusal counts."""
+        spent_bytes = self.spent()
+        with self._lock:
+            return {
+                "max_query_bytes": self.max_query_bytes,
+                "max_hourly_bytes": self.max_hourly_bytes,
+                "max_result_rows": self.max_result_rows,
+                "spent_bytes": spent_bytes,
+                "estimated_shapes": len(self._estimates),
+                "refused": self.refused,
+                "fallbacks": self.fallbacks,
+            }
+
+
+# Budgets of this server process.
+cost_guard = CostGuard()
+
+
+def with_fallback(
+    error: QueryBudgetError, fallback: Optional[Callable[[], object]]
+) -> object:
+    """
+    Returns the result of `fallback` (e.g. the query run on the local
+    snapshots) in place of a refused query, or re-raises `error` if there is
+    no fallback or it fails too.
+    """
+    if fallback is None:
+        raise error
+    try:
+        result = fallback()
+    except Exception as fallback_error:
+        raise error from fallback_error
+    cost_guard.count_fallback()
+    logger.warning("%s; served from the fallback instead", error)
+    return result
+
+
+def guard_state() -> pd.DataFrame:
+    """Returns the state of the cost guard, one row per setting, for the admin view."""
+    return pd.DataFrame(
+        {"enabled": QUERY_GUARD, **cost_guard.state()}.items(),
+        columns=["setting", "value"],
+    ).astype({"value": str})
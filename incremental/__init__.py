@@ -0,0 +1,303 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from queries import execute_registered_query
+from schema import compact_dtypes
+from snapshots import SNAPSHOT_DIR
+from utils import arrow_to_dataframe
+
+logger = logging.getLogger("parl.incremental")
+
+INCREMENTAL_DIR = os.environ.get(
+    "PARL_INCREMENTAL_DIR", os.path.join(os.path.dirname(SNAPSHOT_DIR), "incremental")
+)
+
+# Months at and before the high-water mark that are fetched again on every
+# refresh, as hansard for recent sittings can still be corrected.
+REVISION_MONTHS = 3
+
+# How often to look for new months by default, and how often to reload
+# everything anyway (to pick up revisions older than REVISION_MONTHS).
+CHECK_INTERVAL_SECONDS = 6000
+FULL_RELOAD_INTERVAL = timedelta(days=30)
+
+
+def to_period(year, month):
+    """Returns the period `year * 100 + month`, e.g. 202403, of scalars or Series."""
+    return year * 100 + month
+
+
+def shift_period(period: int, months: int) -> int:
+    """Returns the period `months` months after `period` (before, if negative)."""
+    month_index = (period // 100) * 12 + (period % 100 - 1) + months
+    return to_period(month_index // 12, month_index % 12 + 1)
+
+
+def _row_hashes(df: pd.DataFrame) -> np.ndarray:
+    # sorted hashes of the rows, to compare frames whatever their row order
+    # and compact dtypes (categoricals hash as their values)
+    integers = {
+        col: "int64" for col in df.columns if pd.api.types.is_integer_dtype(df[col])
+    }
+    return np.sort(
+        pd.util.hash_pandas_object(
+            df.astype(integers).reset_index(drop=True), index=False
+        ).to_numpy()
+    )
+
+
+class IncrementalTable:
+    """
+    Local copy of a table with `year` and `month` columns, kept on disk and in
+    memory, and refreshed by fetching only the months from
+    `REVISION_MONTHS` before its high-water mark (the latest month it holds).
+    Those months replace the local ones, so the cost of a refresh tracks the
+    amount of new and revised data rather than the size of the table.
+
+    Readers keep getting the current copy while it is updated: one update
+    runs at a time, under a file lock shared by the server processes using
+    `directory`, each of which starts from the copy the last one saved.
+
+    Parameters:
+    - name (str): Name of the local copy, used for its files.
+    - full_query (str): Registered query returning the whole table.
+    - since_query (str): Registered query returning the months from its
+      `@since_period` parameter onwards.
+    - directory (str): Directory to keep the local copy in.
+    - check_interval (Optional[float]): Seconds after which `get` looks for
+      new months. With None, `get` only does so after loading the local copy
+      from disk, and the owner calls `update` when the table changed.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        full_query: str,
+        since_query: str,
+        directory: str = INCREMENTAL_DIR,
+        check_interval: Optional[float] = CHECK_INTERVAL_SECONDS,
+    ):
+        self.name = name
+        self.full_query = full_query
+        self.since_query = since_query
+        self.data_path = os.path.join(directory, f"{name}.parquet")
+        self.state_path = os.path.join(directory, f"{name}.json")
+        self.check_interval = check_interval
+
+        self.frame: Optional[pd.DataFrame] = None
+        self.high_water_mark: Optional[int] = None
+        self.last_full_reload: Optional[datetime] = None
+        self.last_checked: Optional[float] = None
+        # modified time of the data file as this process last read or wrote
+        # it, to tell when another process saved a newer copy
+        self._data_mtime: Optional[float] = None
+        self.lock = threading.Lock()
+        self._update_lock = threading.Lock()
+        self._updating = False
+
+    def _version(self, updated_at: datetime) -> str:
+        # carried by the copies returned by `get`, see `derived.dataset_version`
+        return f"{self.name}@{updated_at.isoformat()}"
+
+    def _update(self, frame: pd.DataFrame, full_reload: bool):
+        previous = self.frame
+        # concatenated months can have different categories and integer types
+        frame = compact_dtypes(
+            frame.sort_values(["year", "month"], kind="stable").reset_index(drop=True)
+        )
+        now = datetime.now(timezone.utc)
+        if (
+            full_reload
+            and previous is not None
+            and list(previous.columns) == list(frame.columns)
+            and np.array_equal(_row_hashes(previous), _row_hashes(frame))
+        ):
+            # reloaded as it was: what is derived from it stays valid
+            frame.attrs["version"] = previous.attrs["version"]
+        else:
+            frame.attrs["version"] = self._version(now)
+        self._set_frame(frame)
+        if full_reload:
+            self.last_full_reload = now
+        self.last_checked = time.monotonic()
+        self._save()
+
+    def _set_frame(self, frame: pd.DataFrame):
+        self.high_water_mark = (
+            int(to_period(frame["year"], frame["month"]).max())
+            if not frame.empty
+            else None
+        )
+        # swapped in whole, with its version: readers copy one frame or the other
+        self.frame = frame
+
+    @contextmanager
+    def _locked(self):
+        # exclusive between processes, and between threads (each opens the
+        # lock file itself)
+        os.makedirs(os.path.dirname(self.data_path), exist_ok=True)
+        with open(f"{self.data_path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save(self):
+        # each file is written whole, under a name of this process and thread,
+        # and then renamed over the previous one
+        suffix = f"{os.getpid()}.{threading.get_ident()}.tmp"
+        tmp_path = f"{self.data_path}.{suffix}"
+        self.frame.to_parquet(tmp_path, compression="zstd", index=False)
+        os.replace(tmp_path, self.data_path)
+        self._data_mtime = os.path.getmtime(self.data_path)
+
+        tmp_path = f"{self.state_path}.{suffix}"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "high_water_mark": self.high_water_mark,
+                    "last_full_reload": self.last_full_reload.isoformat(),
+                    "rows": len(self.frame),
+                },
+                f,
+                indent=2,
+            )
+        os.replace(tmp_path, self.state_path)
+
+    def _load(self) -> bool:
+        try:
+            data_mtime = os.path.getmtime(self.data_path)
+            with open(self.state_path) as f:
+                state = json.load(f)
+            frame = compact_dtypes(pd.read_parquet(self.data_path))
+        except FileNotFoundError:
+            return False
+        except Exception:
+            logger.exception("Reading the local copy of %s failed", self.name)
+            return False
+        # the high-water mark is that of the data, should the state be of an
+        # earlier save
+        frame.attrs["version"] = self._version(
+            datetime.fromtimestamp(data_mtime, timezone.utc)
+        )
+        self.last_full_reload = datetime.fromisoformat(state["last_full_reload"])
+        self._data_mtime = data_mtime
+        self._set_frame(frame)
+        return True
+
+    def _saved_by_another(self) -> bool:
+        try:
+            return os.path.getmtime(self.data_path) != self._data_mtime
+        except FileNotFoundError:
+            return False
+
+    def full_reload(self):
+        """Replaces the local copy with the whole table."""
+        self._update(
+            arrow_to_dataframe(execute_registered_query(self.full_query)),
+            full_reload=True,
+        )
+
+    def refresh(self):
+        """
+        Fetches the months from `REVISION_MONTHS` before the high-water mark
+        onwards and merges them into the local copy, if they changed.
+        """
+        if self.high_water_mark is None:
+            self.full_reload()
+            return
+
+        since_period = shift_period(self.high_water_mark, -REVISION_MONTHS)
+        recent = arrow_to_dataframe(
+            execute_registered_query(self.since_query, since_period=since_period)
+        )
+        if list(recent.columns) != list(self.frame.columns):
+            # the table's schema changed
+            self.full_reload()
+            return
+
+        periods = to_period(self.frame["year"], self.frame["month"])
+        if np.array_equal(
+            _row_hashes(recent), _row_hashes(self.frame[periods >= since_period])
+        ):
+            # nothing new nor revised: the version stays, and with it what is
+            # derived from the table (see `derived.derived_frame`)
+            self.last_checked = time.monotonic()
+            return
+
+        kept = self.frame[periods < since_period]
+        self._update(pd.concat([kept, recent], ignore_index=True), full_reload=False)
+
+    def update(self):
+        """
+        Reloads the whole table if the last full reload is older than
+        `FULL_RELOAD_INTERVAL`, and refreshes the latest months otherwise.
+        Readers of `get` keep getting the current copy meanwhile. Starts from
+        the copy on disk if another process saved a newer one.
+        """
+        with self._update_lock, self._locked():
+            if self._saved_by_another():
+                self._load()
+            if (
+                self.last_full_reload is None
+                or datetime.now(timezone.utc) - self.last_full_reload
+                > FULL_RELOAD_INTERVAL
+            ):
+                self.full_reload()
+            else:
+                self.refresh()
+
+    def _due(self) -> bool:
+        return self.last_checked is None or (
+            self.check_interval is not None
+            and time.monotonic() - self.last_checked > self.check_interval
+        )
+
+    def _update_in_background(self):
+        with self.lock:
+            if self._updating:
+                return
+            self._updating = True
+        threading.Thread(
+            target=self._background_update,
+            name=f"parl-incremental-{self.name}",
+            daemon=True,
+        ).start()
+
+    def _background_update(self):
+        try:
+            self.update()
+        except Exception:
+            logger.exception("Updating %s failed, keeping the local copy", self.name)
+            # tried again after `check_interval`
+            self.last_checked = time.monotonic()
+        finally:
+            self._updating = False
+
+    def get(self) -> pd.DataFrame:
+        """
+        Returns a copy of the table, loading it from disk on first use (or
+        from the warehouse, if there is no local copy yet). The copy is
+        updated in the background then and at most every `check_interval`
+        seconds; if an update fails (e.g. the query times out), it is tried
+        again after `check_interval`.
+        """
+        if self.frame is None:
+            with self.lock:
+                if self.frame is None and not self._load():
+                    # nothing to serve until then
+                    self.update()
+        if self._due():
+            self._update_in_background()
+        return self.frame.copy()
@@ -0,0 +1,244 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Deque, Iterator, List, Optional
+
+import pandas as pd
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from streamlit.source_util import get_pages
+
+# Number of query calls kept in memory for the admin page and the metrics dump.
+MAX_EVENTS = 10_000
+
+# Every query call is also logged as one JSON object per line to this file, if set.
+QUERY_LOG = os.environ.get("PARL_QUERY_LOG")
+
+logger = logging.getLogger("parl.queries")
+if QUERY_LOG:
+    _handler = logging.FileHandler(QUERY_LOG)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+
+@dataclass
+class QueryEvent:
+    """
+    One call to a query function. `cache` is 'hit' or 'miss' for cached calls,
+    and 'uncached' for direct executions. `execution_ms` and the job statistics
+    are only set when the query ran (job statistics never are on snapshots).
+    """
+
+    timestamp: str
+    query: str
+    page: Optional[str]
+    cache: str
+    latency_ms: float
+    rows: Optional[int] = None
+    bytes_processed: Optional[int] = None
+    slot_millis: Optional[int] = None
+    execution_ms: Optional[float] = None
+
+
+_events: Deque[QueryEvent] = deque(maxlen=MAX_EVENTS)
+_events_lock = threading.Lock()
+_local = threading.local()
+
+
+def current_page() -> Optional[str]:
+    """
+    Returns the name of the page the current script run is for, e.g.
+    '0_Leaderboard', or None outside of a script run. Also works in the
+    worker threads of `utils.run_concurrently`, which share the caller's
+    script run context.
+    """
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None:
+        return None
+    page = get_pages(ctx.main_script_path).get(ctx.page_script_hash)
+    script_path = page["script_path"] if page else ctx.main_script_path
+    return os.path.splitext(os.path.basename(script_path))[0]
+
+
+@contextmanager
+def track_query(query: str, cached: bool = True) -> Iterator[QueryEvent]:
+    """
+    Records a call to a query function as a `QueryEvent`. The caller sets
+    `rows` on the yielded event; `record_execution`, called when the query
+    actually runs, marks the call as a cache miss and adds the job statistics.
+
+    Nested calls (e.g. a cached function running an uncached one) are recorded
+    once, as the outermost call.
+
+    Parameters:
+    - query (str): Name of the query, e.g. a registered query name.
+    - cached (bool): Whether the call can be served from a cache.
+    """
+    stack: List[QueryEvent] = _local.__dict__.setdefault("stack", [])
+    event = QueryEvent(
+        timestamp=datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        query=query,
+        page=current_page(),
+        cache="hit" if cached else "uncached",
+        latency_ms=0.0,
+    )
+    stack.append(event)
+    start = time.perf_counter()
+    try:
+        yield event
+    finally:
+        event.latency_ms = (time.perf_counter() - start) * 1000
+        stack.pop()
+        if stack:
+            if event.execution_ms is not None:
+                _add_execution(
+                    stack[-1],
+                    event.execution_ms,
+                    event.rows,
+                    event.bytes_processed,
+                    event.slot_millis,
+                )
+        else:
+            _emit(event)
+
+
+def _add_execution(
+    event: QueryEvent,
+    execution_ms: float,
+    rows: Optional[int],
+    bytes_processed: Optional[int],
+    slot_millis: Optional[int],
+):
+    if event.cache == "hit":
+        event.cache = "miss"
+    event.execution_ms = (event.execution_ms or 0) + execution_ms
+    if bytes_processed is not None:
+        event.bytes_processed = (event.bytes_processed or 0) + bytes_processed
+    if slot_millis is not None:
+        event.slot_millis = (event.slot_millis or 0) + slot_millis
+    if event.rows is None:
+        event.rows = rows
+
+
+def record_execution(
+    seconds: float,
+    rows: int,
+    bytes_processed: Optional[int],
+    slot_millis: Optional[int],
+):
+    """
+    Records that a query ran, on the innermost call being tracked in this
+    thread (if any). Called by `utils.execute_query`.
+    """
+    stack = getattr(_local, "stack", None)
+    if stack:
+        _add_execution(stack[-1], seconds * 1000, rows, bytes_processed, slot_millis)
+
+
+def _emit(event: QueryEvent):
+    with _events_lock:
+        _events.append(event)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(asdict(event)))
+
+
+def query_events() -> pd.DataFrame:
+    """Returns the latest `MAX_EVENTS` query calls, oldest first."""
+    with _events_lock:
+        events = [asdict(event) for event in _events]
+    return pd.DataFrame(events, columns=list(QueryEvent.__dataclass_fields__))
+
+
+def query_summary() -> pd.DataFrame:
+    """
+    Summarises the recorded calls by query and page: calls, cache hits and
+    misses, hit rate (of cached calls), median and 95th percentile latency, rows and bytes
+    processed. Slowest (by total latency) first.
+    """
+    events = query_events()
+    if events.empty:
+        return pd.DataFrame(
+            columns=[
+                "query",
+                "page",
+                "calls",
+                "hits",
+                "misses",
+                "hit_rate",
+                "p50_latency_ms",
+                "p95_latency_ms",
+                "total_latency_ms",
+                "rows",
+                "bytes_processed",
+            ]
+        )
+
+    events["page"] = events["page"].fillna("-")
+    events["hit"] = events["cache"] == "hit"
+    events["miss"] = events["cache"] == "miss"
+    summary = (
+        events.groupby(["query", "page"])
+        .agg(
+            calls=("cache", "size"),
+            hits=("hit", "sum"),
+            misses=("miss", "sum"),
+            p50_latency_ms=("latency_ms", "median"),
+            p95_latency_ms=("latency_ms", lambda latency: latency.quantile(0.95)),
+            total_latency_ms=("latency_ms", "sum"),
+            rows=("rows", "sum"),
+            bytes_processed=("bytes_processed", "sum"),
+        )
+        .reset_index()
+    )
+    summary.insert(
+        5, "hit_rate", summary["hits"] / (summary["hits"] + summary["misses"])
+    )
+    return summary.sort_values("total_latency_ms", ascending=False, ignore_index=True)
+
+
+def _label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def metrics_text() -> str:
+    """
+    Returns the recorded calls as a plain-text metrics dump, in the
+    Prometheus text format, with one series per query, page and cache outcome.
+    """
+    events = query_events()
+    events["page"] = events["page"].fillna("-")
+    totals = events.groupby(["query", "page", "cache"]).agg(
+        calls=("latency_ms", "size"),
+        latency_seconds=("latency_ms", lambda latency: latency.sum() / 1000),
+        rows=("rows", "sum"),
+        bytes_processed=("bytes_processed", "sum"),
+    )
+
+    metrics = [
+        ("calls", "counter", "Calls to query functions."),
+        ("latency_seconds", "counter", "Time spent in query functions."),
+        ("rows", "counter", "Rows returned by query functions."),
+        ("bytes_processed", "counter", "Bytes processed by query jobs."),
+    ]
+    lines = []
+    for metric, metric_type, description in metrics:
+        name = f"parl_query_{metric}_total"
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for (query, page, cache), value in totals[metric].items():
+            labels = ",".join(
+                f'{label}="{_label_value(label_value)}"'
+                for label, label_value in [
+                    ("query", query),
+                    ("page", page),
+                    ("cache", cache),
+                ]
+            )
+            lines.append(f"{name}{{{labels}}} {value:g}")
+    return "\n".join(lines) + "\n"
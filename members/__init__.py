@@ -1,6 +1,10 @@
-from typing import List, Tuple, Callable
+from typing import List, Optional, Tuple, Callable
+import numpy as np
 import pandas as pd
 
+from cube import MetricCube
+from metrics import COUNT_COLUMNS, add_ratio_metrics
+
 
 def parse_appointments(appointments: List[str]) -> str:
     """
@@ -47,12 +51,15 @@ def categorise_active_members_with_appointments(
     active_member_appointments = []
     active_members_without_appointments = []
 
+    # one pass over the appointments instead of one scan per member
+    appointments_by_member = current_member_appointments.groupby(
+        "member_name", sort=False, observed=True
+    )["member_position"].agg(list)
+
     for member in active_members:
-        appointments = current_member_appointments[
-            current_member_appointments["member_name"] == member
-        ]["member_position"]
+        appointments = appointments_by_member.get(member, [])
 
-        if appointments.empty:
+        if not appointments:
             active_members_without_appointments.append(member)
         else:
             active_members_with_appointments.append(member)
@@ -65,24 +72,128 @@ def categorise_active_members_with_appointments(
     )
 
 
+class MemberIndex:
+    """
+    Maps member names and constituencies to their row positions in the members
+    (`dim_members`), positions (`fact_member_positions`) and aggregated metrics
+    frames, so that per-member lookups take O(k) for k matching rows instead of
+    a scan of the whole frame.
+
+    The index holds the frames it was built from. Frames returned by its
+    lookups are views of shared data and should not be modified.
+
+    Parameters:
+    - members_df (pd.DataFrame): Members, with 'member_name' and 'constituency' columns.
+    - member_positions_df (pd.DataFrame): Positions, with a 'member_name' column.
+    - aggregated_by_member (pd.DataFrame): Metrics aggregated by 'member_name'.
+    """
+
+    def __init__(
+        self,
+        members_df: pd.DataFrame,
+        member_positions_df: pd.DataFrame,
+        aggregated_by_member: pd.DataFrame,
+    ):
+        self.members_df = members_df.reset_index(drop=True)
+        self.member_positions_df = member_positions_df.reset_index(drop=True)
+        self.aggregated_by_member = aggregated_by_member.reset_index(drop=True)
+
+        self._members = self._positions_by(self.members_df, "member_name")
+        self._constituencies = self._positions_by(self.members_df, "constituency")
+        self._member_positions = self._positions_by(
+            self.member_positions_df, "member_name"
+        )
+        self._metrics = self._positions_by(self.aggregated_by_member, "member_name")
+
+    @staticmethod
+    def _positions_by(df: pd.DataFrame, column: str) -> dict:
+        return df.groupby(column, sort=False, observed=True).indices
+
+    @staticmethod
+    def _rows(df: pd.DataFrame, index: dict, key: str) -> pd.DataFrame:
+        return df.iloc[index.get(key, np.empty(0, dtype="int64"))]
+
+    def member(self, member_name: str) -> pd.DataFrame:
+        """Returns the member's rows in the members frame."""
+        return self._rows(self.members_df, self._members, member_name)
+
+    def constituency(self, constituency: str) -> pd.DataFrame:
+        """Returns the rows of members whose latest constituency is `constituency`."""
+        return self._rows(self.members_df, self._constituencies, constituency)
+
+    def positions(self, member_name: str) -> pd.DataFrame:
+        """Returns the member's rows in the positions frame."""
+        return self._rows(self.member_positions_df, self._member_positions, member_name)
+
+    def metrics(self, member_name: str) -> pd.DataFrame:
+        """Returns the member's rows in the aggregated metrics frame."""
+        return self._rows(self.aggregated_by_member, self._metrics, member_name)
+
+    def has_metrics(self, member_name: str) -> bool:
+        return member_name in self._metrics
+
+
 def aggregate_member_metrics(
     all_members_speech_summary: pd.DataFrame,
-    calculate_readability: Callable,
-    group_by_fields: List[str]
+    calculate_readability: Optional[Callable],
+    group_by_fields: List[str],
 ) -> pd.DataFrame:
     """
     Aggregates speech summary data by specified group-by fields and calculates additional metrics.
 
     Parameters:
     - all_members_speech_summary (pd.DataFrame): DataFrame containing the speech summary data for all members.
-    - calculate_readability (Callable): Function to calculate readability for each group of data.
+    - calculate_readability (Optional[Callable]): Row-wise function to calculate readability for
+      each group of data, or None for the vectorised `metrics.readability`.
     - group_by_fields (List[str]): List of fields to group by.
 
     Returns:
     - pd.DataFrame: DataFrame with aggregated data and calculated metrics for each group.
     """
+    column_names = COUNT_COLUMNS
+
+    # Aggregate by specified fields
+    agg_by_fields_dict = {col: "sum" for col in column_names}
+    aggregated = (
+        all_members_speech_summary.groupby(group_by_fields, observed=True)
+        .agg(agg_by_fields_dict)
+        .reset_index()
+    )
+
+    # Calculate additional metrics
+    aggregated = add_ratio_metrics(aggregated)
+
+    if calculate_readability is not None:
+        aggregated["readability"] = aggregated.apply(calculate_readability, axis=1)
+
+    # Filter out rows where count_sittings_attended is zero
+    aggregated = aggregated[aggregated["count_sittings_attended"] != 0]
+
+    return aggregated
+
+
+def average_non_zero(x):
+    non_zero_values = x[x != 0]
+    return np.mean(non_zero_values) if len(non_zero_values) > 0 else 0
+
+
+def aggregate_by_year(
+    all_members_speech_summary: pd.DataFrame, metric_cube: MetricCube
+) -> pd.DataFrame:
+    """
+    Aggregates the speech summary of all members by year, for comparing a
+    member with everyone else.
+
+    Parameters:
+    - all_members_speech_summary (pd.DataFrame): Speech summary data for all members.
+    - metric_cube (MetricCube): Cube of the same data.
+
+    Returns:
+    - pd.DataFrame: One row per year (as a string), with the average of each
+      count_* column over the non-zero member-months (`avg_<column>`) and the
+      readability of all speeches in the year (`overall_readability`).
+    """
     column_names = [
-        "count_sittings_total",
         "count_sittings_attended",
         "count_sittings_spoken",
         "count_topics",
@@ -93,47 +204,27 @@ def aggregate_member_metrics(
         "count_syllables",
     ]
 
-    # Aggregate by specified fields
-    agg_by_fields_dict = {col: "sum" for col in column_names}
-    aggregated = (
-        all_members_speech_summary.groupby(group_by_fields)
-        .agg(agg_by_fields_dict)
-        .reset_index()
-    )
-
-    # Calculate additional metrics
-    aggregated["attendance"] = (
-        aggregated["count_sittings_attended"]
-        / aggregated["count_sittings_total"]
-        * 100
-    )
-
-    aggregated["participation_rate"] = (
-        aggregated["count_sittings_spoken"]
-        / aggregated["count_sittings_attended"]
-        * 100
+    # agg by year (average metrics)
+    agg_by_year_dict = {col: average_non_zero for col in column_names}
+    aggregated_by_year = (
+        all_members_speech_summary.groupby("year").agg(agg_by_year_dict).reset_index()
     )
-    aggregated["topics_per_sitting"] = (
-        aggregated["count_topics"]
-        / aggregated["count_sittings_spoken"]
+    aggregated_by_year.columns = ["year"] + [f"avg_{col}" for col in column_names]
+    aggregated_by_year["year"] = (
+        aggregated_by_year["year"].astype(str).str.replace("[,.]", "", regex=True)
     )
-    aggregated["questions_per_sitting"] = (
-        aggregated["count_pri_questions"]
-        / aggregated["count_sittings_spoken"]
+    # agg by year (overall readability)
+    aggregated_by_year_readability = metric_cube.rollup(["year"])
+    aggregated_by_year_readability = aggregated_by_year_readability.rename(
+        columns={"readability": "overall_readability"}
     )
-    aggregated["words_per_sitting"] = (
-        aggregated["count_words"]
-        / aggregated["count_sittings_spoken"]
+    aggregated_by_year_readability["year"] = (
+        aggregated_by_year_readability["year"]
+        .astype(str)
+        .str.replace("[,.]", "", regex=True)
     )
-
-    # Apply readability calculation
-    aggregated["readability"] = aggregated.apply(
-        calculate_readability, axis=1
+    return aggregated_by_year.merge(
+        aggregated_by_year_readability[["year", "overall_readability"]],
+        how="left",
+        on="year",
     )
-
-    # Filter out rows where count_sittings_attended is zero
-    aggregated = aggregated[
-        aggregated["count_sittings_attended"] != 0
-    ]
-
-    return aggregated
@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+
+# Additive columns of agg_speech_metrics_by_member, summed when aggregating.
+COUNT_COLUMNS = [
+    "count_sittings_total",
+    "count_sittings_attended",
+    "count_sittings_spoken",
+    "count_topics",
+    "count_speeches",
+    "count_words",
+    "count_pri_questions",
+    "count_sentences",
+    "count_syllables",
+]
+
+# Ratio metrics computed from the summed count_* columns:
+# metric -> (numerator, denominator, scale)
+RATIO_METRICS = {
+    "attendance": ("count_sittings_attended", "count_sittings_total", 100),
+    "participation_rate": ("count_sittings_spoken", "count_sittings_attended", 100),
+    "topics_per_sitting": ("count_topics", "count_sittings_spoken", 1),
+    "questions_per_sitting": ("count_pri_questions", "count_sittings_spoken", 1),
+    "words_per_sitting": ("count_words", "count_sittings_spoken", 1),
+}
+
+
+def safe_divide(numerator, denominator) -> np.ndarray:
+    """
+    Divides two arrays element-wise, returning NaN where the denominator is zero
+    (rather than inf, or a warning).
+    """
+    numerator = np.asarray(numerator, dtype="float64")
+    denominator = np.asarray(denominator, dtype="float64")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = numerator / denominator
+    result[denominator == 0] = np.nan
+    return result
+
+
+def readability(words, sentences, syllables) -> np.ndarray:
+    """
+    Calculates the Flesch reading ease score for arrays of word, sentence and
+    syllable counts. Same result as `utils.calculate_readability` applied row
+    by row: NaN where there are no words or no sentences.
+
+    Parameters:
+    - words, sentences, syllables (array-like): Counts, one entry per row.
+
+    Returns:
+    - np.ndarray: Readability per row.
+    """
+    words = np.asarray(words, dtype="float64")
+    sentences = np.asarray(sentences, dtype="float64")
+    syllables = np.asarray(syllables, dtype="float64")
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = 206.835 - (1.015 * words / sentences) - (84.6 * syllables / words)
+    result[(sentences == 0) | (words == 0)] = np.nan
+    return result
+
+
+def add_ratio_metrics(aggregated: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds the ratio metrics in `RATIO_METRICS` and readability to a DataFrame of
+    summed count_* columns, as column operations.
+
+    Parameters:
+    - aggregated (pd.DataFrame): DataFrame with the count_* columns.
+
+    Returns:
+    - pd.DataFrame: The same DataFrame, with the metric columns added.
+    """
+    for metric, (numerator, denominator, scale) in RATIO_METRICS.items():
+        aggregated[metric] = (
+            safe_divide(aggregated[numerator], aggregated[denominator]) * scale
+        )
+
+    aggregated["readability"] = readability(
+        aggregated["count_words"],
+        aggregated["count_sentences"],
+        aggregated["count_syllables"],
+    )
+    return aggregated
+
+
+def format_percentage(values: pd.Series) -> pd.Series:
+    """
+    Formats values as strings with 1 decimal place and a '%' suffix, e.g.
+    `12.345 -> "12.3%"`. Missing values are kept as they are.
+    """
+    missing = values.isna().to_numpy()
+    numbers = values.to_numpy(dtype="float64", na_value=np.nan)
+
+    rounded = np.round(numbers, 1)
+    formatted = rounded.astype(str).astype(object) + "%"
+
+    # np.round scales by 10 before rounding, which can round differently from
+    # string formatting for values within float error of a tie. Those (and
+    # values too large for a plain repr) are formatted exactly, one by one.
+    scaled = numbers * 10
+    inexact = ~missing & (
+        (np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6) | ~(np.abs(numbers) < 1e15)
+    )
+    formatted[inexact] = [f"{value:.1f}%" for value in numbers[inexact]]
+
+    formatted[missing] = values.to_numpy(dtype=object)[missing]
+    return pd.Series(formatted, index=values.index, name=values.name)
+
+
+def format_count(values: pd.Series) -> pd.Series:
+    """
+    Rounds values to whole numbers (half to even, as `round`). The result is
+    int64, or float64 if there are missing values.
+    """
+    rounded = np.round(values.to_numpy(dtype="float64", na_value=np.nan))
+    if not np.isnan(rounded).any():
+        rounded = rounded.astype("int64")
+    return pd.Series(rounded, index=values.index, name=values.name)
+
+
+def format_metric_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Formats display columns in place: columns with '%' in their names with
+    `format_percentage`, columns with '#' in their names with `format_count`.
+    """
+    for col in df.columns:
+        if "%" in col:
+            df[col] = format_percentage(df[col])
+        elif "#" in col:
+            df[col] = format_count(df[col])
+    return df
@@ -1,43 +1,57 @@
 import streamlit as st
-import altair as alt
 
-from agg_data import get_member_list, get_all_member_speeches
-from members import aggregate_member_metrics
+from agg_data import get_member_list, get_metric_cube, get_metric_ranks
+from charts import cached_chart, chart_data, show_chart
+from derived import derived_frame
+from profiling import start_page_profile
+from tables import show_table
 from utils import (
-    calculate_readability,
-    process_metric_columns,
     EARLIEST_SITTING,
+    PARLIAMENTS,
     PARTY_COLOURS,
     PARTY_SHAPES,
 )
 
 # BACKEND
 
+profile = start_page_profile("0_Leaderboard")
+
+profile.phase("data load")
 members_df = get_member_list()
 member_names = sorted(members_df["member_name"].unique())
 
-all_members_speech_summary = get_all_member_speeches()
-
-aggregated_by_member_parliament = aggregate_member_metrics(
-    all_members_speech_summary,
-    calculate_readability,
-    group_by_fields=[
-        "member_name",
-        "member_party",
-        "member_constituency",
-        "parliament",
-    ],
+metric_cube = get_metric_cube()
+
+profile.phase("aggregation")
+# derived once per version of the data, not on every rerun
+member_parliament_fields = [
+    "member_name",
+    "member_party",
+    "member_constituency",
+    "parliament",
+]
+aggregated_by_member_parliament = derived_frame(
+    "rollup",
+    metric_cube.cells,
+    lambda: metric_cube.rollup(group_by_fields=member_parliament_fields),
+    group_by_fields=member_parliament_fields,
 )
 
-constituency_names = sorted(
-    all_members_speech_summary[
-        all_members_speech_summary["member_constituency"].notna()
-    ]["member_constituency"].unique()
+constituency_names = derived_frame(
+    "constituency_names",
+    metric_cube.cells,
+    lambda: sorted(
+        metric_cube.cells[metric_cube.cells["member_constituency"].notna()][
+            "member_constituency"
+        ].unique()
+    ),
 )
 
 # SELECTIONS
 
-parliaments = {"13th Parliament": [13], "14th Parliament": [14], "All": [12, 13, 14]}
+profile.phase("render")
+
+parliaments = PARLIAMENTS
 
 select_parliament = st.sidebar.radio(
     label="Which parliament?", options=parliaments.keys(), index=1
@@ -115,6 +129,22 @@ def display_header(select_by):
             st.subheader(select_constituency)
 
 
+def participation_table(select_parliament, participation_cols):
+    # aggregated and ranked once per data refresh for every parliament
+    leaderboard_ranks = get_metric_ranks(
+        ("member_name", "member_party", "member_constituency")
+    )[select_parliament]
+    processed = leaderboard_ranks.frame[participation_cols.keys()].copy()
+    processed["# Rank"] = leaderboard_ranks.all_ranks("participation_rate")
+    processed.rename(columns=participation_cols, inplace=True)
+    return processed
+
+
+def participation_display(processed):
+    # numbers are kept as numbers and formatted by the table, see `tables`
+    return processed.sort_values("# Rank")
+
+
 with participation:
     # PROCESSING
     participation_cols = {
@@ -127,30 +157,25 @@ with participation:
         "member_party": "Party",
         "member_constituency": "Constituency",
     }
-    processed = aggregate_member_metrics(
-        aggregated_by_member_parliament[
-            aggregated_by_member_parliament["parliament"].isin(
-                parliaments[select_parliament]
-            )
-        ],
-        calculate_readability,
-        group_by_fields=["member_name", "member_party", "member_constituency"],
-    )
-    processed = processed[participation_cols.keys()]
-    processed["# Rank"] = processed["participation_rate"].rank(
-        ascending=False, method="min"
+    profile.phase("aggregation")
+    processed = derived_frame(
+        "leaderboard_participation",
+        metric_cube.cells,
+        lambda: participation_table(select_parliament, participation_cols),
+        parliament=select_parliament,
+        columns=participation_cols,
     )
-    processed.rename(columns=participation_cols, inplace=True)
-    to_display = processed.copy()
-    to_display = process_metric_columns(to_display)
-    to_display.sort_values("# Rank", inplace=True)
-    to_display = to_display.style.apply(
-        lambda row: [
-            "background-color: yellow" if row["Member Name"] in selected_members else ""
-            for _ in row
-        ],
-        axis=1,
+    profile.phase("dataframe styling")
+    to_display = derived_frame(
+        "leaderboard_participation_display",
+        metric_cube.cells,
+        lambda: participation_display(processed),
+        parliament=select_parliament,
+        columns=participation_cols,
     )
+    selected_rows = to_display["Member Name"].isin(selected_members).to_numpy()
+
+    profile.phase("render")
 
     # FRONTEND
     st.header(tabs[0])
@@ -169,56 +194,87 @@ with participation:
             f"The information below reflects information from sittings on {EARLIEST_SITTING} and after."
         )
 
-    chart = (
-        alt.Chart(processed)
-        .mark_point()
-        .encode(
-            alt.X("Attendance (%)").scale(zero=False).axis(alt.Axis(grid=False)),
-            alt.Y("Participation (%)").scale(zero=False).axis(alt.Axis(grid=False)),
-            color=alt.Color("Party").scale(
-                alt.Scale(
-                    domain=list(PARTY_COLOURS.keys()),
-                    range=list(PARTY_COLOURS.values()),
-                )
-            ),
-            shape=alt.Shape("Party").scale(
-                alt.Scale(
-                    domain=list(PARTY_SHAPES.keys()), range=list(PARTY_SHAPES.values())
-                )
-            ),
-            tooltip=[
-                alt.Tooltip("Member Name"),
-                alt.Tooltip("Party"),
-                alt.Tooltip("Constituency"),
-                alt.Tooltip("Attendance (%)", format=".1f"),
-                alt.Tooltip("Participation (%)", format=".1f"),
-            ],
-        )
-        .encode(
-            size=alt.condition(
-                alt.FieldOneOfPredicate("Member Name", selected_members),
-                alt.value(200),  # Increase the size of emphasized points
-                alt.value(30),  # Default size for other points
-            ),
-            opacity=alt.condition(
-                alt.FieldOneOfPredicate("Member Name", selected_members),
-                alt.value(1),  # Full opacity for emphasized points
-                alt.value(0.4),  # Reduced opacity for other points
-            ),
-            fill=alt.condition(
-                alt.FieldOneOfPredicate("Member Name", selected_members),
-                alt.ColorValue("green"),
-                alt.value("transparent"),
-            ),
+    profile.phase("chart build")
+    scatter_fields = [
+        "Member Name",
+        "Party",
+        "Constituency",
+        "Attendance (%)",
+        "Participation (%)",
+    ]
+
+    def build_scatter():
+        # imported here, so that it only slows down reruns that draw the chart
+        import altair as alt
+
+        return (
+            alt.Chart(chart_data(processed, scatter_fields, decimals=1))
+            .mark_point()
+            .encode(
+                alt.X("Attendance (%)").scale(zero=False).axis(alt.Axis(grid=False)),
+                alt.Y("Participation (%)").scale(zero=False).axis(alt.Axis(grid=False)),
+                color=alt.Color("Party").scale(
+                    alt.Scale(
+                        domain=list(PARTY_COLOURS.keys()),
+                        range=list(PARTY_COLOURS.values()),
+                    )
+                ),
+                shape=alt.Shape("Party").scale(
+                    alt.Scale(
+                        domain=list(PARTY_SHAPES.keys()),
+                        range=list(PARTY_SHAPES.values()),
+                    )
+                ),
+                tooltip=[
+                    alt.Tooltip("Member Name"),
+                    alt.Tooltip("Party"),
+                    alt.Tooltip("Constituency"),
+                    alt.Tooltip("Attendance (%)", format=".1f"),
+                    alt.Tooltip("Participation (%)", format=".1f"),
+                ],
+            )
+            .encode(
+                size=alt.condition(
+                    alt.FieldOneOfPredicate("Member Name", selected_members),
+                    alt.value(200),  # Increase the size of emphasized points
+                    alt.value(30),  # Default size for other points
+                ),
+                opacity=alt.condition(
+                    alt.FieldOneOfPredicate("Member Name", selected_members),
+                    alt.value(1),  # Full opacity for emphasized points
+                    alt.value(0.4),  # Reduced opacity for other points
+                ),
+                fill=alt.condition(
+                    alt.FieldOneOfPredicate("Member Name", selected_members),
+                    alt.ColorValue("green"),
+                    alt.value("transparent"),
+                ),
+            )
         )
+
+    # built once per version of the data, parliament and selected members
+    chart = cached_chart(
+        "leaderboard_participation_scatter",
+        metric_cube.cells,
+        build_scatter,
+        parliament=select_parliament,
+        selection=selected_members,
     )
 
-    st.altair_chart(chart, use_container_width=True)
+    profile.phase("render")
+    show_chart(chart)
 
     st.divider()
 
     st.subheader("All members")
-    st.dataframe(to_display, hide_index=True, use_container_width=False)
+    show_table(
+        to_display,
+        key="leaderboard_participation_page",
+        highlight=selected_rows,
+        highlight_label="Selected members",
+        hide_index=True,
+        use_container_width=False,
+    )
 
 with questions:
     st.header(tabs[1])
@@ -234,3 +290,5 @@ with readability:
     st.header(tabs[3])
     display_header(select_by)
     st.warning("Under construction.")
+
+profile.finish()
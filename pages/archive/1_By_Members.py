@@ -1,18 +1,22 @@
 import streamlit as st
-import altair as alt
 from agg_data import (
+    get_member_index,
+    get_metric_cube,
+    get_metric_ranks,
     get_member_list,
-    get_member_positions,
     get_all_member_speeches,
     primary_question_topics,
 )
-from members import aggregate_member_metrics
-from utils import calculate_readability, EARLIEST_SITTING
+from charts import cached_chart, chart_data, show_chart
+from derived import derived_frame
+from members import aggregate_by_year
+from schema import format_date
+from profiling import start_page_profile
+from thumbnails import show_member_image
+from utils import EARLIEST_SITTING, run_concurrently
 import pandas as pd
 from datetime import datetime
-from scipy.stats import percentileofscore
 from millify import millify
-import numpy as np
 
 st.set_page_config(
     page_title="Performance by Members",
@@ -22,15 +26,14 @@ st.set_page_config(
 
 # BACKEND
 
-
-def average_non_zero(x):
-    non_zero_values = x[x != 0]
-    return np.mean(non_zero_values) if len(non_zero_values) > 0 else 0
+profile = start_page_profile("1_By_Members")
 
 
 def aggregate_by_ministry(df):
     grouped_df = (
-        df.groupby("ministry_addressed")["count_pri_questions"].sum().reset_index()
+        df.groupby("ministry_addressed", observed=True)["count_pri_questions"]
+        .sum()
+        .reset_index()
     )
     total_questions = grouped_df["count_pri_questions"].sum()
     grouped_df["proportion_of_questions"] = (
@@ -59,93 +62,58 @@ def calculate_relative_proportion(selected_member, df, grouped_df):
 
 
 def get_member_speeches_by_year(member_name):
-    all_members_speeches_summary = get_all_member_speeches()
-
-    all_members_speeches_summary_by_year = aggregate_member_metrics(
-        all_members_speeches_summary, calculate_readability, group_by_fields=["member_name", "year"]
+    return get_metric_cube().rollup(
+        ["member_name", "year"], filters={"member_name": member_name}
     )
 
-    return all_members_speeches_summary_by_year[
-        all_members_speeches_summary_by_year["member_name"] == member_name
-    ]
-
 
-@st.cache_data(ttl=6000)
+# not cached here: every input is a result kept until the data changes, and
+# the aggregation is derived once per version of the metric cube
 def prepare_aggregated_data():
-    members_df = get_member_list()
-    member_positions_df = get_member_positions()
-    all_members_speech_summary = get_all_member_speeches()
-
-    column_names = [
-        "count_sittings_attended",
-        "count_sittings_spoken",
-        "count_topics",
-        "count_speeches",
-        "count_words",
-        "count_pri_questions",
-        "count_sentences",
-        "count_syllables",
-    ]
-
-    # agg by member
-    aggregated_by_member = aggregate_member_metrics(
-        all_members_speech_summary, calculate_readability, group_by_fields=["member_name"]
-    )
-
-    # agg by year (average metrics)
-    agg_by_year_dict = {col: average_non_zero for col in column_names}
-    aggregated_by_year = (
-        all_members_speech_summary.groupby("year").agg(agg_by_year_dict).reset_index()
-    )
-    aggregated_by_year.columns = ["year"] + [f"avg_{col}" for col in column_names]
-    aggregated_by_year["year"] = (
-        aggregated_by_year["year"].astype(str).str.replace("[,.]", "", regex=True)
-    )
-    # agg by year (overall readability)
-    readability_cols = ["count_words", "count_sentences", "count_syllables"]
-    readability_dict = {col: sum for col in readability_cols}
-    aggregated_by_year_readability = (
-        all_members_speech_summary.groupby("year").agg(readability_dict).reset_index()
-    )
-    aggregated_by_year_readability.columns = ["year"] + readability_cols
-    aggregated_by_year_readability[
-        "overall_readability"
-    ] = aggregated_by_year_readability.apply(calculate_readability, axis=1)
-    aggregated_by_year_readability["year"] = (
-        aggregated_by_year_readability["year"]
-        .astype(str)
-        .str.replace("[,.]", "", regex=True)
+    datasets = dict(
+        run_concurrently(
+            {
+                "members": get_member_list,
+                "speech_summary": get_all_member_speeches,
+                "questions": primary_question_topics,
+            }
+        )
     )
-    aggregated_by_year = aggregated_by_year.merge(
-        aggregated_by_year_readability[["year", "overall_readability"]],
-        how="left",
-        on="year",
+    members_df = datasets["members"]
+    all_members_speech_summary = datasets["speech_summary"]
+
+    metric_cube = get_metric_cube()
+    aggregated_by_year = derived_frame(
+        "aggregated_by_year",
+        metric_cube.cells,
+        lambda: aggregate_by_year(all_members_speech_summary, metric_cube),
     )
 
     # primary questions
-    agg_questions_by_members = primary_question_topics()
+    agg_questions_by_members = datasets["questions"]
 
     return (
         members_df,
-        member_positions_df,
-        aggregated_by_member,
         aggregated_by_year,
         agg_questions_by_members,
     )
 
 
+profile.phase("data load")
 (
     members_df,
-    member_positions_df,
-    aggregated_by_member,
     aggregated_by_year,
     agg_questions_by_members,
 ) = prepare_aggregated_data()
 member_names = sorted(members_df["member_name"].unique())
+member_index = get_member_index()
+member_ranks = get_metric_ranks()[None]
 
 
 # FRONTEND
 
+profile.phase("render")
+
 select_member = st.sidebar.selectbox(
     label="Which member are you interested in?",
     options=member_names,
@@ -161,7 +129,7 @@ if not select_member:
 
 if select_member:
     member_info, member_picture = st.columns([3, 1])
-    member_df = members_df[members_df["member_name"] == select_member]
+    member_df = member_index.member(select_member)
 
     with member_info:
         st.header(select_member)
@@ -180,15 +148,15 @@ if select_member:
         else:
             st.markdown("* Birth Year: _unknown_")
 
-        condition_earliest_sitting_in_dataset = (
-            str(member_df["earliest_sitting"].iloc[0]) > EARLIEST_SITTING
-        )
+        condition_earliest_sitting_in_dataset = member_df["earliest_sitting"].iloc[
+            0
+        ] > pd.Timestamp(EARLIEST_SITTING)
         member_earliest_sitting = (
-            member_df["earliest_sitting"].iloc[0]
+            format_date(member_df["earliest_sitting"].iloc[0])
             if condition_earliest_sitting_in_dataset
-            else str(member_df["earliest_sitting"].iloc[0]) + " _or before_"
+            else format_date(member_df["earliest_sitting"].iloc[0]) + " _or before_"
         )
-        member_latest_sitting = member_df["latest_sitting"].iloc[0]
+        member_latest_sitting = format_date(member_df["latest_sitting"].iloc[0])
 
         if not condition_earliest_sitting_in_dataset:
             st.info(
@@ -207,35 +175,31 @@ if select_member:
         )
 
     with member_picture:
-        member_image_link = member_df["member_image_link"].iloc[0]
-        if member_image_link:
-            st.image(image=str(member_image_link), width=150)
+        show_member_image(member_df["member_image_link"].iloc[0], width=150)
 
     st.divider()
     st.subheader("Speeches")
 
+    profile.phase("aggregation")
     speech_summary = get_member_speeches_by_year(select_member)
-    speech_summary["readability"] = speech_summary.apply(calculate_readability, axis=1)
     speech_summary["year"] = (
         speech_summary["year"].astype(str).str.replace("[,.]", "", regex=True)
     )
     speech_summary = speech_summary.merge(aggregated_by_year, how="left", on="year")
 
+    profile.phase("render")
     if not condition_earliest_sitting_in_dataset:
         st.warning(
             f"As this member was elected before the earliest sitting ({EARLIEST_SITTING}), the information below reflects information from sittings on {EARLIEST_SITTING} and after."
         )
 
+    member_positions = member_index.positions(select_member)
     not_eligible_to_ask_questions = (
         # is a political appointee
-        not member_positions_df.loc[
-            (member_positions_df["member_name"] == select_member)
-            & (member_positions_df["type"] == "appointment")
-        ].empty
+        not member_positions.loc[member_positions["type"] == "appointment"].empty
         # and not a mayor
-        and member_positions_df.loc[
-            (member_positions_df["member_name"] == select_member)
-            & member_positions_df["member_position"].str.contains("mayor", case=False)
+        and member_positions.loc[
+            member_positions["member_position"].str.contains("mayor", case=False)
         ].empty
     )
 
@@ -267,9 +231,9 @@ if select_member:
             help="Sittings Spoken in divided by Sittings Attended",
         )
         st.caption(
-            f"Percentile: {percentileofscore(aggregated_by_member['participation_rate'], member_participation_rate):.1f}"
+            f"Percentile: {member_ranks.percentile('participation_rate', member_participation_rate):.1f}"
         )
-        st.caption(f"Average: {aggregated_by_member['participation_rate'].mean():.1f}%")
+        st.caption(f"Average: {member_ranks.average('participation_rate'):.1f}%")
     with metric3:
         st.metric(
             label="Speeches Made",
@@ -284,9 +248,9 @@ if select_member:
             value=f"{member_topics_per_sitting:,.2f}",
         )
         st.caption(
-            f"Percentile: {percentileofscore(aggregated_by_member['topics_per_sitting'], member_topics_per_sitting):.1f}"
+            f"Percentile: {member_ranks.percentile('topics_per_sitting', member_topics_per_sitting):.1f}"
         )
-        st.caption(f"Average: {aggregated_by_member['topics_per_sitting'].mean():,.2f}")
+        st.caption(f"Average: {member_ranks.average('topics_per_sitting'):,.2f}")
     with metric4:
         st.metric(
             label="Qns Asked",
@@ -304,10 +268,10 @@ if select_member:
             st.caption("N/A")
         else:
             st.caption(
-                f"Percentile: {percentileofscore(aggregated_by_member['questions_per_sitting'], member_questions_per_sitting):.1f}"
+                f"Percentile: {member_ranks.percentile('questions_per_sitting', member_questions_per_sitting):.1f}"
             )
             st.caption(
-                f"Average: {aggregated_by_member[aggregated_by_member['questions_per_sitting'] != 0]['questions_per_sitting'].mean():,.2f}"
+                f"Average: {member_ranks.average('questions_per_sitting', exclude_zero=True):,.2f}"
             )
     with metric5:
         st.metric(
@@ -323,49 +287,76 @@ if select_member:
             value=f"{millify(member_words_per_sitting, precision=1)}",
         )
         st.caption(
-            f"Percentile: {percentileofscore(aggregated_by_member['words_per_sitting'], member_words_per_sitting):.1f}"
+            f"Percentile: {member_ranks.percentile('words_per_sitting', member_words_per_sitting):.1f}"
         )
         st.caption(
-            f"Average: {millify(aggregated_by_member['words_per_sitting'].mean(), precision=1)}"
+            f"Average: {millify(member_ranks.average('words_per_sitting'), precision=1)}"
         )
 
     if not not_eligible_to_ask_questions:
-        agg_by_ministry_addressed = aggregate_by_ministry(agg_questions_by_members)
-        questions_summary_with_relative_proportion = calculate_relative_proportion(
-            select_member, agg_questions_by_members, agg_by_ministry_addressed
-        )
 
-        st.divider()
-        st.write("Parliamentary questions asked:")
+        def build_ministry_chart():
+            agg_by_ministry_addressed = aggregate_by_ministry(agg_questions_by_members)
+            questions_summary_with_relative_proportion = calculate_relative_proportion(
+                select_member, agg_questions_by_members, agg_by_ministry_addressed
+            )
 
-        chart = (
-            alt.Chart(questions_summary_with_relative_proportion)
-            .mark_bar()
-            .encode(
-                x=alt.X(
-                    "sum(count_pri_questions):Q", title="Count of Primary Questions"
-                ),
-                y=alt.Y("member_name:N", sort="x", title="Ministry Addressed"),
-                color="member_name:N",
-                row="ministry_addressed:N",
-                tooltip=["member_name", "ministry_addressed", "count_pri_questions"],
+            # imported here, so that it only slows down reruns that draw the chart
+            import altair as alt
+
+            chart = (
+                alt.Chart(
+                    chart_data(
+                        questions_summary_with_relative_proportion,
+                        ["member_name", "ministry_addressed", "count_pri_questions"],
+                        decimals=2,
+                    )
+                )
+                .mark_bar()
+                .encode(
+                    x=alt.X(
+                        "sum(count_pri_questions):Q", title="Count of Primary Questions"
+                    ),
+                    y=alt.Y("member_name:N", sort="x", title="Ministry Addressed"),
+                    color="member_name:N",
+                    row="ministry_addressed:N",
+                    tooltip=[
+                        "member_name",
+                        "ministry_addressed",
+                        "count_pri_questions",
+                    ],
+                )
+                .properties(
+                    height=20,
+                )
             )
-            .properties(
-                height=20,
+
+            return (
+                chart.configure_view(continuousHeight=100)
+                .configure_axis(labelFontSize=0)
+                .configure_title(fontSize=0)
+                .configure_legend(titleFontSize=14, labelFontSize=12)
+                .configure_axisY(disable=True)
+                .configure_header(
+                    labelAngle=0, labelAnchor="start", labelBaseline="middle"
+                )
+                .configure_scale(bandPaddingInner=0.001, bandPaddingOuter=0.001)
             )
-        )
 
-        horizontal_chart = (
-            chart.configure_view(continuousHeight=100)
-            .configure_axis(labelFontSize=0)
-            .configure_title(fontSize=0)
-            .configure_legend(titleFontSize=14, labelFontSize=12)
-            .configure_axisY(disable=True)
-            .configure_header(labelAngle=0, labelAnchor="start", labelBaseline="middle")
-            .configure_scale(bandPaddingInner=0.001, bandPaddingOuter=0.001)
+        profile.phase("chart build")
+        # aggregated and built once per version of the data and member
+        horizontal_chart = cached_chart(
+            "member_questions_by_ministry",
+            agg_questions_by_members,
+            build_ministry_chart,
+            member=select_member,
         )
 
-        st.altair_chart(horizontal_chart, use_container_width=True)
+        st.divider()
+        st.write("Parliamentary questions asked:")
+
+        profile.phase("render")
+        show_chart(horizontal_chart)
 
     st.divider()
     st.write("Over the years:")
@@ -405,26 +396,41 @@ if select_member:
 
     st.divider()
     st.subheader("Positions")
-    positions_df = member_positions_df[
-        member_positions_df["member_name"] == select_member
-    ]
+    positions_df = member_positions
     columns_to_display = [
         "member_position",
         "effective_from_date",
         "effective_to_date",
         "is_latest_position",
     ]
+    # dates are parsed to datetime64, shown without the time
+    positions_column_config = {
+        col: st.column_config.DateColumn(format="YYYY-MM-DD")
+        for col in ["effective_from_date", "effective_to_date"]
+    }
 
     constituencies_df = positions_df[positions_df["type"] == "constituency"][
         columns_to_display
     ]
     if not constituencies_df.empty:
         st.write("Constituencies")
-        st.dataframe(constituencies_df, use_container_width=True, hide_index=True)
+        st.dataframe(
+            constituencies_df,
+            use_container_width=True,
+            hide_index=True,
+            column_config=positions_column_config,
+        )
 
     appointments_df = positions_df[positions_df["type"] == "appointment"][
         columns_to_display
     ]
     if not appointments_df.empty:
         st.write("Political Appointments")
-        st.dataframe(appointments_df, use_container_width=True, hide_index=True)
+        st.dataframe(
+            appointments_df,
+            use_container_width=True,
+            hide_index=True,
+            column_config=positions_column_config,
+        )
+
+profile.finish()
@@ -1,32 +1,35 @@
 import streamlit as st
 import pandas as pd
 from millify import millify
-from agg_data import get_member_list, get_member_positions, get_all_member_speeches
-from members import (
-    categorise_active_members_with_appointments,
-    aggregate_member_metrics,
-)
-from utils import calculate_readability, EARLIEST_SITTING
+from agg_data import get_member_index
+from members import categorise_active_members_with_appointments
+from derived import derived_frame
+from profiling import start_page_profile
+from schema import format_date
+from thumbnails import show_member_image
+from utils import EARLIEST_SITTING
 
 # BACKEND
 
-members_df = get_member_list()
+profile = start_page_profile("2_By_Constituencies")
+
+profile.phase("data load")
+members_index = get_member_index()
+members_df = members_index.members_df
 constituency_names = sorted(
     members_df[members_df["constituency"].notna()]["constituency"].unique()
 )
 
+profile.phase("aggregation")
 # current appointments:
-all_member_positions = get_member_positions()
+all_member_positions = members_index.member_positions_df
 current_member_appointments = all_member_positions[
     (all_member_positions["type"] == "appointment")
     & (all_member_positions["is_latest_position"])
 ]
 
 # metrics by member:
-all_members_speech_summary = get_all_member_speeches()
-aggregated_by_member = aggregate_member_metrics(
-    all_members_speech_summary, calculate_readability, group_by_fields=["member_name"]
-)
+aggregated_by_member = members_index.aggregated_by_member
 metrics_to_display = [
     "member_name",
     "participation_rate",
@@ -35,31 +38,44 @@ metrics_to_display = [
     "words_per_sitting",
     "readability",
 ]
-aggregated_by_member_display = aggregated_by_member[metrics_to_display]
-aggregated_by_member_display["participation_rate"] = (
-    aggregated_by_member["participation_rate"].round(1).astype(str) + "%"
+
+
+# same row order as aggregated_by_member, so members_index's positions apply
+def build_aggregated_by_member_display():
+    aggregated_by_member_display = aggregated_by_member[metrics_to_display].copy()
+    aggregated_by_member_display["participation_rate"] = (
+        aggregated_by_member["participation_rate"].round(1).astype(str) + "%"
+    )
+    for metric in metrics_to_display:
+        if metric not in [
+            "member_name",
+            "participation_rate",
+        ] and pd.api.types.is_numeric_dtype(aggregated_by_member_display[metric]):
+            aggregated_by_member_display[metric] = aggregated_by_member_display[
+                metric
+            ].round(2)
+    return aggregated_by_member_display
+
+
+# built once per version of the data, not on every rerun
+aggregated_by_member_display = derived_frame(
+    "constituencies_member_display",
+    aggregated_by_member,
+    build_aggregated_by_member_display,
+    columns=metrics_to_display,
 )
-for metric in metrics_to_display:
-    if metric not in [
-        "member_name",
-        "participation_rate",
-    ] and pd.api.types.is_numeric_dtype(aggregated_by_member_display[metric]):
-        aggregated_by_member_display[metric] = aggregated_by_member_display[
-            metric
-        ].round(2)
 
 
 # former members:
 def filter_former_members(select_constituency):
-    former_members = members_df[
-        (members_df["constituency"] == select_constituency)
-        & (members_df["is_active"] == False)
-    ]
+    constituency_members = members_index.constituency(select_constituency)
+    former_members = constituency_members[constituency_members["is_active"] == False]
 
     return former_members
 
 
 # FRONTEND
+profile.phase("render")
 
 st.title("Performance by Constituency")
 
@@ -80,11 +96,11 @@ if select_constituency:
 
     st.subheader("Active Members")
 
+    constituency_members = members_index.constituency(select_constituency)
     active_members = sorted(
-        members_df[
-            (members_df["constituency"] == select_constituency)
-            & (members_df["is_active"] == True)
-        ]["member_name"].tolist()
+        constituency_members[constituency_members["is_active"] == True][
+            "member_name"
+        ].tolist()
     )
 
     def display_members(members, start_index=0):
@@ -94,10 +110,10 @@ if select_constituency:
             with col:
                 if member_index < len(members):
                     member_name = members[member_index]
-                    member_image_link = members_df[
-                        members_df["member_name"] == member_name
-                    ]["member_image_link"].iloc[0]
-                    st.image(member_image_link, width=100, caption=member_name)
+                    member_image_link = members_index.member(member_name)[
+                        "member_image_link"
+                    ].iloc[0]
+                    show_member_image(member_image_link, width=100, caption=member_name)
                 else:
                     st.empty()
 
@@ -125,11 +141,12 @@ if select_constituency:
             ("words_per_sitting", "Words/Sitting", "2"),
             ("readability", "Readability", "1"),
         ]
+        member_metrics = aggregated_by_member_display.iloc[
+            members_index.metrics(member_name).index
+        ]
         for i, col in enumerate(columns):
             with col:
-                value = aggregated_by_member_display[
-                    aggregated_by_member_display["member_name"] == member_name
-                ][metrics[i][0]].iloc[0]
+                value = member_metrics[metrics[i][0]].iloc[0]
                 if isinstance(value, (int, float)):
                     value = millify(value, precision=metrics[i][2])
                 st.metric(
@@ -159,15 +176,16 @@ if select_constituency:
             )
             former_members = filter_former_members(select_constituency)["member_name"]
             for member_name in former_members:
-                if member_name in aggregated_by_member_display["member_name"].values:
-                    position_dates = all_member_positions[
-                        (all_member_positions["member_name"] == member_name)
-                        & (
-                            all_member_positions["member_position"]
-                            == select_constituency
-                        )
+                if members_index.has_metrics(member_name):
+                    member_positions = members_index.positions(member_name)
+                    position_dates = member_positions[
+                        member_positions["member_position"] == select_constituency
                     ][["effective_from_date", "effective_to_date"]]
                     earliest_date = position_dates["effective_from_date"].min()
                     latest_date = position_dates["effective_to_date"].max()
-                    st.write(f"**{member_name}** ({earliest_date} to {latest_date})")
+                    st.write(
+                        f"**{member_name}** ({format_date(earliest_date)} to {format_date(latest_date)})"
+                    )
                     display_metrics(member_name)
+
+profile.finish()
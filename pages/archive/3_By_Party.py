@@ -1,5 +1,111 @@
 import streamlit as st
 
-st.title("Performance by Party")
+from agg_data import get_party_comparisons
+from charts import cached_chart, chart_data, show_chart
+from parties import CONFIDENCE, PARTY_METRICS, RESAMPLES
+from profiling import start_page_profile
+from utils import PARLIAMENTS, PARTY_COLOURS
+
+# BACKEND
+
+profile = start_page_profile("3_By_Party")
+
+profile.phase("data load")
+party_comparisons = get_party_comparisons()
+
+metric_labels = {
+    "participation_rate": "Participation Rate (%)",
+    "questions_per_sitting": "Questions per Sitting",
+    "readability": "Readability",
+}
+
+# SELECTIONS
 
+profile.phase("render")
+
+select_parliament = st.sidebar.radio(
+    label="Which parliament?", options=PARLIAMENTS.keys(), index=1
+)
+select_metric = st.sidebar.radio(
+    label="Which metric?",
+    options=PARTY_METRICS,
+    format_func=metric_labels.get,
+)
+
+# FRONTEND
+
+st.title("Performance by Party")
 st.warning("Under construction.")
+
+comparison = party_comparisons[select_parliament]
+comparison = comparison[comparison["metric"] == select_metric]
+
+st.caption(
+    f"Each party's {metric_labels[select_metric].lower()} is computed over all"
+    f" its members' sittings. Bars are {CONFIDENCE:.0%} confidence intervals,"
+    f" from {RESAMPLES:,} resamples of the party's members."
+)
+
+profile.phase("chart build")
+
+
+def build_comparison_chart():
+    import altair as alt
+
+    data = chart_data(
+        comparison,
+        ["member_party", "value", "lower", "upper", "count_members"],
+        decimals=2,
+    )
+    colour = alt.Color(
+        "member_party:N",
+        scale=alt.Scale(
+            domain=list(PARTY_COLOURS.keys()), range=list(PARTY_COLOURS.values())
+        ),
+        legend=None,
+    )
+    base = alt.Chart(data).encode(
+        y=alt.Y("member_party:N", title="Party", sort="-x"),
+        tooltip=[
+            alt.Tooltip("member_party:N", title="Party"),
+            alt.Tooltip("value:Q", title=metric_labels[select_metric], format=".2f"),
+            alt.Tooltip("lower:Q", title="Lower bound", format=".2f"),
+            alt.Tooltip("upper:Q", title="Upper bound", format=".2f"),
+            alt.Tooltip("count_members:Q", title="Members"),
+        ],
+    )
+    return base.mark_rule(strokeWidth=2).encode(
+        x=alt.X(
+            "lower:Q", title=metric_labels[select_metric], scale=alt.Scale(zero=False)
+        ),
+        x2="upper:Q",
+        color=colour,
+    ) + base.mark_point(filled=True, size=80, stroke="black").encode(
+        x="value:Q", color=colour
+    )
+
+
+chart = cached_chart(
+    "party_comparison",
+    party_comparisons[select_parliament],
+    build_comparison_chart,
+    metric=select_metric,
+)
+
+profile.phase("render")
+show_chart(chart)
+
+st.dataframe(
+    comparison.drop(columns="metric").round(2),
+    hide_index=True,
+    use_container_width=True,
+    column_config={
+        "member_party": "Party",
+        "value": metric_labels[select_metric],
+        "lower": "Lower Bound",
+        "upper": "Upper Bound",
+        "count_members": "Members",
+    },
+)
+
+profile.finish()
@@ -1,10 +1,96 @@
+from datetime import datetime
+
 import streamlit as st
 
+from agg_data import get_member_list, get_speech_index
+from profiling import start_page_profile
+from utils import EARLIEST_SITTING
+
+st.set_page_config(
+    page_title="Speeches",
+    page_icon="💬",
+    initial_sidebar_state="expanded",
+)
+
+# BACKEND
+
+profile = start_page_profile("4_Speeches")
+
+profile.phase("data load")
+speech_index = get_speech_index()
+member_names = sorted(get_member_list()["member_name"].unique())
+
+# FRONTEND
+
+profile.phase("render")
 st.title("Speeches")
 
-st.warning("Under construction.")
-st.markdown(
-    """
-Please see [current implementation](https://lookerstudio.google.com/u/1/reporting/e41e239f-a88a-45b9-b133-5c91bb1f3f13/page/p_t7zbjn4vfd) on Looker Studio in the meantime.
-            """
+query = st.text_input(
+    "Search speeches",
+    placeholder='e.g. housing "cost of living"',
+    help="Every word must appear in a speech. Put phrases in double quotes.",
+)
+
+select_members = st.sidebar.multiselect(
+    "Members", options=member_names, placeholder="All members"
+)
+select_dates = st.sidebar.date_input(
+    "Sitting dates",
+    value=(),
+    min_value=datetime.strptime(EARLIEST_SITTING, "%Y-%m-%d").date(),
+    max_value=speech_index.latest_date,
 )
+select_topic = st.sidebar.text_input("Topic title contains")
+primary_questions_only = st.sidebar.checkbox("Primary questions only")
+
+start_date = select_dates[0] if len(select_dates) > 0 else None
+end_date = select_dates[1] if len(select_dates) > 1 else None
+
+# back to the first page when the search changes
+search_key = (
+    query,
+    tuple(select_members),
+    start_date,
+    end_date,
+    select_topic,
+    primary_questions_only,
+)
+if st.session_state.get("speeches_search") != search_key:
+    st.session_state["speeches_search"] = search_key
+    st.session_state["speeches_page"] = 1
+page = st.session_state["speeches_page"]
+
+profile.phase("search")
+results = speech_index.search(
+    query,
+    members=select_members,
+    start_date=start_date,
+    end_date=end_date,
+    topic=select_topic,
+    primary_questions_only=primary_questions_only,
+    page=page - 1,
+)
+
+profile.phase("render")
+st.caption(
+    f"{results.total:,} speeches found in {results.elapsed_ms:,.0f} ms"
+    + ("" if query else ", latest first")
+)
+
+for hit in results.hits.itertuples(index=False):
+    st.markdown(
+        f"**{hit.topic_title}**  \n{hit.member_name}, {hit.date:%Y-%m-%d}"
+        + (" (primary question)" if hit.is_primary_question else "")
+    )
+    st.markdown(hit.snippet)
+    st.divider()
+
+if results.pages > 1:
+    st.number_input(
+        f"Page (of {results.pages:,})",
+        min_value=1,
+        max_value=results.pages,
+        key="speeches_page",
+    )
+
+profile.finish()
@@ -1,5 +1,110 @@
 import streamlit as st
 
+from agg_data import get_member_list, get_topic_trends
+from profiling import start_page_profile
+from topics import BASELINE_MONTHS, RECENT_MONTHS
+
+st.set_page_config(
+    page_title="Topics",
+    page_icon="💬",
+    initial_sidebar_state="expanded",
+)
+
+# BACKEND
+
+profile = start_page_profile("5_Topics")
+
+profile.phase("data load")
+topic_matrix = get_topic_trends().matrix
+member_names = sorted(get_member_list()["member_name"].unique())
+
+profile.phase("aggregation")
+trending = topic_matrix.trending()
+lifetimes = topic_matrix.lifetimes()
+topic_titles = dict(
+    lifetimes.sort_values("count_speeches", ascending=False)[
+        ["topic_id", "topic_title"]
+    ].itertuples(index=False)
+)
+
+# FRONTEND
+
+profile.phase("render")
 st.title("Topics")
 
-st.warning("Under construction.")
+st.subheader("Trending topics")
+st.caption(
+    f"Speeches per month in the latest {RECENT_MONTHS} months, compared with "
+    f"the {BASELINE_MONTHS} months before."
+)
+st.dataframe(
+    trending.drop(columns="topic_id"),
+    hide_index=True,
+    use_container_width=True,
+    column_config={
+        "topic_title": "Topic",
+        "recent_per_month": st.column_config.NumberColumn(
+            "Recent (per month)", format="%.1f"
+        ),
+        "baseline_per_month": st.column_config.NumberColumn(
+            "Before (per month)", format="%.1f"
+        ),
+        "growth": st.column_config.NumberColumn("Growth", format="%.1fx"),
+    },
+)
+
+st.subheader("Topic over time")
+select_topic = st.selectbox(
+    "Which topic are you interested in?",
+    options=list(topic_titles),
+    format_func=topic_titles.get,
+    index=None,
+    placeholder="Choose topic, most discussed first",
+)
+if select_topic is not None:
+    lifetime = lifetimes[lifetimes["topic_id"] == select_topic].iloc[0]
+    st.markdown(
+        f"Discussed from _**{lifetime['first_period'] // 100}-{lifetime['first_period'] % 100:02d}**_ "
+        f"to _**{lifetime['latest_period'] // 100}-{lifetime['latest_period'] % 100:02d}**_, "
+        f"in {lifetime['count_speeches']:,} speeches over {lifetime['active_months']} months."
+    )
+    st.bar_chart(topic_matrix.topic_series(select_topic))
+    st.write("Members who spoke on it most:")
+    st.dataframe(
+        topic_matrix.topic_members(select_topic).rename("Speeches"),
+        use_container_width=True,
+    )
+
+st.subheader("Topics by member")
+select_member = st.selectbox(
+    "Which member are you interested in?",
+    options=member_names,
+    index=None,
+    placeholder="Choose member name",
+)
+if select_member:
+    st.dataframe(
+        topic_matrix.member_top_topics(select_member).drop(columns="topic_id"),
+        hide_index=True,
+        use_container_width=True,
+        column_config={"topic_title": "Topic", "count_speeches": "Speeches"},
+    )
+
+st.subheader("Longest-running topics")
+st.dataframe(
+    lifetimes.sort_values("lifetime_months", ascending=False)
+    .head(10)
+    .drop(columns="topic_id"),
+    hide_index=True,
+    use_container_width=True,
+    column_config={
+        "topic_title": "Topic",
+        "first_period": st.column_config.NumberColumn("First month", format="%d"),
+        "latest_period": st.column_config.NumberColumn("Latest month", format="%d"),
+        "lifetime_months": "Months between",
+        "active_months": "Months discussed",
+        "count_speeches": "Speeches",
+    },
+)
+
+profile.finish()
@@ -1,10 +1,86 @@
+from datetime import datetime
+
 import streamlit as st
 
+from bills import (
+    PAGE_SIZE,
+    SORTS,
+    BillFilters,
+    bill_count,
+    fetch_page,
+    first_cursor,
+    prefetch,
+)
+from profiling import start_page_profile
+
+st.set_page_config(
+    page_title="Bills",
+    page_icon="💬",
+    initial_sidebar_state="expanded",
+)
+
+# BACKEND
+
+profile = start_page_profile("6_Bills")
+
+# FRONTEND
+
+profile.phase("render")
 st.title("Bills")
 
-st.warning("Under construction.")
-st.markdown(
-    """
-Please see [current implementation](https://lookerstudio.google.com/u/1/reporting/e41e239f-a88a-45b9-b133-5c91bb1f3f13/page/p_jniba4ngfd) on Looker Studio in the meantime.
-            """
+select_title = st.sidebar.text_input("Title contains")
+select_dates = st.sidebar.date_input(
+    "Date introduced",
+    value=(),
+    min_value=datetime(1955, 1, 1).date(),
+)
+select_sort = st.sidebar.radio("Sort", options=list(SORTS))
+
+filters = BillFilters(
+    title=select_title.strip(),
+    **({"start_date": select_dates[0]} if len(select_dates) > 0 else {}),
+    **({"end_date": select_dates[1]} if len(select_dates) > 1 else {}),
+)
+
+# cursors of the pages up to the one shown: back to the first page when the
+# filters or sort change
+search_key = (filters, select_sort)
+if st.session_state.get("bills_search") != search_key:
+    st.session_state["bills_search"] = search_key
+    st.session_state["bills_cursors"] = [first_cursor(select_sort)]
+cursors = st.session_state["bills_cursors"]
+
+profile.phase("data load")
+bills, next_cursor = fetch_page(select_sort, filters, cursors[-1])
+prefetch(select_sort, filters, next_cursor)
+
+profile.phase("render")
+st.caption(
+    f"{bill_count():,} bills in total. Page {len(cursors):,}"
+    f" ({PAGE_SIZE} bills per page)."
 )
+st.dataframe(
+    bills,
+    hide_index=True,
+    use_container_width=True,
+    column_config={
+        "bill_number": "Bill Number",
+        "title": "Title",
+        "date_introduced": st.column_config.DateColumn("Date Introduced"),
+    },
+)
+
+
+def previous_page():
+    cursors.pop()
+
+
+def next_page():
+    cursors.append(next_cursor)
+
+
+col_previous, col_next = st.columns(2)
+col_previous.button("Previous", on_click=previous_page, disabled=len(cursors) == 1)
+col_next.button("Next", on_click=next_page, disabled=next_cursor is None)
+
+profile.finish()
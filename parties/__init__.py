@@ -0,0 +1,153 @@
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from cube import MetricCube
+from metrics import RATIO_METRICS, readability, safe_divide
+
+PARTY_METRICS = ["participation_rate", "questions_per_sitting", "readability"]
+
+# Resamples of each party's members, and the confidence level of the
+# intervals. The seed is fixed, so the same data always gives the same
+# intervals.
+RESAMPLES = 4000
+CONFIDENCE = 0.95
+SEED = 0
+
+
+def _metric_values(metric: str, sums: Dict[str, np.ndarray]) -> np.ndarray:
+    # a metric of summed count_* columns, of any shape
+    if metric == "readability":
+        return readability(
+            sums["count_words"], sums["count_sentences"], sums["count_syllables"]
+        )
+    numerator, denominator, scale = RATIO_METRICS[metric]
+    return safe_divide(sums[numerator], sums[denominator]) * scale
+
+
+def _count_columns(metrics: List[str]) -> List[str]:
+    columns = []
+    for metric in metrics:
+        if metric == "readability":
+            columns += ["count_words", "count_sentences", "count_syllables"]
+        else:
+            columns += list(RATIO_METRICS[metric][:2])
+    return list(dict.fromkeys(columns))
+
+
+def bootstrap_party_metrics(
+    aggregated: pd.DataFrame,
+    metrics: List[str] = PARTY_METRICS,
+    resamples: int = RESAMPLES,
+    confidence: float = CONFIDENCE,
+    seed: int = SEED,
+) -> pd.DataFrame:
+    """
+    Aggregates member metrics by party, with bootstrap confidence intervals.
+
+    A party's metric is computed from the count_* columns summed over its
+    members, as `aggregate_member_metrics` grouped by party. Its interval
+    comes from resampling the party's members with replacement: every
+    resample of every party is drawn at once as one array of row positions,
+    and the counts are summed by party with `np.add.reduceat`, so there is no
+    loop over resamples or parties.
+
+    Parameters:
+    - aggregated (pd.DataFrame): Counts with one row per member, e.g. the
+      output of `aggregate_member_metrics` grouped by 'member_name' and
+      'member_party'.
+    - metrics (List[str]): Metrics to compare, from `RATIO_METRICS` or
+      'readability'.
+    - resamples (int): Number of bootstrap resamples.
+    - confidence (float): Confidence level of the intervals.
+    - seed (int): Seed of the resampling.
+
+    Returns:
+    - pd.DataFrame: One row per party and metric, with the metric's `value`,
+      the `lower` and `upper` bounds of its interval (percentiles of the
+      resampled values) and the party's `count_members`. Bounds are missing
+      where every resample is undefined, e.g. a party whose members never
+      spoke has no questions per sitting.
+    """
+    aggregated = aggregated[aggregated["member_party"].notna()].sort_values(
+        "member_party", kind="stable"
+    )
+    parties, starts, sizes = np.unique(
+        aggregated["member_party"].to_numpy(dtype=str),
+        return_index=True,
+        return_counts=True,
+    )
+
+    # row drawn for each (resample, member slot): a uniform draw among the
+    # members of the slot's party
+    slot_party = np.repeat(np.arange(len(parties)), sizes)
+    rng = np.random.default_rng(seed)
+    draws = starts[slot_party] + (
+        rng.random((resamples, len(slot_party))) * sizes[slot_party]
+    ).astype(np.int64)
+
+    observed, resampled = {}, {}
+    for column in _count_columns(metrics):
+        values = aggregated[column].to_numpy(dtype="float64")
+        observed[column] = np.add.reduceat(values, starts) if len(starts) else values
+        resampled[column] = (
+            np.add.reduceat(values[draws], starts, axis=1)
+            if len(starts)
+            else np.empty((resamples, 0))
+        )
+
+    tail = (1 - confidence) / 2
+    frames = []
+    for metric in metrics:
+        samples = _metric_values(metric, resampled)
+        defined = ~np.isnan(samples).all(axis=0)
+        bounds = np.full((2, len(parties)), np.nan)
+        if defined.any():
+            bounds[:, defined] = np.nanquantile(
+                samples[:, defined], [tail, 1 - tail], axis=0
+            )
+        frames.append(
+            pd.DataFrame(
+                {
+                    "member_party": parties,
+                    "metric": metric,
+                    "value": _metric_values(metric, observed),
+                    "lower": bounds[0],
+                    "upper": bounds[1],
+                    "count_members": sizes,
+                }
+            )
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+def build_party_comparisons(
+    cube: MetricCube,
+    parliaments: Dict[str, List[int]],
+    metrics: List[str] = PARTY_METRICS,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Runs `bootstrap_party_metrics` for every parliament selection.
+
+    Parameters:
+    - cube (MetricCube): Cube of the speech summary data for all members.
+    - parliaments (Dict[str, List[int]]): Parliament selections, by name.
+    - metrics (List[str]): Metrics to compare.
+
+    Returns:
+    - Dict[str, pd.DataFrame]: Party metrics by selection name. Members are
+      aggregated by parliament first and then across the selection, as on
+      the Leaderboard; a member who changed party counts once for each.
+    """
+    return {
+        name: bootstrap_party_metrics(
+            cube.rollup(
+                ["member_name", "member_party"],
+                filters={"parliament": selection},
+                attended_within=["parliament"],
+            ),
+            metrics,
+        )
+        for name, selection in parliaments.items()
+    }
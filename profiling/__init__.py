@@ -0,0 +1,202 @@
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional, Tuple
+
+import pandas as pd
+import streamlit as st
+
+from utils import is_admin_request
+
+# `?profile=1` shows the render profile of each rerun, `?profile=cprofile` also
+# runs the rerun under cProfile. Allowed with PARL_PROFILING=1 (development),
+# or on any server with the admin token (`&admin=<token>`).
+PROFILE_PARAM = "profile"
+PROFILING_ENABLED = os.environ.get("PARL_PROFILING") == "1"
+
+# Number of reruns whose phase timings are kept, for all pages together.
+MAX_RERUNS = 500
+CPROFILE_LINES = 30
+
+# (time, page, total ms, ms per top-level phase) of the latest reruns, made
+# into a frame only when the admin view asks for it
+_reruns: Deque[Tuple[float, str, float, Dict[str, float]]] = deque(maxlen=MAX_RERUNS)
+_reruns_lock = threading.Lock()
+
+
+@dataclass
+class Span:
+    name: str
+    start: float
+    end: Optional[float] = None
+    depth: int = 0
+
+    @property
+    def ms(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+
+@dataclass
+class PageProfile:
+    """
+    Timings of the phases of one rerun of a page. Top-level phases follow
+    each other (`phase`); spans (`span`) can be nested inside them. Timing is
+    always on, and costs one `perf_counter` call per boundary and a tuple per
+    rerun; the frames of the overlay and admin view are only built, and
+    cProfile only runs, when requested.
+    """
+
+    page: str
+    mode: Optional[str] = None
+    start: float = field(default_factory=time.perf_counter)
+    spans: List[Span] = field(default_factory=list)
+    _phase: Optional[Span] = None
+    _depth: int = 0
+    _profiler: Optional[cProfile.Profile] = None
+
+    def phase(self, name: str):
+        """Ends the current phase, if any, and starts the next one."""
+        now = time.perf_counter()
+        if self._phase is not None:
+            self._phase.end = now
+        self._phase = Span(name, now)
+        self.spans.append(self._phase)
+
+    @contextmanager
+    def span(self, name: str):
+        """Times a block, nested in the current phase."""
+        self._depth += 1
+        span = Span(name, time.perf_counter(), depth=self._depth)
+        self.spans.append(span)
+        try:
+            yield span
+        finally:
+            span.end = time.perf_counter()
+            self._depth -= 1
+
+    def finish(self):
+        """
+        Ends the rerun: records its timings and, if requested, shows the
+        overlay with them (and the cProfile capture).
+        """
+        end = time.perf_counter()
+        if self._phase is not None and self._phase.end is None:
+            self._phase.end = end
+        if self._profiler is not None:
+            self._profiler.disable()
+
+        total_ms = (end - self.start) * 1000
+        phases: Dict[str, float] = {}
+        for span in self.spans:
+            if span.depth == 0:
+                phases[span.name] = phases.get(span.name, 0.0) + span.ms
+        phases["other"] = max(total_ms - sum(phases.values()), 0.0)
+        with _reruns_lock:
+            _reruns.append((time.time(), self.page, total_ms, phases))
+
+        if self.mode is not None:
+            self._show_overlay(self.timings(end), end)
+
+    def timings(self, end: Optional[float] = None) -> pd.DataFrame:
+        """
+        Returns the time spent per phase and span name (summed over repeats),
+        in order of first start, with the time outside of any phase as
+        'other'.
+        """
+        end = end or time.perf_counter()
+        total_ms = (end - self.start) * 1000
+        rows: Dict[tuple, float] = {}
+        for span in self.spans:
+            key = (span.depth, span.name)
+            rows[key] = rows.get(key, 0.0) + span.ms
+
+        timings = pd.DataFrame(
+            [(name, depth, ms) for (depth, name), ms in rows.items()],
+            columns=["phase", "depth", "ms"],
+        )
+        other_ms = total_ms - timings.loc[timings["depth"] == 0, "ms"].sum()
+        timings.loc[len(timings)] = ["other", 0, max(other_ms, 0.0)]
+        timings["share"] = timings["ms"] / total_ms if total_ms else 0.0
+        return timings
+
+    def _show_overlay(self, timings: pd.DataFrame, end: float):
+        timings = timings.copy()
+        timings["phase"] = [
+            "  " * depth + name
+            for name, depth in zip(timings["phase"], timings["depth"])
+        ]
+        with st.sidebar.expander(
+            f"Render profile: {(end - self.start) * 1000:,.0f} ms", expanded=True
+        ):
+            st.dataframe(
+                timings[["phase", "ms", "share"]],
+                hide_index=True,
+                use_container_width=True,
+                column_config={
+                    "ms": st.column_config.NumberColumn(format="%.1f"),
+                    "share": st.column_config.ProgressColumn(
+                        format="%.2f", min_value=0.0, max_value=1.0
+                    ),
+                },
+            )
+            if self._profiler is not None:
+                output = io.StringIO()
+                pstats.Stats(self._profiler, stream=output).sort_stats(
+                    "cumulative"
+                ).print_stats(CPROFILE_LINES)
+                st.code(output.getvalue(), language="text")
+
+
+def profiling_mode() -> Optional[str]:
+    """
+    Returns the requested profiling mode, 'spans' or 'cprofile', or None when
+    the profile query parameter is absent or not allowed.
+    """
+    requested = st.query_params.get(PROFILE_PARAM)
+    if not requested or not (PROFILING_ENABLED or is_admin_request()):
+        return None
+    return "cprofile" if requested == "cprofile" else "spans"
+
+
+def start_page_profile(page: str) -> PageProfile:
+    """
+    Starts profiling a rerun of a page. Call `finish` on the result at the end
+    of the page script.
+
+    Parameters:
+    - page (str): Name of the page, e.g. '0_Leaderboard'.
+
+    Returns:
+    - PageProfile: Profile of this rerun.
+    """
+    profile = PageProfile(page, mode=profiling_mode())
+    if profile.mode == "cprofile":
+        profile._profiler = cProfile.Profile()
+        profile._profiler.enable()
+    return profile
+
+
+def page_timings() -> pd.DataFrame:
+    """Returns the phase timings of the latest `MAX_RERUNS` reruns, oldest first."""
+    with _reruns_lock:
+        reruns = list(_reruns)
+    return pd.DataFrame(
+        [
+            {
+                "timestamp": datetime.fromtimestamp(timestamp, timezone.utc).isoformat(
+                    timespec="seconds"
+                ),
+                "page": page,
+                "total_ms": total_ms,
+                **{f"{name}_ms": ms for name, ms in phases.items()},
+            }
+            for timestamp, page, total_ms, phases in reruns
+        ]
+    )
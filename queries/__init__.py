@@ -0,0 +1,536 @@
+import hashlib
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+from freshness import StaleWhileRevalidateCache
+from instrumentation import track_query
+from schema import compact_dtypes
+from shared import shared_store
+from snapshots import SNAPSHOT_TABLES, read_manifest
+from utils import (
+    CACHE_MODE,
+    DATA_BACKEND,
+    MAX_CACHE_ENTRIES,
+    MAX_CONCURRENT_QUERIES,
+    arrow_to_dataframe,
+    execute_query,
+    get_client,
+    project_id,
+)
+
+
+@dataclass(frozen=True)
+class RegisteredQuery:
+    """
+    A named query. Parameters are referenced in `sql` as `@name` and passed as
+    BigQuery query parameters, never formatted into the query text.
+    `as_dataframe` is the form pages read the result in, and is warmed in.
+    """
+
+    name: str
+    sql: str
+    pages: Tuple[str, ...] = ()
+    as_dataframe: bool = True
+
+    @property
+    def fingerprint(self) -> str:
+        return hashlib.sha1(normalise_sql(self.sql).encode()).hexdigest()[:12]
+
+    @property
+    def has_parameters(self) -> bool:
+        return re.search(r"@\w+", self.sql) is not None
+
+    @property
+    def warmed(self) -> bool:
+        """Whether `warm_up` runs the query: used by a page and without parameters."""
+        return bool(self.pages) and not self.has_parameters
+
+
+@dataclass
+class QueryStats:
+    """Accounting of the executions (cache misses) of one registered query."""
+
+    executions: int = 0
+    bytes_processed: int = 0
+    slot_millis: int = 0
+    rows: int = 0
+    result_bytes: int = 0
+    last_executed: Optional[str] = None
+
+
+REGISTRY: Dict[str, RegisteredQuery] = {}
+
+_stats: Dict[str, QueryStats] = {}
+_stats_lock = threading.Lock()
+
+
+def normalise_sql(sql: str) -> str:
+    """Collapses whitespace, so that formatting changes do not change a query's key."""
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def register_query(
+    name: str, sql: str, pages: Tuple[str, ...] = (), as_dataframe: bool = True
+) -> RegisteredQuery:
+    """
+    Registers a named query.
+
+    Parameters:
+    - name (str): Name the query is run by.
+    - sql (str): Query in BigQuery dialect. `{project_id}` is substituted;
+      everything else variable must be a `@parameter`.
+    - pages (Tuple[str, ...]): Names of the pages that use the query.
+    - as_dataframe (bool): Whether pages read the result as a DataFrame or
+      as a list of dicts.
+
+    Returns:
+    - RegisteredQuery: The registered query.
+    """
+    query = RegisteredQuery(
+        name, sql.format(project_id=project_id), tuple(pages), as_dataframe
+    )
+    REGISTRY[name] = query
+    return query
+
+
+def cache_key(name: str, params: Dict[str, Any]) -> Tuple:
+    """
+    Returns the cache key of a registered query run: its name, the fingerprint
+    of its normalised SQL, and its parameters sorted by name.
+    """
+    return (
+        name,
+        REGISTRY[name].fingerprint,
+        tuple(sorted(params.items())),
+    )
+
+
+def _record(name: str, arrow_table, job_stats: Dict[str, Optional[int]]):
+    with _stats_lock:
+        stats = _stats.setdefault(name, QueryStats())
+        stats.executions += 1
+        stats.bytes_processed += job_stats["bytes_processed"] or 0
+        stats.slot_millis += job_stats["slot_millis"] or 0
+        stats.rows += arrow_table.num_rows
+        stats.result_bytes += arrow_table.nbytes
+        stats.last_executed = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def execute_registered_query(name: str, **params) -> pa.Table:
+    """
+    Runs a registered query without caching its result, recording its stats.
+    For callers that keep the result themselves.
+    """
+    if name not in REGISTRY:
+        raise KeyError(f"No registered query named {name!r}")
+    with track_query(name, cached=False):
+        arrow_table, job_stats = execute_query(REGISTRY[name].sql, params)
+    _record(name, arrow_table, job_stats)
+    return arrow_table
+
+
+def _execute_shared(key: Tuple) -> pa.Table:
+    # through the cache shared by the server processes, if one is configured:
+    # with CACHE_MODE "swr" a stored result is used while the data version it
+    # was loaded for is current, and otherwise for as long as by st.cache_data
+    name, _, params = key
+    store = shared_store()
+    if store is None:
+        return execute_registered_query(name, **dict(params))
+    if CACHE_MODE == "swr":
+        freshness = {"version": repr(_fresh.current_version())}
+    else:
+        freshness = {"max_age": 6000}
+    return store.get_or_load(
+        key, lambda: execute_registered_query(name, **dict(params)), **freshness
+    )
+
+
+def _load(key: Tuple, as_dataframe: bool):
+    name = key[0]
+    arrow_table = _execute_shared(key)
+
+    if as_dataframe:
+        frame = compact_dtypes(arrow_to_dataframe(arrow_table))
+        # see derived.dataset_version
+        frame.attrs["version"] = f"{name}@{datetime.now(timezone.utc).isoformat()}"
+        return frame
+    # list of dicts, as returned by run_query
+    return arrow_table.to_pylist()
+
+
+@st.cache_data(ttl=6000, max_entries=MAX_CACHE_ENTRIES, show_spinner=False)
+def _run_cached(key: Tuple, as_dataframe: bool):
+    return _load(key, as_dataframe)
+
+
+def data_version() -> Tuple:
+    """
+    Returns a token that changes when the app's data does: the last modified
+    time of every table in `SNAPSHOT_TABLES`, read from the table metadata (no
+    query, nothing billed), or the time of every snapshot offline. Falls back
+    to the latest sitting date and number of sittings in `fact_sittings` when
+    the metadata cannot be read.
+    """
+    if DATA_BACKEND == "snapshot":
+        return tuple(
+            (table, entry["snapshot_at"])
+            for table, entry in sorted(read_manifest().items())
+        )
+
+    from google.api_core.exceptions import GoogleAPIError
+
+    client = get_client()
+    try:
+        return tuple(
+            (table, client.get_table(f"{project_id}.{table}").modified.isoformat())
+            for table in SNAPSHOT_TABLES
+        )
+    except GoogleAPIError:
+        return tuple(execute_registered_query("latest_sitting").to_pylist()[0].items())
+
+
+# Results of registered queries with CACHE_MODE "swr", shared by all sessions.
+_fresh = StaleWhileRevalidateCache(data_version, max_entries=MAX_CACHE_ENTRIES)
+
+
+def on_data_change(callback):
+    """
+    Registers a function called (from the background refresher) after the
+    registered query results were reloaded for new data. Only with
+    CACHE_MODE "swr".
+    """
+    _fresh.on_change(callback)
+
+
+def run_registered_query(name: str, as_dataframe: bool = True, **params):
+    """
+    Runs a registered query, cached by `cache_key`.
+
+    Parameters:
+    - name (str): Name of the registered query.
+    - as_dataframe (bool): Whether to return a DataFrame or a list of dicts.
+    - **params: Values of the query's parameters.
+
+    Returns:
+    - pd.DataFrame or List[dict]: The query result.
+    """
+    if name not in REGISTRY:
+        raise KeyError(f"No registered query named {name!r}")
+    key = cache_key(name, params)
+    with track_query(name) as event:
+        if CACHE_MODE == "swr":
+            result = _fresh.get(
+                (key, as_dataframe),
+                lambda: _load(key, as_dataframe),
+                # only the results warmed at boot are reloaded on a data
+                # change, the others (e.g. one per filter) are dropped
+                revalidate=REGISTRY[name].warmed,
+            )
+            # a copy, as st.cache_data would return, so that pages can modify it
+            if as_dataframe:
+                result = result.copy()
+            else:
+                result = [dict(row) for row in result]
+        else:
+            result = _run_cached(key, as_dataframe)
+        event.rows = len(result)
+    return result
+
+
+def _table_row_count(table: str) -> int:
+    if DATA_BACKEND == "snapshot":
+        return read_manifest()[table]["rows"]
+    metadata = get_client().get_table(f"{project_id}.{table}")
+    if metadata.num_rows is None:
+        # a view (or another table without a stored row count): counted
+        arrow_table, _ = execute_query(
+            f"select count(*) as row_count from `{project_id}.{table}`"
+        )
+        return arrow_table.column("row_count")[0].as_py()
+    # plus the rows still in the streaming buffer, not in num_rows yet
+    streaming_buffer = metadata.streaming_buffer
+    buffered_rows = (streaming_buffer.estimated_rows or 0) if streaming_buffer else 0
+    return metadata.num_rows + buffered_rows
+
+
+@st.cache_data(ttl=6000, show_spinner=False)
+def _table_row_count_cached(table: str) -> int:
+    return _table_row_count(table)
+
+
+def table_row_count(table: str) -> int:
+    """
+    Returns the number of rows of a table (e.g. `prod_mart.mart_bills`) from
+    its metadata, without running a query, or by counting them for a view.
+    Cached like registered queries.
+    """
+    if CACHE_MODE == "swr":
+        return _fresh.get(
+            ("table_row_count", table),
+            lambda: _table_row_count(table),
+            revalidate=False,
+        )
+    return _table_row_count_cached(table)
+
+
+def warm_up(exclude: Tuple[str, ...] = ()):
+    """
+    Runs every registered query used by a page and without parameters, in the
+    form pages read it, so that no visitor waits for them.
+
+    Parameters:
+    - exclude (Tuple[str, ...]): Names of queries not to run, e.g. those pages
+      only read through an `IncrementalTable`.
+    """
+    names = [
+        name for name, query in REGISTRY.items() if query.warmed and name not in exclude
+    ]
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_QUERIES) as executor:
+        futures = [
+            executor.submit(
+                run_registered_query, name, as_dataframe=REGISTRY[name].as_dataframe
+            )
+            for name in names
+        ]
+        for future in futures:
+            future.result()
+
+
+def cache_freshness() -> Dict[str, Any]:
+    """Returns the state of the results kept with CACHE_MODE "swr"."""
+    return {
+        "cache_mode": CACHE_MODE,
+        "results": len(_fresh),
+        "last_checked": _fresh.last_checked,
+        "last_changed": _fresh.last_changed,
+    }
+
+
+def query_stats() -> pd.DataFrame:
+    """
+    Returns one row per registered query with the pages using it and the
+    totals of its executions: bytes processed, slot time, rows and result size.
+    """
+    with _stats_lock:
+        rows = [
+            {
+                "name": name,
+                "pages": ", ".join(query.pages),
+                **asdict(_stats.get(name, QueryStats())),
+            }
+            for name, query in REGISTRY.items()
+        ]
+    return pd.DataFrame(rows)
+
+
+def queries_by_page() -> Dict[str, List[str]]:
+    """Returns the names of the registered queries used by each page."""
+    pages: Dict[str, List[str]] = {}
+    for name, query in REGISTRY.items():
+        for page in query.pages:
+            pages.setdefault(page, []).append(name)
+    return pages
+
+
+# Queries used by the app. The landing page is `Singapore_Parliament_Speeches`,
+# other pages are named after their file in `pages/`.
+
+# change detection, see data_version
+register_query(
+    "latest_sitting",
+    """
+    select max(date) as latest_date, count(*) as count_sittings
+    from `{project_id}.prod_fact.fact_sittings`
+    """,
+)
+
+register_query(
+    "dataset_overview",
+    """
+    select min(date) as earliest_date, max(date) as latest_date, count(*) as count_sittings
+    from `{project_id}.prod_fact.fact_sittings`
+    """,
+    pages=("Singapore_Parliament_Speeches",),
+    as_dataframe=False,
+)
+
+register_query(
+    "member_counts",
+    """
+    select
+        countif(members.latest_sitting = sittings.latest_date) as count_current_members,
+        count(*) as count_members
+    from `{project_id}.prod_dim.dim_members` as members
+    cross join (
+        select max(date) as latest_date from `{project_id}.prod_fact.fact_sittings`
+    ) as sittings
+    where members.member_name != ''
+    """,
+    pages=("Singapore_Parliament_Speeches",),
+    as_dataframe=False,
+)
+
+register_query(
+    "speech_counts",
+    """
+    select
+        countif(is_primary_question) as count_primary_questions,
+        count(distinct topic_id) as count_topics,
+        count(*) as count_speeches
+    from `{project_id}.prod_mart.mart_speeches`
+    """,
+    pages=("Singapore_Parliament_Speeches",),
+    as_dataframe=False,
+)
+
+
+register_query(
+    "member_list",
+    """
+    select
+        member_name,
+        member_birth_year,
+        member_image_link,
+        trim(latest_member_constituency) as constituency,
+        party,
+        earliest_sitting,
+        latest_sitting,
+        count_sittings_present,
+        count_sittings_total,
+        latest_sitting = max(latest_sitting) over() as is_active
+    from `{project_id}.prod_dim.dim_members`
+    where member_name != '' and member_name is not null
+    """,
+    pages=("0_Leaderboard", "1_By_Members", "2_By_Constituencies", "test"),
+)
+
+register_query(
+    "member_positions",
+    """
+    select * from `{project_id}.prod_fact.fact_member_positions`
+    """,
+    pages=("1_By_Members", "2_By_Constituencies"),
+)
+
+MEMBER_SPEECH_METRICS_SQL = """
+    select
+        parliament,
+        year,
+        month,
+        member_name,
+        member_party,
+        member_constituency,
+
+        count_sittings_total,
+        count_sittings_present as count_sittings_attended,
+        count_sittings_spoken,
+        count_topics,
+        count_pri_questions,
+        count_speeches,
+
+        count_words,
+        count_sentences,
+        count_syllables
+    from `{project_id}.prod_agg.agg_speech_metrics_by_member`
+"""
+
+register_query(
+    "member_speech_metrics",
+    MEMBER_SPEECH_METRICS_SQL,
+    pages=("0_Leaderboard", "1_By_Members", "2_By_Constituencies", "test"),
+)
+
+# months from @since_period (year * 100 + month) onwards, for incremental refreshes
+register_query(
+    "member_speech_metrics_since",
+    MEMBER_SPEECH_METRICS_SQL
+    + """
+    where year * 100 + month >= @since_period
+    """,
+    pages=("0_Leaderboard", "1_By_Members", "2_By_Constituencies", "test"),
+)
+
+# A page of bills after a cursor (see bills.Cursor), in each sort order. One
+# row more than a page is fetched, to tell whether there is a next page.
+BILLS_PAGE_SIZE = 25
+
+BILLS_PAGE_SQL = """
+    select bill_number, title, date_introduced
+    from `{{project_id}}.prod_mart.mart_bills`
+    where date_introduced between @start_date and @end_date
+        and (@title = '' or strpos(lower(title), lower(@title)) > 0)
+        and (
+            date_introduced {comparison} @after_date
+            or (date_introduced = @after_date and bill_number {comparison} @after_bill_number)
+        )
+    order by date_introduced {direction}, bill_number {direction}
+    limit {limit}
+"""
+
+register_query(
+    "bills_newest_first",
+    BILLS_PAGE_SQL.format(comparison="<", direction="desc", limit=BILLS_PAGE_SIZE + 1),
+    pages=("6_Bills",),
+)
+
+register_query(
+    "bills_oldest_first",
+    BILLS_PAGE_SQL.format(comparison=">", direction="asc", limit=BILLS_PAGE_SIZE + 1),
+    pages=("6_Bills",),
+)
+
+# speeches of sittings after @since, for the search index (see search.SpeechIndex)
+register_query(
+    "speeches_since",
+    """
+    select
+        speech_id,
+        date,
+        member_name,
+        topic_id,
+        topic_title,
+        is_primary_question,
+        text
+    from `{project_id}.prod_mart.mart_speeches`
+    where date > @since
+    """,
+    pages=("4_Speeches",),
+)
+
+# speeches by topic, member and month from @since_period (year * 100 + month),
+# for the topic matrix (see topics.TopicTrends)
+register_query(
+    "topic_counts_since",
+    """
+    select
+        topic_id,
+        any_value(topic_title) as topic_title,
+        member_name,
+        extract(year from date) as year,
+        extract(month from date) as month,
+        count(*) as count_speeches
+    from `{project_id}.prod_mart.mart_speeches`
+    where extract(year from date) * 100 + extract(month from date) >= @since_period
+    group by topic_id, member_name, year, month
+    """,
+    pages=("5_Topics",),
+)
+
+register_query(
+    "primary_question_topics",
+    """
+    select member_name, ministry_addressed, count(*) as count_pri_questions
+    from `{project_id}.prod_agg.agg_pri_questions_topics_by_member`
+    group by all
+    """,
+    pages=("1_By_Members",),
+)
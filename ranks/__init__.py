@@ -0,0 +1,142 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from cube import MetricCube
+
+RANKED_METRICS = [
+    "attendance",
+    "participation_rate",
+    "topics_per_sitting",
+    "questions_per_sitting",
+    "words_per_sitting",
+    "readability",
+]
+
+
+class MetricRanks:
+    """
+    Percentiles, ranks, averages and bands of metrics across members, from
+    sorted copies of each metric built once. Lookups are binary searches
+    (`np.searchsorted`), for one score or for all members at once.
+
+    Missing values are left out of the distribution, and get missing results.
+
+    Parameters:
+    - aggregated (pd.DataFrame): Metrics with one row per member (or per
+      group), e.g. the output of `aggregate_member_metrics`.
+    - metrics (List[str]): Metric columns to rank.
+    """
+
+    def __init__(self, aggregated: pd.DataFrame, metrics: List[str] = RANKED_METRICS):
+        self.frame = aggregated.reset_index(drop=True)
+        self._values = {
+            metric: self.frame[metric].to_numpy(dtype="float64") for metric in metrics
+        }
+        self._sorted = {
+            metric: np.sort(values[~np.isnan(values)])
+            for metric, values in self._values.items()
+        }
+        self._ranks = {
+            metric: self.rank(metric, values) for metric, values in self._values.items()
+        }
+
+    def percentile(self, metric: str, scores):
+        """
+        Returns the percentile of scores in the metric's distribution, as
+        `scipy.stats.percentileofscore(..., kind="rank")`.
+        """
+        sorted_values = self._sorted[metric]
+        scores = np.asarray(scores, dtype="float64")
+        left = np.searchsorted(sorted_values, scores, side="left")
+        right = np.searchsorted(sorted_values, scores, side="right")
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result = (left + right + (right > left)) * (50.0 / len(sorted_values))
+        return np.where(np.isnan(scores), np.nan, result)[()]
+
+    def rank(self, metric: str, scores, ascending: bool = False):
+        """
+        Returns the rank of scores among the metric's values, ties sharing the
+        lowest rank, as `Series.rank(ascending=ascending, method="min")`.
+        """
+        sorted_values = self._sorted[metric]
+        scores = np.asarray(scores, dtype="float64")
+        if ascending:
+            ranks = np.searchsorted(sorted_values, scores, side="left") + 1
+        else:
+            ranks = (
+                len(sorted_values)
+                - np.searchsorted(sorted_values, scores, side="right")
+                + 1
+            )
+        return np.where(np.isnan(scores), np.nan, ranks)[()]
+
+    def average(self, metric: str, exclude_zero: bool = False) -> float:
+        """Returns the mean of the metric, optionally leaving out zeros."""
+        values = self._sorted[metric]
+        if exclude_zero:
+            values = values[values != 0]
+        return float(values.mean()) if len(values) else float("nan")
+
+    def band_edges(self, metric: str, bands: int = 4) -> np.ndarray:
+        """Returns the inner edges of `bands` equal-sized bands, e.g. quartiles."""
+        return np.quantile(self._sorted[metric], np.arange(1, bands) / bands)
+
+    def band(self, metric: str, scores, bands: int = 4):
+        """
+        Returns the band of scores, from 1 (lowest) to `bands` (highest), e.g.
+        the quartile for `bands=4` or the decile for `bands=10`.
+        """
+        scores = np.asarray(scores, dtype="float64")
+        result = (
+            np.searchsorted(self.band_edges(metric, bands), scores, side="right") + 1
+        )
+        return np.where(np.isnan(scores), np.nan, result)[()]
+
+    def _by_row(self, values) -> pd.Series:
+        return pd.Series(values, index=self.frame.index)
+
+    def all_percentiles(self, metric: str) -> pd.Series:
+        """Returns the percentile of every row of `frame`."""
+        return self._by_row(self.percentile(metric, self._values[metric]))
+
+    def all_ranks(self, metric: str) -> pd.Series:
+        """Returns the (descending) rank of every row of `frame`, precomputed."""
+        return self._by_row(self._ranks[metric])
+
+    def all_bands(self, metric: str, bands: int = 4) -> pd.Series:
+        """Returns the band of every row of `frame`."""
+        return self._by_row(self.band(metric, self._values[metric], bands))
+
+
+def build_metric_ranks(
+    cube: MetricCube,
+    group_by_fields: List[str],
+    parliaments: Dict[str, List[int]],
+) -> Dict[Optional[str], MetricRanks]:
+    """
+    Builds `MetricRanks` for every parliament selection.
+
+    Parameters:
+    - cube (MetricCube): Cube of the speech summary data for all members.
+    - group_by_fields (List[str]): Fields identifying a ranked row, e.g. ['member_name'].
+    - parliaments (Dict[str, List[int]]): Parliament selections, by name.
+
+    Returns:
+    - Dict[Optional[str], MetricRanks]: Ranks by selection name. Rows are
+      aggregated by parliament first and then across the selection, as on the
+      Leaderboard. The key None ranks all data aggregated in one step.
+    """
+    metric_ranks = {
+        name: MetricRanks(
+            cube.rollup(
+                group_by_fields,
+                filters={"parliament": selection},
+                attended_within=["parliament"],
+            )
+        )
+        for name, selection in parliaments.items()
+    }
+    metric_ranks[None] = MetricRanks(cube.rollup(group_by_fields))
+    return metric_ranks
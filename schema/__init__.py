@@ -0,0 +1,92 @@
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+# Low-cardinality text columns, stored once per distinct value.
+CATEGORICAL_COLUMNS = [
+    "member_name",
+    "member_party",
+    "member_constituency",
+    "constituency",
+    "party",
+    "type",
+    "ministry_addressed",
+]
+
+# Date columns, parsed to datetime64 once when a frame is loaded.
+DATE_COLUMNS = [
+    "earliest_sitting",
+    "latest_sitting",
+    "effective_from_date",
+    "effective_to_date",
+]
+
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Casts the columns of a frame to compact dtypes, in place: text columns in
+    `CATEGORICAL_COLUMNS` to categoricals, integer count_* columns to the
+    smallest integer type that holds their values, and `DATE_COLUMNS` to
+    datetime64.
+
+    Counts are downcast again every time a frame is loaded, so a type only
+    has to hold the current values. Sums of downcast columns (`Series.sum`,
+    `groupby(...).sum()`) are still computed in int64.
+
+    Parameters:
+    - df (pd.DataFrame): Frame to compact.
+
+    Returns:
+    - pd.DataFrame: The same frame, with compact dtypes.
+    """
+    for col in df.columns:
+        if col in CATEGORICAL_COLUMNS:
+            if not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype("category")
+        elif col in DATE_COLUMNS:
+            if not pd.api.types.is_datetime64_any_dtype(df[col]):
+                df[col] = pd.to_datetime(df[col])
+        elif col.startswith("count_") and pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+    return df
+
+
+def format_date(value) -> str:
+    """Formats a date as in the source tables, e.g. '2012-09-10'."""
+    return value.strftime(DATE_FORMAT) if pd.notna(value) else str(None)
+
+
+def frame_memory(df: pd.DataFrame) -> int:
+    """Returns the memory used by a frame in bytes, including its index and strings."""
+    return int(df.memory_usage(deep=True).sum())
+
+
+def memory_report(frames: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """
+    Compares the memory used by frames before and after `compact_dtypes`.
+
+    Parameters:
+    - frames (Dict[str, pd.DataFrame]): Frames as loaded, by dataset name.
+      They are not modified.
+
+    Returns:
+    - pd.DataFrame: One row per dataset with its rows, the memory used
+      before and after (in MB), and the share saved.
+    """
+    rows = []
+    for name, frame in frames.items():
+        before = frame_memory(frame)
+        after = frame_memory(compact_dtypes(frame.copy()))
+        rows.append(
+            {
+                "dataset": name,
+                "rows": len(frame),
+                "before_mb": before / 1e6,
+                "after_mb": after / 1e6,
+                "saved": 1 - after / before if before else np.nan,
+            }
+        )
+    return pd.DataFrame(rows)
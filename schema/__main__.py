@@ -0,0 +1,32 @@
+"""
+Reports the memory used by the cached datasets, before and after compacting.
+
+Usage:
+    python -m schema                    # from BigQuery, or local snapshots
+                                        # with PARL_DATA_BACKEND=snapshot
+"""
+import argparse
+
+from queries import execute_registered_query
+from schema import memory_report
+from utils import arrow_to_dataframe
+
+# registered queries behind get_member_list, get_member_positions,
+# get_all_member_speeches and primary_question_topics
+CACHED_DATASETS = [
+    "member_list",
+    "member_positions",
+    "member_speech_metrics",
+    "primary_question_topics",
+]
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+parser.add_argument("datasets", nargs="*", default=CACHED_DATASETS)
+args = parser.parse_args()
+
+report = memory_report(
+    {name: arrow_to_dataframe(execute_registered_query(name)) for name in args.datasets}
+)
+print(report.to_string(index=False, float_format=lambda value: f"{value:.3f}"))
+before, after = report["before_mb"].sum(), report["after_mb"].sum()
+print(f"\ntotal: {before:.3f} MB -> {after:.3f} MB ({1 - after / before:.0%} saved)")
@@ -0,0 +1,535 @@
+import fcntl
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from queries import execute_registered_query
+from snapshots import SNAPSHOT_DIR
+
+SEARCH_DIR = os.environ.get(
+    "PARL_SEARCH_DIR", os.path.join(os.path.dirname(SNAPSHOT_DIR), "search")
+)
+MANIFEST_FILE = "index.json"
+
+# Columns of mart_speeches kept in the index and shown with results.
+DOC_COLUMNS = [
+    "speech_id",
+    "date",
+    "member_name",
+    "topic_id",
+    "topic_title",
+    "is_primary_question",
+    "text",
+]
+
+# Segments are merged into one beyond this many, so that a search does not
+# have to visit one segment per update.
+MAX_SEGMENTS = 8
+
+# Merged segments are removed once they have been out of the index this long,
+# as other server processes search them until their next `update`.
+OBSOLETE_SEGMENT_SECONDS = 3600
+
+# BM25 parameters: term frequency saturation and length normalisation.
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+PAGE_SIZE = 20
+SNIPPET_WORDS = 40
+
+TOKEN_PATTERN = re.compile(r"\w+")
+PHRASE_PATTERN = re.compile(r'"([^"]*)"')
+MARKDOWN_SPECIAL = re.compile(r"([\\`*_{}\[\]()#+\-.!|$<>~])")
+
+
+def tokenize(text: str) -> List[str]:
+    """Splits text into lowercase words."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def parse_query(query: str) -> Tuple[List[str], List[List[str]]]:
+    """
+    Parses a search query into its words and its phrases (quoted parts), e.g.
+    `housing "cost of living"` into ['housing', 'cost', 'of', 'living'] and
+    [['cost', 'of', 'living']]. Every word must be in a result; the words of
+    a phrase must also be next to each other, in order.
+    """
+    phrases = [tokenize(phrase) for phrase in PHRASE_PATTERN.findall(query)]
+    phrases = [phrase for phrase in phrases if len(phrase) > 1]
+    return list(dict.fromkeys(tokenize(query))), phrases
+
+
+def _write_array(directory: str, name: str, array: np.ndarray):
+    np.save(os.path.join(directory, f"{name}.npy"), array, allow_pickle=False)
+
+
+def _read_array(directory: str, name: str) -> np.ndarray:
+    return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+
+
+def build_segment(speeches: pa.Table, directory: str):
+    """
+    Writes an inverted index over a batch of speeches to `directory`:
+
+    - docs.arrow: the speeches (`DOC_COLUMNS`) and their length in words,
+    - terms.arrow: the vocabulary, in term id order,
+    - term_offsets, doc_ids, tfs: for each term, the speeches it occurs in
+      (sorted) and how often, as `doc_ids[term_offsets[t]:term_offsets[t + 1]]`,
+    - position_offsets, positions: for each of those postings, the positions
+      of the term in the speech, for phrase queries.
+
+    Every file is read memory-mapped, see `Segment`.
+    """
+    texts = speeches.column("text").fill_null("").to_pylist()
+    tokens = [tokenize(text) for text in texts]
+    lengths = np.fromiter((len(words) for words in tokens), np.int32, len(tokens))
+
+    vocabulary: Dict[str, int] = {}
+    term_ids = np.fromiter(
+        (
+            vocabulary.setdefault(word, len(vocabulary))
+            for words in tokens
+            for word in words
+        ),
+        np.int32,
+        int(lengths.sum()),
+    )
+    doc_ids = np.repeat(np.arange(len(tokens), dtype=np.int32), lengths)
+    positions = np.arange(len(term_ids), dtype=np.int32) - np.repeat(
+        (np.cumsum(lengths) - lengths).astype(np.int32), lengths
+    )
+
+    # one posting per (term, speech), with the positions of the term in it
+    order = np.lexsort((positions, doc_ids, term_ids))
+    term_ids, doc_ids, positions = term_ids[order], doc_ids[order], positions[order]
+    starts = np.flatnonzero(
+        np.r_[True, (term_ids[1:] != term_ids[:-1]) | (doc_ids[1:] != doc_ids[:-1])]
+    )
+    position_offsets = np.r_[starts, len(positions)].astype(np.int64)
+    term_offsets = np.searchsorted(
+        term_ids[starts], np.arange(len(vocabulary) + 1)
+    ).astype(np.int64)
+
+    os.makedirs(directory, exist_ok=True)
+    docs = speeches.select(DOC_COLUMNS).append_column("length", pa.array(lengths))
+    with pa.OSFile(os.path.join(directory, "docs.arrow"), "wb") as sink:
+        with pa.ipc.new_file(sink, docs.schema) as writer:
+            writer.write_table(docs)
+    terms = pa.table({"term": pa.array(list(vocabulary), pa.string())})
+    with pa.OSFile(os.path.join(directory, "terms.arrow"), "wb") as sink:
+        with pa.ipc.new_file(sink, terms.schema) as writer:
+            writer.write_table(terms)
+    _write_array(directory, "term_offsets", term_offsets)
+    _write_array(directory, "doc_ids", doc_ids[starts])
+    _write_array(directory, "tfs", np.diff(position_offsets).astype(np.int32))
+    _write_array(directory, "position_offsets", position_offsets)
+    _write_array(directory, "positions", positions)
+
+
+class Segment:
+    """
+    One immutable part of the index, built by `build_segment`. Its files are
+    memory-mapped, so opening it reads little more than its vocabulary, and
+    the pages a search touches are cached by the operating system.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.docs = pa.ipc.open_file(
+            pa.memory_map(os.path.join(directory, "docs.arrow"))
+        ).read_all()
+        terms = pa.ipc.open_file(
+            pa.memory_map(os.path.join(directory, "terms.arrow"))
+        ).read_all()
+        self.term_ids = {term: i for i, term in enumerate(terms["term"].to_pylist())}
+        self.lengths = self.docs["length"].to_numpy()
+        self.term_offsets = _read_array(directory, "term_offsets")
+        self.doc_ids = _read_array(directory, "doc_ids")
+        self.tfs = _read_array(directory, "tfs")
+        self.position_offsets = _read_array(directory, "position_offsets")
+        self.positions = _read_array(directory, "positions")
+
+    def __len__(self) -> int:
+        return self.docs.num_rows
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray, int]:
+        """Returns the speeches a term occurs in, its frequency in them and its first posting."""
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            return np.empty(0, np.int32), np.empty(0, np.int32), 0
+        start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+        return self.doc_ids[start:end], self.tfs[start:end], int(start)
+
+    def filter_mask(
+        self,
+        members: Optional[Sequence[str]],
+        start_date: Optional[date],
+        end_date: Optional[date],
+        topic: Optional[str],
+        primary_questions_only: bool,
+    ) -> Optional[np.ndarray]:
+        """Returns which speeches pass the filters, or None without filters."""
+        conditions = []
+        if members:
+            conditions.append(
+                pc.is_in(self.docs["member_name"], value_set=pa.array(list(members)))
+            )
+        if start_date is not None:
+            conditions.append(
+                pc.greater_equal(self.docs["date"], pa.scalar(start_date))
+            )
+        if end_date is not None:
+            conditions.append(pc.less_equal(self.docs["date"], pa.scalar(end_date)))
+        if topic:
+            conditions.append(
+                pc.match_substring(self.docs["topic_title"], topic, ignore_case=True)
+            )
+        if primary_questions_only:
+            conditions.append(self.docs["is_primary_question"])
+        if not conditions:
+            return None
+        mask = conditions[0]
+        for condition in conditions[1:]:
+            mask = pc.and_(mask, condition)
+        # a missing value (e.g. no topic title) does not pass
+        return pc.fill_null(mask, False).to_numpy(zero_copy_only=False)
+
+    def _positions(self, posting_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # positions of the given postings, each with the index of its posting
+        starts = self.position_offsets[posting_ids]
+        counts = self.position_offsets[posting_ids + 1] - starts
+        indices = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(
+            counts.sum()
+        )
+        return np.repeat(np.arange(len(posting_ids)), counts), self.positions[indices]
+
+    def phrase_matches(self, docs: np.ndarray, phrase: List[str]) -> np.ndarray:
+        """
+        Returns which of `docs`, each containing every word of the phrase,
+        contain the phrase.
+        """
+        keys = None
+        for offset, word in enumerate(phrase):
+            word_docs, _, first = self.postings(word)
+            owners, positions = self._positions(
+                first + np.searchsorted(word_docs, docs)
+            )
+            # where the phrase would start, by speech
+            starts = positions.astype(np.int64) - offset
+            word_keys = owners[starts >= 0].astype(np.int64) << 32 | starts[starts >= 0]
+            keys = (
+                word_keys
+                if keys is None
+                else np.intersect1d(keys, word_keys, assume_unique=True)
+            )
+        matches = np.zeros(len(docs), dtype=bool)
+        matches[np.unique(keys >> 32)] = True
+        return matches
+
+
+@dataclass
+class SearchResults:
+    """One page of search results, best first, and the number of results in total."""
+
+    total: int
+    page: int
+    page_size: int
+    hits: pd.DataFrame
+    elapsed_ms: float
+
+    @property
+    def pages(self) -> int:
+        return max(math.ceil(self.total / self.page_size), 1)
+
+
+def snippet(text: str, words: Sequence[str], length: int = SNIPPET_WORDS) -> str:
+    """
+    Returns about `length` words of a speech around the first of `words` it
+    contains, as Markdown with those words in bold.
+    """
+    matches = list(TOKEN_PATTERN.finditer(text or ""))
+    wanted = set(words)
+    first = next(
+        (i for i, match in enumerate(matches) if match.group().lower() in wanted), 0
+    )
+    start = max(first - length // 4, 0)
+    window = matches[start : start + length]
+    if not window:
+        return ""
+
+    parts = []
+    previous_end = window[0].start()
+    for match in window:
+        parts.append(MARKDOWN_SPECIAL.sub(r"\\\1", text[previous_end : match.start()]))
+        word = MARKDOWN_SPECIAL.sub(r"\\\1", match.group())
+        parts.append(f"**{word}**" if match.group().lower() in wanted else word)
+        previous_end = match.end()
+    prefix = "… " if start > 0 else ""
+    suffix = " …" if start + length < len(matches) else ""
+    return prefix + "".join(parts) + suffix
+
+
+class SpeechIndex:
+    """
+    Full-text index over `prod_mart.mart_speeches`, kept on disk as segments
+    (see `build_segment`) and searched memory-mapped.
+
+    `update` indexes the speeches of sittings after the latest one indexed as
+    a new segment, so its cost tracks the new sittings rather than the size of
+    the index. Segments are merged when there are more than `MAX_SEGMENTS`.
+    Searches read the segments opened last and never wait for an update.
+
+    Server processes can share `directory`: updates take a file lock and
+    start from the index the last one wrote, and merged segments are only
+    removed after `OBSOLETE_SEGMENT_SECONDS`, by then out of every process's
+    index.
+
+    Parameters:
+    - directory (str): Directory to keep the index in.
+    - query (str): Registered query returning the speeches after its `@since`
+      date parameter.
+    """
+
+    def __init__(self, directory: str = SEARCH_DIR, query: str = "speeches_since"):
+        self.directory = directory
+        self.query = query
+        self.segments: List[Segment] = []
+        self.latest_date: Optional[date] = None
+        # the manifest the segments were opened from
+        self._manifest: Optional[dict] = None
+        self.lock = threading.Lock()
+        self._open(self._read_manifest())
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.directory, MANIFEST_FILE)
+
+    def _read_manifest(self) -> Optional[dict]:
+        try:
+            with open(self._manifest_path()) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _open(self, manifest: Optional[dict]):
+        if manifest is None:
+            return
+        self.segments = [
+            Segment(os.path.join(self.directory, name)) for name in manifest["segments"]
+        ]
+        self.latest_date = (
+            date.fromisoformat(manifest["latest_date"])
+            if manifest["latest_date"]
+            else None
+        )
+        self._manifest = manifest
+
+    @contextmanager
+    def _locked(self):
+        # exclusive between processes, and between threads (each opens the
+        # lock file itself)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(f"{self._manifest_path()}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write_manifest(self, obsolete: Dict[str, float]):
+        manifest = {
+            "segments": [
+                os.path.basename(segment.directory) for segment in self.segments
+            ],
+            "latest_date": self.latest_date.isoformat() if self.latest_date else None,
+            "docs": sum(len(segment) for segment in self.segments),
+            # merged segment -> time it was merged
+            "obsolete": obsolete,
+        }
+        tmp_path = f"{self._manifest_path()}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self._manifest_path())
+        self._manifest = manifest
+
+    def _new_segment_name(self) -> str:
+        # unique across processes
+        return f"segment_{time.time_ns()}_{os.getpid()}"
+
+    def update(self) -> int:
+        """
+        Indexes the speeches of sittings after the latest one indexed (all of
+        them the first time), starting from the index as last written by any
+        process. Returns the number of speeches added.
+        """
+        with self.lock, self._locked():
+            manifest = self._read_manifest()
+            if manifest is not None and manifest != self._manifest:
+                # updated by another process since this one opened the index
+                self._open(manifest)
+            obsolete = dict((manifest or {}).get("obsolete", {}))
+            expired = [
+                name
+                for name, merged_at in obsolete.items()
+                if time.time() - merged_at > OBSOLETE_SEGMENT_SECONDS
+            ]
+            for name in expired:
+                del obsolete[name]
+
+            since = self.latest_date or date(1900, 1, 1)
+            speeches = execute_registered_query(self.query, since=since)
+            if speeches.num_rows > 0:
+                name = self._new_segment_name()
+                build_segment(speeches, os.path.join(self.directory, name))
+                segments = self.segments + [Segment(os.path.join(self.directory, name))]
+                latest_date = max(
+                    filter(None, [self.latest_date, pc.max(speeches["date"]).as_py()])
+                )
+
+                if len(segments) > MAX_SEGMENTS:
+                    for segment in segments:
+                        obsolete[os.path.basename(segment.directory)] = time.time()
+                    name = self._new_segment_name()
+                    build_segment(
+                        pa.concat_tables([segment.docs for segment in segments]),
+                        os.path.join(self.directory, name),
+                    )
+                    segments = [Segment(os.path.join(self.directory, name))]
+
+                # searches in progress keep the segments they started with
+                self.segments, self.latest_date = segments, latest_date
+            elif not expired:
+                return 0
+
+            self._write_manifest(obsolete)
+            for name in expired:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+            return speeches.num_rows
+
+    def search(
+        self,
+        query: str,
+        members: Optional[Sequence[str]] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        topic: Optional[str] = None,
+        primary_questions_only: bool = False,
+        page: int = 0,
+        page_size: int = PAGE_SIZE,
+    ) -> SearchResults:
+        """
+        Searches the speeches, ranked by BM25 relevance to the query (latest
+        first without one).
+
+        Parameters:
+        - query (str): Words that must all occur, and quoted phrases, e.g.
+          `housing "cost of living"`.
+        - members (Optional[Sequence[str]]): Only speeches by these members.
+        - start_date, end_date (Optional[date]): Only speeches in this range.
+        - topic (Optional[str]): Only speeches whose topic title contains this.
+        - primary_questions_only (bool): Only primary questions.
+        - page (int): Page of results, from 0.
+        - page_size (int): Results per page.
+
+        Returns:
+        - SearchResults: The requested page of results, with a `snippet`
+          and `score` column.
+        """
+        start = time.perf_counter()
+        segments = self.segments
+        words, phrases = parse_query(query)
+
+        # collection statistics, for BM25
+        total_docs = sum(len(segment) for segment in segments)
+        average_length = (
+            sum(int(segment.lengths.sum()) for segment in segments) / total_docs
+            if total_docs
+            else 0.0
+        )
+        idf = {}
+        for word in words:
+            doc_frequency = sum(len(segment.postings(word)[0]) for segment in segments)
+            idf[word] = math.log(
+                1 + (total_docs - doc_frequency + 0.5) / (doc_frequency + 0.5)
+            )
+
+        # (segment, speech, score, date) of every match
+        matches = []
+        for segment_number, segment in enumerate(segments):
+            mask = segment.filter_mask(
+                members, start_date, end_date, topic, primary_questions_only
+            )
+            if words:
+                postings = [segment.postings(word) for word in words]
+                docs = postings[0][0]
+                for word_docs, _, _ in postings[1:]:
+                    docs = np.intersect1d(docs, word_docs, assume_unique=True)
+                docs = np.asarray(docs)
+                if mask is not None:
+                    docs = docs[mask[docs]]
+                for phrase in phrases:
+                    docs = docs[segment.phrase_matches(docs, phrase)]
+
+                lengths = segment.lengths[docs]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / average_length)
+                scores = np.zeros(len(docs))
+                for word, (word_docs, tfs, _) in zip(words, postings):
+                    tf = np.asarray(tfs[np.searchsorted(word_docs, docs)], float)
+                    scores += idf[word] * tf * (BM25_K1 + 1) / (tf + norm)
+            else:
+                docs = (
+                    np.flatnonzero(mask)
+                    if mask is not None
+                    else np.arange(len(segment))
+                )
+                scores = np.zeros(len(docs))
+
+            dates = (
+                segment.docs["date"].take(pa.array(docs)).cast(pa.int32()).to_numpy()
+            )
+            matches.append(
+                pd.DataFrame(
+                    {
+                        "segment": segment_number,
+                        "doc": docs,
+                        "score": scores,
+                        "date": dates,
+                    }
+                )
+            )
+
+        columns = DOC_COLUMNS + ["score", "snippet"]
+        if not matches:
+            hits = pd.DataFrame(columns=columns)
+            return SearchResults(0, page, page_size, hits, 0.0)
+
+        ranked = pd.concat(matches, ignore_index=True)
+        total = len(ranked)
+        top = ranked.sort_values(
+            ["score", "date"], ascending=False, kind="stable"
+        ).iloc[page * page_size : (page + 1) * page_size]
+
+        rows = []
+        for segment_number, doc, score in top[["segment", "doc", "score"]].itertuples(
+            index=False
+        ):
+            row = segments[segment_number].docs.slice(doc, 1).to_pylist()[0]
+            row["score"] = score
+            row["snippet"] = snippet(row["text"], words)
+            rows.append(row)
+        hits = pd.DataFrame(rows, columns=columns)
+        return SearchResults(
+            total, page, page_size, hits, (time.perf_counter() - start) * 1000
+        )
@@ -0,0 +1,42 @@
+import logging
+import os
+import threading
+import time
+
+from streamlit.runtime import Runtime
+
+logger = logging.getLogger("parl.serve")
+
+MAIN_SCRIPT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "Singapore_Parliament_Speeches.py",
+)
+
+
+def warm_up_when_ready(poll_seconds: float = 0.1):
+    """
+    Waits for the Streamlit runtime to start, so that results cached with
+    `st.cache_data` land in the server's caches, then warms them with
+    `agg_data.warm_up`.
+    """
+    while not Runtime.exists():
+        time.sleep(poll_seconds)
+    # imported once the runtime exists, for the same reason
+    import agg_data
+
+    start = time.perf_counter()
+    try:
+        agg_data.warm_up()
+    except Exception:
+        logger.exception("Warm-up failed; datasets will load on first use")
+    else:
+        logger.info("Warmed up in %.1f s", time.perf_counter() - start)
+
+
+def start_warm_up() -> threading.Thread:
+    """Warms the caches in the background, as soon as the server is up."""
+    thread = threading.Thread(
+        target=warm_up_when_ready, name="parl-warm-up", daemon=True
+    )
+    thread.start()
+    return thread
@@ -0,0 +1,17 @@
+"""
+Starts the app and warms every registered dataset in the background as soon
+as the server is up, so that no visitor waits on a cold cache.
+
+Usage:
+    python -m serve                         # takes the options of `streamlit run`
+    python -m serve --server.port 8080
+"""
+import sys
+
+from streamlit.web import cli
+
+from serve import MAIN_SCRIPT, start_warm_up
+
+start_warm_up()
+sys.argv = ["streamlit", "run", MAIN_SCRIPT, *sys.argv[1:]]
+sys.exit(cli.main())
@@ -0,0 +1,354 @@
+import fcntl
+import hashlib
+import math
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import pyarrow as pa
+
+# Query results shared by the server processes: "" (off, each process keeps
+# its own), "arrow" (Arrow IPC files on this host, in PARL_SHARED_CACHE_DIR),
+# a redis:// URL (a key-value store shared by several hosts) or "memory" (an
+# in-process stand-in for the key-value store, for development).
+SHARED_CACHE = os.environ.get("PARL_SHARED_CACHE", "")
+SHARED_CACHE_DIR = os.environ.get(
+    "PARL_SHARED_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "shared"),
+)
+
+# Upper bound on the number of results kept; the oldest is dropped first.
+MAX_FILES = 512
+
+# Seconds results are kept in the key-value store, which expires them itself
+# (as long as st.cache_data keeps them, by default).
+SHARED_CACHE_TTL_SECONDS = int(os.environ.get("PARL_SHARED_CACHE_TTL", 6000))
+
+# Longest wait for another process loading the same result, after which
+# this one loads it too.
+LOCK_TIMEOUT_SECONDS = 300
+POLL_INTERVAL_SECONDS = 0.1
+
+# Schema metadata written with every result.
+KEY_FIELD = b"parl.key"
+VERSION_FIELD = b"parl.version"
+WRITTEN_AT_FIELD = b"parl.written_at"
+
+
+def _hash(key: Hashable) -> str:
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+
+def _with_metadata(table: pa.Table, key: Hashable, version: Optional[str]) -> pa.Table:
+    return table.replace_schema_metadata(
+        {
+            **(table.schema.metadata or {}),
+            KEY_FIELD: repr(key).encode(),
+            VERSION_FIELD: (version or "").encode(),
+            WRITTEN_AT_FIELD: str(time.time()).encode(),
+        }
+    )
+
+
+def _is_fresh(
+    metadata: Optional[Dict[bytes, bytes]],
+    version: Optional[str],
+    max_age: Optional[float],
+) -> bool:
+    # whether a result was written for `version` (if given) and less than
+    # `max_age` seconds ago (if given)
+    metadata = metadata or {}
+    if WRITTEN_AT_FIELD not in metadata:
+        return False
+    if version is not None and metadata[VERSION_FIELD].decode() != version:
+        return False
+    if max_age is not None:
+        return time.time() - float(metadata[WRITTEN_AT_FIELD]) < max_age
+    return True
+
+
+class SharedResultStore(ABC):
+    """
+    Query results shared by several server processes, so that each result
+    is loaded (e.g. queried from BigQuery) by one process and read by all.
+    """
+
+    @abstractmethod
+    def get_or_load(
+        self,
+        key: Hashable,
+        load: Callable[[], pa.Table],
+        version: Optional[str] = None,
+        max_age: Optional[float] = None,
+    ) -> pa.Table:
+        """
+        Returns the stored result for `key` if it is fresh, and otherwise
+        calls `load` and stores its result. When several processes need the
+        same result at once, one loads it while the others wait for it.
+
+        Parameters:
+        - key (Hashable): Key of the result, e.g. a query and its parameters.
+        - load (Callable[[], pa.Table]): Loads the result.
+        - version (Optional[str]): Version of the data the result must be
+          for; a result stored for another version is reloaded.
+        - max_age (Optional[float]): Seconds after which a stored result is
+          reloaded.
+
+        Returns:
+        - pa.Table: The result.
+        """
+
+
+class ArrowFileStore(SharedResultStore):
+    """
+    Results as Arrow IPC files in a directory on this host, read memory-mapped:
+    every process maps the same file, so the operating system keeps one copy
+    of it in memory for all of them. Files are written under an exclusive
+    file lock per result and moved into place in one step, so readers never
+    see a partial file, and a process waiting for the lock reads the result
+    written meanwhile instead of loading it again.
+
+    Parameters:
+    - directory (str): Directory to keep the files in.
+    - max_files (int): Number of results kept.
+    """
+
+    def __init__(self, directory: str = SHARED_CACHE_DIR, max_files: int = MAX_FILES):
+        self.directory = directory
+        self.max_files = max_files
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: Hashable) -> str:
+        return os.path.join(self.directory, f"{_hash(key)}.arrow")
+
+    @contextmanager
+    def _locked(self, path: str):
+        # exclusive between processes, and between threads (each opens the
+        # lock file itself)
+        with open(f"{path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(
+        self, path: str, version: Optional[str], max_age: Optional[float]
+    ) -> Optional[pa.Table]:
+        try:
+            reader = pa.ipc.open_file(pa.memory_map(path, "r"))
+        except FileNotFoundError:
+            return None
+        if not _is_fresh(reader.schema.metadata, version, max_age):
+            return None
+        # the table's buffers are views of the mapped file
+        return reader.read_all()
+
+    def _write(self, path: str, table: pa.Table):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+
+    def _prune(self):
+        # (modified time, path) of the results; other processes may remove
+        # some of them (pruning too) meanwhile
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".arrow"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                files.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                continue
+        if len(files) <= self.max_files:
+            return
+        files.sort()
+        for _, path in files[: len(files) - self.max_files]:
+            # processes that mapped it keep reading it until they drop it; at
+            # worst, removing its lock lets two processes load it again at once
+            for stale in (path, f"{path}.lock"):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    # removed by another process pruning at the same time
+                    pass
+
+    def get_or_load(
+        self,
+        key: Hashable,
+        load: Callable[[], pa.Table],
+        version: Optional[str] = None,
+        max_age: Optional[float] = None,
+    ) -> pa.Table:
+        path = self._path(key)
+        table = self._read(path, version, max_age)
+        if table is not None:
+            return table
+
+        with self._locked(path):
+            # loaded by another process while this one waited for the lock
+            table = self._read(path, version, max_age)
+            if table is None:
+                self._write(path, _with_metadata(load(), key, version))
+                table = self._read(path, None, None)
+        self._prune()
+        return table
+
+
+class MemoryKeyValue:
+    """
+    An in-process stand-in for a key-value store, with the methods of a
+    `redis.Redis` client that `KeyValueStore` uses. For development and
+    testing without a server; it is not shared between processes.
+    """
+
+    def __init__(self):
+        # key -> (value, expiry time or None)
+        self._items: Dict[str, Tuple[bytes, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._items.get(name)
+            if item is None:
+                return None
+            if item[1] is not None and item[1] <= time.time():
+                del self._items[name]
+                return None
+            return item[0]
+
+    def set(
+        self, name: str, value: Any, ex: Optional[int] = None, nx: bool = False
+    ) -> bool:
+        value = value.encode() if isinstance(value, str) else bytes(value)
+        with self._lock:
+            item = self._items.get(name)
+            if nx and item is not None and (item[1] is None or item[1] > time.time()):
+                return False
+            self._items[name] = (value, time.time() + ex if ex else None)
+            return True
+
+    def delete(self, name: str) -> int:
+        with self._lock:
+            return int(self._items.pop(name, None) is not None)
+
+
+def connect_key_value(url: str):
+    """
+    Returns a client of the key-value store at `url`, e.g.
+    'redis://cache:6379/0'. Needs the `redis` package.
+    """
+    # imported here, as only a networked shared cache needs it
+    import redis
+
+    return redis.Redis.from_url(url)
+
+
+class KeyValueStore(SharedResultStore):
+    """
+    Results in a networked key-value store, as Arrow IPC streams, for server
+    processes on several hosts. Loads are coordinated with a lock key set
+    only if absent (`SET NX`) with an expiry, so that a process that died
+    while loading does not block the others for longer than `lock_timeout`.
+
+    Parameters:
+    - client: Client of the store, with the `get`, `set(name, value, ex, nx)`
+      and `delete` methods of `redis.Redis`, e.g. from `connect_key_value`
+      or a `MemoryKeyValue`.
+    - prefix (str): Prefix of the keys written.
+    - lock_timeout (float): Seconds a lock is held at most.
+    - ttl (int): Seconds results are kept in the store.
+    """
+
+    def __init__(
+        self,
+        client,
+        prefix: str = "parl:",
+        lock_timeout: float = LOCK_TIMEOUT_SECONDS,
+        ttl: int = SHARED_CACHE_TTL_SECONDS,
+    ):
+        self.client = client
+        self.prefix = prefix
+        self.lock_timeout = lock_timeout
+        self.ttl = ttl
+
+    def _name(self, key: Hashable) -> str:
+        return f"{self.prefix}{_hash(key)}"
+
+    def _read(
+        self, name: str, version: Optional[str], max_age: Optional[float]
+    ) -> Optional[pa.Table]:
+        data = self.client.get(name)
+        if data is None:
+            return None
+        reader = pa.ipc.open_stream(pa.py_buffer(data))
+        if not _is_fresh(reader.schema.metadata, version, max_age):
+            return None
+        return reader.read_all()
+
+    def _write(self, name: str, table: pa.Table):
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        self.client.set(name, sink.getvalue().to_pybytes(), ex=self.ttl)
+
+    def get_or_load(
+        self,
+        key: Hashable,
+        load: Callable[[], pa.Table],
+        version: Optional[str] = None,
+        max_age: Optional[float] = None,
+    ) -> pa.Table:
+        name = self._name(key)
+        table = self._read(name, version, max_age)
+        if table is not None:
+            return table
+
+        lock_name, token = f"{name}:lock", uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_timeout
+        while not self.client.set(
+            lock_name, token, ex=math.ceil(self.lock_timeout), nx=True
+        ):
+            time.sleep(POLL_INTERVAL_SECONDS)
+            table = self._read(name, version, max_age)
+            if table is not None:
+                return table
+            if time.monotonic() > deadline:
+                break
+        try:
+            table = self._read(name, version, max_age)
+            if table is None:
+                table = _with_metadata(load(), key, version)
+                self._write(name, table)
+        finally:
+            # best effort: released only if it is still this process's lock
+            if self.client.get(lock_name) == token.encode():
+                self.client.delete(lock_name)
+        return table
+
+
+_store: Optional[SharedResultStore] = None
+_store_lock = threading.Lock()
+
+
+def shared_store() -> Optional[SharedResultStore]:
+    """Returns the store configured with PARL_SHARED_CACHE, or None if it is off."""
+    global _store
+    if not SHARED_CACHE:
+        return None
+    with _store_lock:
+        if _store is None:
+            if SHARED_CACHE == "arrow":
+                _store = ArrowFileStore()
+            elif SHARED_CACHE == "memory":
+                _store = KeyValueStore(MemoryKeyValue())
+            else:
+                _store = KeyValueStore(connect_key_value(SHARED_CACHE))
+    return _store
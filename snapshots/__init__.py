@@ -0,0 +1,222 @@
+import json
+import os
+import re
+import threading
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# DuckDB is imported when the first snapshot is queried, as the app only
+# needs it offline.
+if TYPE_CHECKING:
+    import duckdb
+
+SNAPSHOT_DIR = os.environ.get(
+    "PARL_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "snapshots"),
+)
+MANIFEST_FILE = "manifest.json"
+COMPRESSION = "zstd"
+
+# Every BigQuery table read by the app. Add new tables here so that they are
+# exported along with the rest and can be served offline.
+SNAPSHOT_TABLES = [
+    "prod_dim.dim_members",
+    "prod_fact.fact_member_positions",
+    "prod_fact.fact_sittings",
+    "prod_agg.agg_speech_metrics_by_member",
+    "prod_agg.agg_pri_questions_topics_by_member",
+    "prod_mart.mart_speeches",
+    "prod_mart.mart_bills",
+]
+
+_connections: Dict[str, "duckdb.DuckDBPyConnection"] = {}
+_connections_lock = threading.Lock()
+
+
+def snapshot_path(table: str, snapshot_dir: str = SNAPSHOT_DIR) -> str:
+    """
+    Returns the Parquet file path of a table snapshot, e.g. `prod_dim.dim_members.parquet`.
+    """
+    return os.path.join(snapshot_dir, f"{table}.parquet")
+
+
+def read_manifest(snapshot_dir: str = SNAPSHOT_DIR) -> Dict[str, dict]:
+    """
+    Reads the snapshot manifest.
+
+    Parameters:
+    - snapshot_dir (str): Directory holding the snapshots.
+
+    Returns:
+    - Dict[str, dict]: Mapping of table name to its snapshot entry (file, rows,
+      bytes, snapshot_at). Empty if no snapshot has been taken yet.
+    """
+    manifest_path = os.path.join(snapshot_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def write_manifest(manifest: Dict[str, dict], snapshot_dir: str = SNAPSHOT_DIR):
+    os.makedirs(snapshot_dir, exist_ok=True)
+    manifest_path = os.path.join(snapshot_dir, MANIFEST_FILE)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def export_table(
+    client, project_id: str, table: str, snapshot_dir: str = SNAPSHOT_DIR
+) -> dict:
+    """
+    Exports one BigQuery table to a compressed Parquet file.
+
+    The file is written next to its final location and then renamed, so a
+    running app never reads a half-written snapshot.
+
+    Parameters:
+    - client (bigquery.Client): Client used to read the table.
+    - project_id (str): BigQuery project holding the table.
+    - table (str): Table name qualified by dataset, e.g. `prod_dim.dim_members`.
+    - snapshot_dir (str): Directory to write the snapshot to.
+
+    Returns:
+    - dict: The manifest entry of the snapshot.
+    """
+    snapshot_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    arrow_table = client.query(f"select * from `{project_id}.{table}`").to_arrow()
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    path = snapshot_path(table, snapshot_dir)
+    tmp_path = f"{path}.tmp"
+    pq.write_table(arrow_table, tmp_path, compression=COMPRESSION)
+    os.replace(tmp_path, path)
+
+    return {
+        "file": os.path.basename(path),
+        "rows": arrow_table.num_rows,
+        "bytes": os.path.getsize(path),
+        "compression": COMPRESSION,
+        "snapshot_at": snapshot_at,
+    }
+
+
+def export_snapshots(
+    client,
+    project_id: str,
+    tables: Optional[List[str]] = None,
+    snapshot_dir: str = SNAPSHOT_DIR,
+) -> Dict[str, dict]:
+    """
+    Exports tables to Parquet and records them in the manifest.
+
+    Parameters:
+    - client (bigquery.Client): Client used to read the tables.
+    - project_id (str): BigQuery project holding the tables.
+    - tables (Optional[List[str]]): Tables to export. Defaults to `SNAPSHOT_TABLES`.
+    - snapshot_dir (str): Directory to write the snapshots to.
+
+    Returns:
+    - Dict[str, dict]: The updated manifest.
+    """
+    manifest = read_manifest(snapshot_dir)
+    for table in tables or SNAPSHOT_TABLES:
+        manifest[table] = export_table(client, project_id, table, snapshot_dir)
+        # written after every table so that a failed export keeps earlier ones
+        write_manifest(manifest, snapshot_dir)
+
+    with _connections_lock:
+        _connections.pop(snapshot_dir, None)
+
+    return manifest
+
+
+def rewrite_query(query: str, project_id: str) -> str:
+    """
+    Rewrites fully qualified BigQuery table references
+    (`` `project.dataset.table` ``) into `dataset.table`, which resolve to the
+    snapshot views registered on the embedded connection.
+    """
+    return re.sub(
+        rf"`{re.escape(project_id)}\.(\w+)\.(\w+)`",
+        r"\1.\2",
+        query,
+    )
+
+
+def get_connection(snapshot_dir: str = SNAPSHOT_DIR) -> "duckdb.DuckDBPyConnection":
+    """
+    Returns an in-memory DuckDB connection with one view per snapshot in the
+    manifest, under schemas named after the BigQuery datasets.
+    """
+    with _connections_lock:
+        if snapshot_dir not in _connections:
+            manifest = read_manifest(snapshot_dir)
+            if not manifest:
+                raise FileNotFoundError(
+                    f"No snapshots found in {snapshot_dir}. Run `python -m snapshots` first."
+                )
+            import duckdb
+
+            connection = duckdb.connect(database=":memory:")
+            for table, entry in manifest.items():
+                dataset, _ = table.split(".")
+                path = os.path.join(snapshot_dir, entry["file"]).replace("'", "''")
+                connection.execute(f"create schema if not exists {dataset}")
+                connection.execute(
+                    f"create or replace view {table} as select * from read_parquet('{path}')"
+                )
+            _connections[snapshot_dir] = connection
+        return _connections[snapshot_dir]
+
+
+def _match_bigquery_types(arrow_table: pa.Table) -> pa.Table:
+    """
+    DuckDB returns HUGEINT (e.g. from `countif`) as decimal(38, 0), where
+    BigQuery returns INT64. Casts such columns back to int64.
+    """
+    for i, field in enumerate(arrow_table.schema):
+        if pa.types.is_decimal(field.type) and field.type.scale == 0:
+            arrow_table = arrow_table.set_column(
+                i, field.name, arrow_table.column(i).cast(pa.int64())
+            )
+    return arrow_table
+
+
+def query_snapshot(
+    query: str,
+    project_id: str,
+    snapshot_dir: str = SNAPSHOT_DIR,
+    params: Optional[Dict[str, Any]] = None,
+) -> pa.Table:
+    """
+    Runs a BigQuery-dialect query against the local snapshots.
+
+    Parameters:
+    - query (str): Query referencing tables as `` `project.dataset.table` ``.
+    - project_id (str): Project id used in the query's table references.
+    - snapshot_dir (str): Directory holding the snapshots.
+    - params (Optional[Dict[str, Any]]): Values of the query parameters, which
+      are referenced as `@name` as in BigQuery.
+
+    Returns:
+    - pa.Table: The query result.
+    """
+    # a cursor is a separate connection to the same database, so concurrent
+    # reruns do not share one connection
+    cursor = get_connection(snapshot_dir).cursor()
+    try:
+        query = rewrite_query(query, project_id)
+        if params:
+            # DuckDB names parameters $name where BigQuery uses @name
+            query = re.sub(r"@(\w+)", r"$\1", query)
+        arrow_table = cursor.execute(query, params or None).fetch_arrow_table()
+    finally:
+        cursor.close()
+
+    return _match_bigquery_types(arrow_table)
@@ -0,0 +1,23 @@
+"""
+Exports the BigQuery tables used by the app to local Parquet snapshots.
+
+Usage:
+    python -m snapshots                              # every table in SNAPSHOT_TABLES
+    python -m snapshots prod_dim.dim_members         # selected tables only
+"""
+import argparse
+
+from snapshots import SNAPSHOT_DIR, SNAPSHOT_TABLES, export_snapshots
+from utils import make_client, project_id
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+parser.add_argument("tables", nargs="*", default=SNAPSHOT_TABLES)
+parser.add_argument("--snapshot-dir", default=SNAPSHOT_DIR)
+args = parser.parse_args()
+
+manifest = export_snapshots(make_client(), project_id, args.tables, args.snapshot_dir)
+for table in args.tables:
+    entry = manifest[table]
+    print(
+        f"{table}: {entry['rows']} rows, {entry['bytes'] / 1e6:.1f} MB ({entry['snapshot_at']})"
+    )
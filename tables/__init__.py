@@ -0,0 +1,188 @@
+import math
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Rows sent to the browser per page. Only the page is styled and serialised,
+# so rendering costs the same however long the table is.
+PAGE_ROWS = 100
+
+HIGHLIGHT_CSS = "background-color: yellow"
+
+# Formats of display columns, by the symbol in their names (as
+# `metrics.format_metric_columns`): (printf format for `st.column_config`,
+# format string for `Styler.format`).
+METRIC_FORMATS: Dict[str, Tuple[str, str]] = {
+    "%": ("%.1f%%", "{:.1f}%"),
+    "#": ("%d", "{:.0f}"),
+}
+
+
+def _column_formats(columns, which: int) -> Dict[str, str]:
+    # column -> its format in METRIC_FORMATS (0: printf, 1: Styler)
+    formats = {}
+    for column in columns:
+        for symbol, column_formats in METRIC_FORMATS.items():
+            if symbol in column:
+                formats[column] = column_formats[which]
+                break
+    return formats
+
+
+def metric_column_config(df: pd.DataFrame) -> Dict[str, st.column_config.Column]:
+    """
+    Returns the column configuration showing '%' columns with 1 decimal place
+    and a '%' suffix and '#' columns as whole numbers, as
+    `process_metric_columns` does, while the values stay numbers (so that
+    sorting in the browser is numeric).
+    """
+    return {
+        column: st.column_config.NumberColumn(format=printf_format)
+        for column, printf_format in _column_formats(df.columns, 0).items()
+    }
+
+
+def page_count(rows: int, page_rows: int = PAGE_ROWS) -> int:
+    return max(1, math.ceil(rows / page_rows))
+
+
+def pages_with(mask: np.ndarray, page_rows: int = PAGE_ROWS) -> np.ndarray:
+    """Returns the (1-based) pages holding the rows where `mask` is True."""
+    return np.unique(np.flatnonzero(mask) // page_rows) + 1
+
+
+def sort_table(
+    df: pd.DataFrame,
+    column: Optional[str],
+    descending: bool = False,
+    highlight: Optional[np.ndarray] = None,
+) -> Tuple[pd.DataFrame, Optional[np.ndarray]]:
+    """
+    Sorts a whole table (and its highlight mask with it) by one column, before
+    it is paged, so that every page follows the same order. Ties keep their
+    display order and missing values go last.
+
+    Parameters:
+    - df (pd.DataFrame): Table, in display order.
+    - column (Optional[str]): Column to sort by, or None to keep the order.
+    - descending (bool): Whether to sort from the largest value.
+    - highlight (Optional[np.ndarray]): Boolean mask of the rows of `df` to
+      highlight.
+
+    Returns:
+    - Tuple[pd.DataFrame, Optional[np.ndarray]]: The sorted table and mask.
+    """
+    if column is None:
+        return df, highlight
+    order = (
+        df[column]
+        .reset_index(drop=True)
+        .sort_values(ascending=not descending, kind="stable", na_position="last")
+        .index.to_numpy()
+    )
+    return df.iloc[order], None if highlight is None else highlight[order]
+
+
+def table_page(
+    df: pd.DataFrame,
+    page: int = 1,
+    page_rows: int = PAGE_ROWS,
+    highlight: Optional[np.ndarray] = None,
+) -> Union[pd.DataFrame, "pd.io.formats.style.Styler"]:
+    """
+    Returns one page of a table, ready for `st.dataframe`.
+
+    Rows to highlight are styled with one CSS frame built from the mask,
+    rather than a function called per row. A page without highlighted rows
+    is returned as a plain frame, formatted by `metric_column_config`; a
+    page with them as a `Styler`, whose display values are formatted the
+    same way.
+
+    Parameters:
+    - df (pd.DataFrame): Table, in display order.
+    - page (int): Page to return, from 1.
+    - page_rows (int): Rows per page.
+    - highlight (Optional[np.ndarray]): Boolean mask of the rows of `df` to
+      highlight.
+
+    Returns:
+    - Union[pd.DataFrame, Styler]: The page.
+    """
+    start = (page - 1) * page_rows
+    rows = df.iloc[start : start + page_rows]
+    if highlight is None or not highlight[start : start + page_rows].any():
+        return rows
+
+    css = np.where(highlight[start : start + page_rows], HIGHLIGHT_CSS, "")
+    styles = pd.DataFrame(
+        np.repeat(css[:, None], len(rows.columns), axis=1),
+        index=rows.index,
+        columns=rows.columns,
+    )
+    return rows.style.apply(lambda _: styles, axis=None).format(
+        _column_formats(rows.columns, 1), na_rep=""
+    )
+
+
+def show_table(
+    df: pd.DataFrame,
+    key: str,
+    highlight: Optional[np.ndarray] = None,
+    highlight_label: str = "Highlighted rows",
+    page_rows: int = PAGE_ROWS,
+    **kwargs,
+):
+    """
+    Shows a table one page at a time, with a page selector under it when it
+    has more than one page. Numbers keep their types, formatted by
+    `metric_column_config`. As the browser only has the page shown (clicking
+    a column header sorts that page), a table of several pages has a sort
+    selector above it, applied to the whole table before paging.
+
+    Parameters:
+    - df (pd.DataFrame): Table, in display order.
+    - key (str): Session state key of the page selector; the sort selectors'
+      keys are derived from it.
+    - highlight (Optional[np.ndarray]): Boolean mask of the rows to highlight.
+    - highlight_label (str): What the highlighted rows are, for the caption
+      listing their pages.
+    - page_rows (int): Rows per page.
+    - **kwargs: Passed to `st.dataframe`, e.g. `hide_index`.
+    """
+    pages = page_count(len(df), page_rows)
+    if pages > 1:
+        sort_column, sort_order = st.columns([3, 1])
+        sort_by = sort_column.selectbox(
+            "Sort by",
+            list(df.columns),
+            index=None,
+            placeholder="Display order",
+            key=f"{key}_sort",
+            # back to the first page of the new order
+            on_change=lambda: st.session_state.update({key: 1}),
+        )
+        descending = sort_order.toggle(
+            "Descending",
+            key=f"{key}_descending",
+            on_change=lambda: st.session_state.update({key: 1}),
+        )
+        df, highlight = sort_table(df, sort_by, descending, highlight)
+    # e.g. after switching to a shorter table
+    if st.session_state.get(key, 1) > pages:
+        st.session_state[key] = pages
+    page = st.session_state.get(key, 1)
+    st.dataframe(
+        table_page(df, page, page_rows, highlight),
+        column_config={**metric_column_config(df), **kwargs.pop("column_config", {})},
+        **kwargs,
+    )
+    if pages > 1:
+        if highlight is not None and highlight.any():
+            st.caption(
+                f"{highlight_label} on page "
+                + ", ".join(str(p) for p in pages_with(highlight, page_rows))
+                + "."
+            )
+        st.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, key=key)
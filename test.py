@@ -1,12 +1,12 @@
 import streamlit as st
-import plotly.express as px
 
-from agg_data import get_member_list, get_all_member_speeches
-from members import aggregate_member_metrics
+from agg_data import get_member_list, get_metric_cube, get_metric_ranks
+from charts import cached_chart, chart_data, show_chart
+from derived import derived_frame
 from utils import (
-    calculate_readability,
     process_metric_columns,
     EARLIEST_SITTING,
+    PARLIAMENTS,
     PARTY_COLOURS,
     PARTY_SHAPES,
 )
@@ -16,22 +16,9 @@ from utils import (
 members_df = get_member_list()
 member_names = sorted(members_df["member_name"].unique())
 
-all_members_speech_summary = get_all_member_speeches()
-
-aggregated_by_member_parliament = aggregate_member_metrics(
-    all_members_speech_summary,
-    calculate_readability,
-    group_by_fields=[
-        "member_name",
-        "member_party",
-        "member_constituency",
-        "parliament",
-    ],
-)
-
 # SELECTIONS
 
-parliaments = {"13th Parliament": [13], "14th Parliament": [14], "All": [12, 13, 14]}
+parliaments = PARLIAMENTS
 
 select_parliament = st.selectbox("Select Parliament", parliaments)
 
@@ -46,12 +33,14 @@ st.markdown(
         color: #333333;
     }
     </style>
-    """, 
-    unsafe_allow_html=True
+    """,
+    unsafe_allow_html=True,
 )
 
 # Using the custom CSS class
-st.markdown('<h1 class="custom-title">Participation and Attendance</h1>', unsafe_allow_html=True)
+st.markdown(
+    '<h1 class="custom-title">Participation and Attendance</h1>', unsafe_allow_html=True
+)
 
 tabs = [
     "Participation",
@@ -61,61 +50,94 @@ tabs = [
 ]
 
 participation_cols = {
-        "member_name": "Member Name",
-        "participation_rate": "Participation (%)",
-        "attendance": "Attendance (%)",
-        "count_sittings_spoken": "# Spoken",
-        "count_sittings_attended": "# Attended",
-        "count_sittings_total": "# Total",
-        "member_party": "Party",
-        "member_constituency": "Constituency",
-    }
+    "member_name": "Member Name",
+    "participation_rate": "Participation (%)",
+    "attendance": "Attendance (%)",
+    "count_sittings_spoken": "# Spoken",
+    "count_sittings_attended": "# Attended",
+    "count_sittings_total": "# Total",
+    "member_party": "Party",
+    "member_constituency": "Constituency",
+}
 
-processed = aggregate_member_metrics(
-    aggregated_by_member_parliament[
-        aggregated_by_member_parliament["parliament"].isin(
-            parliaments[select_parliament]
-        )
-    ],
-    calculate_readability,
-    group_by_fields=["member_name", "member_party", "member_constituency"],
-)
 
-processed = processed[participation_cols.keys()]
+def participation_table(select_parliament):
+    # aggregated and ranked once per data refresh for every parliament
+    leaderboard_ranks = get_metric_ranks(
+        ("member_name", "member_party", "member_constituency")
+    )[select_parliament]
 
-processed["# Rank"] = processed["participation_rate"].rank(
-    ascending=False, method="min"
-)
+    processed = leaderboard_ranks.frame[participation_cols.keys()].copy()
 
-columns_to_round = ['attendance', 'participation_rate']
+    processed["# Rank"] = leaderboard_ranks.all_ranks("participation_rate")
 
-processed[columns_to_round] = processed[columns_to_round].apply(lambda x: x.round(1))
+    columns_to_round = ["attendance", "participation_rate"]
 
-processed.rename(columns=participation_cols, inplace=True)
-processed = processed.sort_values(by="Party")
+    processed[columns_to_round] = processed[columns_to_round].apply(
+        lambda x: x.round(1)
+    )
+
+    processed.rename(columns=participation_cols, inplace=True)
+    return processed.sort_values(by="Party")
 
-# color palette for legend, taken from dutch field https://www.heavy.ai/blog/12-color-palettes-for-telling-better-stories-with-your-data
 
-color_discrete_map = {'PAP': '#9b19f5',
-                      'WP': '#0bb4ff',
-                      'PSP': '#e60049',                       
-                      'NMP': '#ffa300',
-                      'SPP': '#00bfa0'}
-
-fig = px.scatter(processed, x="Attendance (%)", y="Participation (%)",
-                 color="Party", 
-                 hover_data={"Member Name": True, 
-                             "Attendance (%)": True, 
-                             "Participation (%)": True,
-                             "Party": False},
-                 color_discrete_map=color_discrete_map,
-                 title=select_parliament)
-
-# Customize hover template
-fig.update_traces(
-    hovertemplate='<b>%{customdata[0]}</b><br>' +
-                  'Attendance: %{x}%<br>' +
-                  'Participation: %{y}%<br>'
+# recomputed only when the data or the selected parliament change
+processed = derived_frame(
+    "test_participation",
+    get_metric_cube().cells,
+    lambda: participation_table(select_parliament),
+    parliament=select_parliament,
+    columns=participation_cols,
 )
 
-st.plotly_chart(fig)
\ No newline at end of file
+# color palette for legend, taken from dutch field https://www.heavy.ai/blog/12-color-palettes-for-telling-better-stories-with-your-data
+
+color_discrete_map = {
+    "PAP": "#9b19f5",
+    "WP": "#0bb4ff",
+    "PSP": "#e60049",
+    "NMP": "#ffa300",
+    "SPP": "#00bfa0",
+}
+
+
+def build_scatter():
+    # imported here, so that it only slows down reruns that draw the chart
+    import plotly.express as px
+
+    fig = px.scatter(
+        chart_data(
+            processed, ["Member Name", "Attendance (%)", "Participation (%)", "Party"]
+        ),
+        x="Attendance (%)",
+        y="Participation (%)",
+        color="Party",
+        hover_data={
+            "Member Name": True,
+            "Attendance (%)": True,
+            "Participation (%)": True,
+            "Party": False,
+        },
+        color_discrete_map=color_discrete_map,
+        title=select_parliament,
+    )
+
+    # Customize hover template
+    fig.update_traces(
+        hovertemplate="<b>%{customdata[0]}</b><br>"
+        + "Attendance: %{x}%<br>"
+        + "Participation: %{y}%<br>"
+    )
+    return fig
+
+
+# built once per version of the data and parliament, not on every rerun
+show_chart(
+    cached_chart(
+        "test_participation_scatter",
+        get_metric_cube().cells,
+        build_scatter,
+        parliament=select_parliament,
+    ),
+    use_container_width=False,
+)
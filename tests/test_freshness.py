@@ -0,0 +1,126 @@
+from freshness import StaleWhileRevalidateCache
+
+
+class Loader:
+    """Counts its calls, returning the number of the call."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self) -> int:
+        self.calls += 1
+        return self.calls
+
+
+def make_cache(version=lambda: 1, **kwargs) -> StaleWhileRevalidateCache:
+    cache = StaleWhileRevalidateCache(version, **kwargs)
+    # checked by hand rather than by the refresher
+    cache.start = lambda: None
+    return cache
+
+
+def test_least_recently_used_result_is_dropped():
+    cache = make_cache(max_entries=2)
+    loads = {key: Loader() for key in "abc"}
+    cache.get("a", loads["a"], revalidate=False)
+    cache.get("b", loads["b"], revalidate=False)
+    cache.get("a", loads["a"], revalidate=False)
+    cache.get("c", loads["c"], revalidate=False)
+
+    cache.get("a", loads["a"], revalidate=False)
+    assert loads["a"].calls == 1
+    cache.get("b", loads["b"], revalidate=False)
+    assert loads["b"].calls == 2
+
+
+def test_revalidated_results_are_not_dropped():
+    cache = make_cache(max_entries=2)
+    warmed = Loader()
+    cache.get("warmed", warmed)
+    for key in range(10):
+        cache.get(key, Loader(), revalidate=False)
+
+    assert len(cache) == 2
+    cache.get("warmed", warmed)
+    assert warmed.calls == 1
+
+
+class Flaky(Loader):
+    """Fails while `failing`, counting its attempts."""
+
+    def __init__(self):
+        super().__init__()
+        self.failing = False
+        self.attempts = 0
+
+    def __call__(self) -> int:
+        self.attempts += 1
+        if self.failing:
+            raise RuntimeError("query failed")
+        return super().__call__()
+
+
+def test_failed_reload_is_retried_alone_with_backoff():
+    version = {"current": 1}
+    cache = make_cache(lambda: version["current"])
+    good, flaky = Loader(), Flaky()
+    rebuilds = []
+    cache.on_change(lambda: rebuilds.append(cache.get("flaky", flaky)))
+    cache.get("good", good)
+    cache.get("flaky", flaky)
+    cache.check()
+
+    version["current"] = 2
+    flaky.failing = True
+    assert cache.check()
+    # the version moves on, keeping the previous result of the failed reload
+    assert cache.version == 2
+    assert cache.get("flaky", flaky) == 1
+    assert good.calls == 2
+
+    retried_at = []
+    for check in range(1, 8):
+        attempts = flaky.attempts
+        cache.check()
+        if flaky.attempts > attempts:
+            retried_at.append(check)
+    # at the next check, then 2 and 4 checks later
+    assert retried_at == [1, 3, 7]
+    assert good.calls == 2
+
+    flaky.failing = False
+    for _ in range(8):
+        cache.check()
+    assert cache.get("flaky", flaky) == 2
+    # rebuilt with the reloaded result, once
+    assert rebuilds[-1] == 2
+    assert rebuilds.count(2) == 1
+    assert good.calls == 2
+
+
+def test_failed_callback_is_retried_alone():
+    version = {"current": 1}
+    cache = make_cache(lambda: version["current"])
+    good = Loader()
+    failing = {"callback": True}
+    calls = []
+
+    def rebuild():
+        calls.append("rebuild")
+        if failing["callback"]:
+            raise RuntimeError("rebuild failed")
+
+    cache.on_change(rebuild)
+    cache.get("good", good)
+    cache.check()
+    version["current"] = 2
+    cache.check()
+    assert cache.version == 2
+    assert calls == ["rebuild"]
+
+    failing["callback"] = False
+    cache.check()
+    assert calls == ["rebuild"] * 2
+    cache.check()
+    assert calls == ["rebuild"] * 2
+    assert good.calls == 2
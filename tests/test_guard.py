@@ -0,0 +1,47 @@
+import pytest
+
+from guard import CostGuard, QueryTooLarge, ResultTooLarge
+
+QUERY = "select * from speeches where date > @since"
+
+
+class DryRun:
+    """Counts its calls, returning `bytes`."""
+
+    def __init__(self, bytes: int):
+        self.bytes = bytes
+        self.calls = 0
+
+    def __call__(self) -> int:
+        self.calls += 1
+        return self.bytes
+
+
+def test_estimate_is_kept_per_shape_and_parameter_values():
+    guard = CostGuard()
+    dry_run = DryRun(100)
+    guard.estimate(QUERY, dry_run, {"since": "2024-01-01"})
+    # whitespace does not make a new shape
+    guard.estimate(f"  {QUERY}\n", dry_run, {"since": "2024-01-01"})
+    assert dry_run.calls == 1
+
+    guard.estimate(QUERY, dry_run, {"since": "1990-01-01"})
+    assert dry_run.calls == 2
+
+
+def test_wider_parameter_values_are_refused():
+    guard = CostGuard(max_query_bytes=1000)
+    narrow = {"since": "2024-01-01"}
+    guard.admit(QUERY, guard.estimate(QUERY, DryRun(100), narrow))
+
+    wide = {"since": "1990-01-01"}
+    with pytest.raises(QueryTooLarge):
+        guard.admit(QUERY, guard.estimate(QUERY, DryRun(10_000), wide))
+    assert guard.state()["refused"] == 1
+
+
+def test_result_rows_are_checked():
+    guard = CostGuard(max_result_rows=10)
+    guard.check_rows(QUERY, 10)
+    with pytest.raises(ResultTooLarge):
+        guard.check_rows(QUERY, 11)
@@ -0,0 +1,120 @@
+import json
+import os
+import threading
+import time
+
+import pyarrow as pa
+import pytest
+
+import incremental
+from incremental import IncrementalTable
+
+
+class Warehouse:
+    """
+    Stands in for the registered queries: the full table, or its months from
+    `since_period`, from `rows`. Blocks while `gate` is cleared.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def __call__(self, name, since_period=None):
+        self.calls.append(name)
+        self.gate.wait(10)
+        rows = [
+            row
+            for row in self.rows
+            if since_period is None or row["year"] * 100 + row["month"] >= since_period
+        ]
+        return pa.Table.from_pylist(
+            rows,
+            schema=pa.schema(
+                [("year", pa.int64()), ("month", pa.int64()), ("count", pa.int64())]
+            ),
+        )
+
+
+@pytest.fixture
+def warehouse(monkeypatch):
+    warehouse = Warehouse(
+        [{"year": 2024, "month": month, "count": month} for month in range(1, 7)]
+    )
+    monkeypatch.setattr(incremental, "execute_registered_query", warehouse)
+    return warehouse
+
+
+def make_table(directory, check_interval=0):
+    return IncrementalTable(
+        "metrics",
+        "full",
+        "since",
+        directory=str(directory),
+        check_interval=check_interval,
+    )
+
+
+def wait_for_update(table):
+    deadline = time.monotonic() + 10
+    while table._updating and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_readers_get_the_current_copy_while_it_updates(warehouse, tmp_path):
+    table = make_table(tmp_path)
+    assert len(table.get()) == 6
+
+    warehouse.rows.append({"year": 2024, "month": 7, "count": 7})
+    warehouse.gate.clear()
+    # the update waits on the warehouse, the reader does not
+    assert len(table.get()) == 6
+    assert len(table.get()) == 6
+    warehouse.gate.set()
+    wait_for_update(table)
+    assert len(table.get()) == 7
+    assert table.high_water_mark == 202407
+
+
+def test_failed_update_keeps_the_local_copy(warehouse, tmp_path, monkeypatch):
+    table = make_table(tmp_path)
+    table.get()
+
+    def fail(*args, **kwargs):
+        raise TimeoutError("query timed out")
+
+    monkeypatch.setattr(incremental, "execute_registered_query", fail)
+    table.get()
+    wait_for_update(table)
+    assert len(table.get()) == 6
+
+
+def test_processes_start_from_the_latest_saved_copy(warehouse, tmp_path):
+    first = make_table(tmp_path, check_interval=None)
+    second = make_table(tmp_path, check_interval=None)
+    first.get()
+    second.get()
+    wait_for_update(second)
+
+    warehouse.rows.append({"year": 2024, "month": 7, "count": 7})
+    first.update()
+    warehouse.rows[-1]["count"] = 8
+    second.update()
+    assert second.high_water_mark == 202407
+    assert second.frame["count"].iloc[-1] == 8
+
+    # each file is whole and the state agrees with the data
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+    with open(second.state_path) as f:
+        assert json.load(f)["rows"] == 7
+
+
+def test_unreadable_copy_is_reloaded(warehouse, tmp_path):
+    make_table(tmp_path).get()
+    with open(os.path.join(tmp_path, "metrics.parquet"), "wb") as f:
+        f.write(b"truncated")
+
+    assert len(make_table(tmp_path).get()) == 6
+    assert warehouse.calls.count("full") == 2
@@ -0,0 +1,79 @@
+import os
+from datetime import date
+
+import pyarrow as pa
+import pytest
+
+import search
+from search import SpeechIndex
+
+
+class Speeches:
+    """Stands in for `speeches_since`: one speech per day in `days`."""
+
+    def __init__(self):
+        self.days = []
+        self.calls = 0
+
+    def __call__(self, name, since):
+        self.calls += 1
+        days = [day for day in self.days if date(2024, 1, day) > since]
+        return pa.table(
+            {
+                "speech_id": [f"s{day}" for day in days],
+                "date": pa.array([date(2024, 1, day) for day in days], pa.date32()),
+                "member_name": ["Member"] * len(days),
+                "topic_id": [f"t{day}" for day in days],
+                "topic_title": ["Housing"] * len(days),
+                "is_primary_question": [False] * len(days),
+                "text": [f"housing speech on day {day}" for day in days],
+            }
+        )
+
+
+@pytest.fixture
+def speeches(monkeypatch):
+    speeches = Speeches()
+    monkeypatch.setattr(search, "execute_registered_query", speeches)
+    return speeches
+
+
+def segment_names(directory):
+    return sorted(name for name in os.listdir(directory) if name.startswith("segment_"))
+
+
+def test_processes_index_each_speech_once(speeches, tmp_path):
+    first, second = SpeechIndex(str(tmp_path)), SpeechIndex(str(tmp_path))
+    speeches.days = [1, 2]
+    assert first.update() == 2
+    # starts from the index the first process wrote
+    assert second.update() == 0
+    assert second.search("housing").total == 2
+
+    speeches.days.append(3)
+    assert second.update() == 1
+    assert first.update() == 0
+    assert first.search("housing").total == 3
+
+
+def test_merged_segments_are_kept_until_obsolete(speeches, tmp_path, monkeypatch):
+    monkeypatch.setattr(search, "MAX_SEGMENTS", 2)
+    index = SpeechIndex(str(tmp_path))
+    other = SpeechIndex(str(tmp_path))
+    for day in (1, 2):
+        speeches.days.append(day)
+        index.update()
+    other.update()
+    speeches.days.append(3)
+    index.update()
+
+    # merged, but still searched by the other process
+    assert len(index.segments) == 1
+    assert len(segment_names(tmp_path)) == 4
+    assert other.search("housing").total == 2
+
+    monkeypatch.setattr(search, "OBSOLETE_SEGMENT_SECONDS", 0)
+    index.update()
+    assert segment_names(tmp_path) == [os.path.basename(index.segments[0].directory)]
+    assert not other.update()
+    assert other.search("housing").total == 3
@@ -0,0 +1,228 @@
+import multiprocessing
+import os
+import threading
+import time
+
+import pyarrow as pa
+import pytest
+
+from shared import (
+    ArrowFileStore,
+    KeyValueStore,
+    MemoryKeyValue,
+    SharedResultStore,
+    _with_metadata,
+)
+
+
+def make_table(rows: int = 1000) -> pa.Table:
+    return pa.table({"n": list(range(rows)), "s": ["x"] * rows})
+
+
+class Loader:
+    """Counts its calls, taking `seconds` each, like a query."""
+
+    def __init__(self, seconds: float = 0.0, rows: int = 1000):
+        self.seconds = seconds
+        self.rows = rows
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self) -> pa.Table:
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.seconds)
+        return make_table(self.rows)
+
+
+def load_concurrently(store: SharedResultStore, load, threads: int = 5, **freshness):
+    results = []
+    workers = [
+        threading.Thread(
+            target=lambda: results.append(store.get_or_load("key", load, **freshness))
+        )
+        for _ in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results
+
+
+def test_shared_result_store_is_abstract():
+    with pytest.raises(TypeError):
+        SharedResultStore()
+
+
+# KeyValueStore, against the in-process stand-in of Redis
+
+
+def test_key_value_store_loads_once_under_contention():
+    store = KeyValueStore(MemoryKeyValue())
+    load = Loader(seconds=0.3)
+    results = load_concurrently(store, load, version="v1")
+    assert load.calls == 1
+    assert [table.num_rows for table in results] == [1000] * 5
+    # the lock is released after the load
+    assert not [name for name in store.client._items if name.endswith(":lock")]
+
+
+def test_key_value_store_reloads_for_another_version():
+    store = KeyValueStore(MemoryKeyValue())
+    load = Loader()
+    store.get_or_load("key", load, version="v1")
+    store.get_or_load("key", load, version="v1")
+    assert load.calls == 1
+    store.get_or_load("key", load, version="v2")
+    assert load.calls == 2
+    # the result stored for v2 is the one read afterwards
+    store.get_or_load("key", load, version="v2")
+    assert load.calls == 2
+
+
+def test_key_value_store_reloads_after_max_age():
+    store = KeyValueStore(MemoryKeyValue())
+    load = Loader()
+    store.get_or_load("key", load, max_age=60)
+    store.get_or_load("key", load, max_age=60)
+    assert load.calls == 1
+    time.sleep(0.05)
+    store.get_or_load("key", load, max_age=0.01)
+    assert load.calls == 2
+
+
+def test_key_value_store_waits_for_lock_expiry():
+    client = MemoryKeyValue()
+    store = KeyValueStore(client, lock_timeout=10)
+    name = store._name("key")
+    # held by a process that died while loading: expires after 1 s
+    client.set(f"{name}:lock", "dead", ex=1, nx=True)
+
+    load = Loader()
+    start = time.monotonic()
+    table = store.get_or_load("key", load)
+    waited = time.monotonic() - start
+    assert table.num_rows == 1000
+    assert load.calls == 1
+    assert 0.8 <= waited < 5
+
+
+def test_key_value_store_loads_after_lock_timeout():
+    client = MemoryKeyValue()
+    store = KeyValueStore(client, lock_timeout=0.3)
+    name = store._name("key")
+    # held without expiry, e.g. set by hand
+    client.set(f"{name}:lock", "stuck", nx=True)
+
+    load = Loader()
+    start = time.monotonic()
+    store.get_or_load("key", load)
+    assert load.calls == 1
+    assert time.monotonic() - start < 2
+    # another process's lock is left alone
+    assert client.get(f"{name}:lock") == b"stuck"
+
+
+def test_key_value_store_reads_result_written_while_waiting():
+    client = MemoryKeyValue()
+    store = KeyValueStore(client, lock_timeout=10)
+    other = KeyValueStore(client)
+    name = store._name("key")
+    client.set(f"{name}:lock", "other", ex=10, nx=True)
+
+    # the other process finishes its load while this one waits for the lock
+    def finish():
+        time.sleep(0.3)
+        other._write(name, _with_metadata(make_table(7), "key", None))
+        client.delete(f"{name}:lock")
+
+    threading.Thread(target=finish).start()
+    load = Loader()
+    assert store.get_or_load("key", load).num_rows == 7
+    assert load.calls == 0
+
+
+def test_key_value_store_expires_results():
+    client = MemoryKeyValue()
+    store = KeyValueStore(client, ttl=1)
+    load = Loader()
+    store.get_or_load("key", load)
+    time.sleep(1.1)
+    store.get_or_load("key", load)
+    assert load.calls == 2
+
+
+def test_key_value_store_releases_lock_when_load_fails():
+    store = KeyValueStore(MemoryKeyValue())
+
+    def fail():
+        raise RuntimeError("query failed")
+
+    with pytest.raises(RuntimeError):
+        store.get_or_load("key", fail)
+    assert store.get_or_load("key", Loader()).num_rows == 1000
+
+
+# ArrowFileStore
+
+
+def test_arrow_file_store_reads_memory_mapped(tmp_path):
+    store = ArrowFileStore(str(tmp_path))
+    store.get_or_load("key", lambda: make_table(100_000))
+    allocated = pa.total_allocated_bytes()
+    table = store.get_or_load("key", Loader())
+    assert table.num_rows == 100_000
+    assert pa.total_allocated_bytes() == allocated
+
+
+def test_arrow_file_store_reloads_for_version_and_max_age(tmp_path):
+    store = ArrowFileStore(str(tmp_path))
+    load = Loader()
+    store.get_or_load("key", load, version="v1")
+    store.get_or_load("key", load, version="v1")
+    store.get_or_load("key", load, version="v2")
+    assert load.calls == 2
+    time.sleep(0.05)
+    store.get_or_load("key", load, max_age=0.01)
+    assert load.calls == 3
+
+
+def test_arrow_file_store_prunes_oldest(tmp_path):
+    store = ArrowFileStore(str(tmp_path), max_files=2)
+    for key in range(4):
+        store.get_or_load(key, Loader())
+        time.sleep(0.01)
+    load = Loader()
+    store.get_or_load(3, load)
+    store.get_or_load(0, load)
+    assert load.calls == 1
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".arrow")]) == 2
+
+
+def _load_in_process(directory: str, calls_path: str, results):
+    def load():
+        with open(calls_path, "a") as calls:
+            calls.write("x")
+        time.sleep(0.3)
+        return make_table()
+
+    results.put(ArrowFileStore(directory).get_or_load("key", load).num_rows)
+
+
+def test_arrow_file_store_loads_once_across_processes(tmp_path):
+    directory, calls_path = str(tmp_path / "store"), str(tmp_path / "calls")
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=_load_in_process, args=(directory, calls_path, results)
+        )
+        for _ in range(4)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert [results.get() for _ in processes] == [1000] * 4
+    with open(calls_path) as calls:
+        assert calls.read() == "x"
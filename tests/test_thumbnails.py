@@ -0,0 +1,237 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+from thumbnails import ThumbnailCache
+
+
+def make_image(colour: str, width: int = 300, height: int = 400) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), colour).save(output, "PNG")
+    return output.getvalue()
+
+
+class ImageServer:
+    """
+    A local stand-in for the server of the member photos: serves `images` by
+    path with an ETag, answers conditional requests with 304 Not Modified,
+    and 404 for other paths. Counts the requests and the images sent.
+    """
+
+    def __init__(self):
+        self.images = {}
+        self.etags = True
+        self.requests = []
+        self.sent = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append((self.path, dict(self.headers)))
+                image = server.images.get(self.path)
+                if image is None:
+                    self.send_error(404)
+                    return
+                etag = f'"{hashlib.md5(image).hexdigest()}"'
+                if server.etags and self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(image)))
+                if server.etags:
+                    self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(image)
+                server.sent += 1
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_port}{path}"
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    server = ImageServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ThumbnailCache(
+        directory=str(tmp_path),
+        static_url="app/static/thumbnails",
+        widths=(100, 150),
+        prune_grace=0,
+    )
+
+
+def test_fetch_writes_thumbnails(server, cache):
+    server.images["/a.png"] = make_image("red")
+    url = server.url("/a.png")
+
+    assert cache.fetch(url)
+    for width in (100, 150):
+        with Image.open(cache.path(url, width)) as thumbnail:
+            assert thumbnail.size == (width, round(400 * width / 300))
+    content_hash = cache.index[url]["hash"]
+    assert cache.static_url_for(url, 100) == (
+        f"app/static/thumbnails/{content_hash}_100.jpg?v={content_hash[:16]}"
+    )
+
+
+def test_unchanged_image_is_not_downloaded_again(server, cache):
+    server.images["/a.png"] = make_image("red")
+    url = server.url("/a.png")
+    cache.fetch(url)
+
+    assert not cache.fetch(url)
+    # revalidated with the ETag, answered with 304
+    assert server.requests[-1][1]["If-None-Match"] == cache.index[url]["etag"]
+    assert server.sent == 1
+    # and the index survives a restart
+    reopened = ThumbnailCache(directory=cache.directory, widths=cache.widths)
+    assert reopened.index == cache.index
+
+
+def test_same_content_without_etag_keeps_thumbnails(server, cache):
+    server.etags = False
+    server.images["/a.png"] = make_image("red")
+    url = server.url("/a.png")
+    cache.fetch(url)
+    content_hash = cache.index[url]["hash"]
+
+    assert not cache.fetch(url)
+    assert cache.index[url]["hash"] == content_hash
+
+
+def test_changed_image_replaces_thumbnails(server, cache):
+    server.images["/a.png"] = make_image("red")
+    url = server.url("/a.png")
+    cache.fetch(url)
+    old_path = cache.path(url, 100)
+
+    server.images["/a.png"] = make_image("blue")
+    assert cache.refresh([url]) == 1
+    new_path = cache.path(url, 100)
+    assert new_path != old_path
+    assert os.path.exists(new_path)
+    # the old thumbnails are removed by the refresh
+    assert not os.path.exists(old_path)
+    assert cache.static_url_for(url, 100).endswith(cache.index[url]["hash"][:16])
+
+
+def test_refresh_drops_images_no_longer_listed(server, cache):
+    server.images["/a.png"] = make_image("red")
+    server.images["/b.png"] = make_image("green")
+    cache.refresh([server.url("/a.png"), server.url("/b.png")])
+
+    cache.refresh([server.url("/a.png")])
+    assert list(cache.index) == [server.url("/a.png")]
+    assert (
+        len([name for name in os.listdir(cache.directory) if name.endswith(".jpg")])
+        == 2
+    )
+
+
+def wait_for_downloads(cache):
+    deadline = time.monotonic() + 10
+    while cache._queued and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_get_downloads_in_the_background(server, cache):
+    server.images["/a.png"] = make_image("red")
+    url = server.url("/a.png")
+
+    # not cached yet: the remote image is shown meanwhile
+    assert cache.get(url, 100) is None
+    wait_for_downloads(cache)
+    assert cache.get(url, 100) == cache.static_url_for(url, 100)
+    assert server.sent == 1
+
+
+def test_failed_download_is_not_retried_until_refresh(server, cache):
+    url = server.url("/missing.png")
+
+    assert cache.get(url, 100) is None
+    wait_for_downloads(cache)
+    assert cache.get(url, 100) is None
+    wait_for_downloads(cache)
+    assert len(server.requests) == 1
+
+    server.images["/missing.png"] = make_image("red")
+    assert cache.refresh([url]) == 1
+    assert cache.get(url, 100) is not None
+
+
+def test_failed_refresh_keeps_previous_thumbnails(server, cache):
+    server.images["/a.png"] = make_image("red")
+    url = server.url("/a.png")
+    cache.fetch(url)
+    path = cache.path(url, 100)
+
+    del server.images["/a.png"]
+    assert cache.refresh([url]) == 0
+    assert cache.path(url, 100) == path
+    assert os.path.exists(path)
+
+
+def test_processes_share_the_index(server, cache):
+    server.images["/a.png"] = make_image("red")
+    server.images["/b.png"] = make_image("green")
+    # another server process, with the same directory
+    other = ThumbnailCache(directory=cache.directory, widths=cache.widths)
+    cache.fetch(server.url("/a.png"))
+    other.fetch(server.url("/b.png"))
+    assert set(cache._read_index()) == {server.url("/a.png"), server.url("/b.png")}
+
+    # found in the index on disk, and revalidated rather than downloaded
+    assert not cache.fetch(server.url("/b.png"))
+    assert server.sent == 2
+    assert cache.static_url_for(server.url("/b.png"), 100) is not None
+
+
+def test_recent_thumbnails_are_not_pruned(server, tmp_path):
+    cache = ThumbnailCache(directory=str(tmp_path), widths=(100,))
+    server.images["/a.png"] = make_image("red")
+    cache.refresh([server.url("/a.png")])
+    # written by another process, whose index this one has not read yet
+    written = tmp_path / "0123_100.jpg"
+    written.write_bytes(b"jpeg")
+
+    cache.refresh([server.url("/a.png")])
+    assert written.exists()
+    os.utime(written, (0, 0))
+    cache.refresh([server.url("/a.png")])
+    assert not written.exists()
+
+
+def test_missing_thumbnail_is_not_served(server, cache):
+    server.images["/a.png"] = make_image("red")
+    url = server.url("/a.png")
+    cache.fetch(url)
+    os.remove(cache.path(url, 100))
+
+    assert cache.static_url_for(url, 100) is None
+    # written again, although the image did not change
+    assert cache.fetch(url)
+    assert cache.static_url_for(url, 100) is not None
@@ -0,0 +1,352 @@
+import fcntl
+import hashlib
+import html
+import io
+import json
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+import streamlit as st
+
+logger = logging.getLogger("parl.thumbnails")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Thumbnails are kept in the app's static folder, which Streamlit serves at
+# app/static/ with `server.enableStaticServing` (see .streamlit/config.toml).
+THUMBNAIL_DIR = os.path.join(ROOT, "static", "thumbnails")
+STATIC_URL = "app/static/thumbnails"
+INDEX_FILE = "index.json"
+
+# Widths the pages show member photos at.
+WIDTHS = (100, 150)
+
+DOWNLOAD_TIMEOUT_SECONDS = 10
+DOWNLOAD_WORKERS = 8
+JPEG_QUALITY = 85
+
+# Seconds before an image that could not be downloaded is tried again.
+RETRY_FAILED_SECONDS = 600
+
+# Thumbnails not in the index are only removed once they are this old, as
+# another server process may have just written them.
+PRUNE_GRACE_SECONDS = 3600
+
+
+def _resize(image_bytes: bytes, width: int) -> bytes:
+    # a JPEG of the image scaled to `width` pixels wide
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image = image.convert("RGB")
+        height = max(1, round(image.height * width / image.width))
+        thumbnail = image.resize((width, height), Image.LANCZOS)
+    output = io.BytesIO()
+    thumbnail.save(output, "JPEG", quality=JPEG_QUALITY, optimize=True)
+    return output.getvalue()
+
+
+def _tmp_path(path: str) -> str:
+    # unique to the writing process and thread
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+class ThumbnailCache:
+    """
+    Thumbnails of remote images (member photos) on local disk, named by the
+    hash of the image they were made from. Each image is downloaded once and
+    resized to every width in `WIDTHS`; `refresh` revalidates them all with
+    conditional requests, so unchanged images are not downloaded again.
+
+    Since a thumbnail's name changes with its content, it is served with a
+    version parameter, for which Streamlit's static file handler (tornado)
+    sends cache headers of ten years: browsers fetch each thumbnail once.
+
+    Several server processes can share the directory: the index on disk is
+    merged with each one's under a file lock, so none drops what another
+    wrote, and thumbnails are only removed once older than `prune_grace`.
+
+    Parameters:
+    - directory (str): Directory to keep the thumbnails and their index in.
+    - static_url (str): URL the directory is served at.
+    - widths (Tuple[int, ...]): Widths of the thumbnails, in pixels.
+    - prune_grace (float): Seconds before thumbnails no longer in the index
+      are removed.
+    """
+
+    def __init__(
+        self,
+        directory: str = THUMBNAIL_DIR,
+        static_url: str = STATIC_URL,
+        widths: Tuple[int, ...] = WIDTHS,
+        prune_grace: float = PRUNE_GRACE_SECONDS,
+    ):
+        self.directory = directory
+        self.static_url = static_url
+        self.widths = widths
+        self.prune_grace = prune_grace
+        # image URL -> {"hash", "etag", "last_modified"}
+        self.index: Dict[str, dict] = {}
+        self.lock = threading.Lock()
+        self._url_locks: Dict[str, threading.Lock] = {}
+        # URL -> time (monotonic) its download failed, tried again after
+        # RETRY_FAILED_SECONDS or at `refresh`
+        self._failed: Dict[str, float] = {}
+        # URLs being downloaded in the background for `get`
+        self._queued: Set[str] = set()
+        self._executor = ThreadPoolExecutor(
+            max_workers=DOWNLOAD_WORKERS, thread_name_prefix="parl-thumbnails"
+        )
+        self._open()
+
+    def _index_path(self) -> str:
+        return os.path.join(self.directory, INDEX_FILE)
+
+    def _open(self):
+        self.index = self._read_index()
+
+    def _read_index(self) -> Dict[str, dict]:
+        try:
+            with open(self._index_path()) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    @contextmanager
+    def _locked(self):
+        # exclusive between processes, and between threads (each opens the
+        # lock file itself)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(f"{self._index_path()}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _update_index(self, change: Callable[[Dict[str, dict]], None]):
+        # applies `change` to the index on disk, which other processes may
+        # have written since this one read it, and keeps the result
+        with self.lock, self._locked():
+            index = self._read_index()
+            change(index)
+            tmp_path = _tmp_path(self._index_path())
+            with open(tmp_path, "w") as f:
+                json.dump(index, f, indent=2)
+            os.replace(tmp_path, self._index_path())
+            self.index = index
+
+    def _file_name(self, content_hash: str, width: int) -> str:
+        return f"{content_hash}_{width}.jpg"
+
+    def path(self, url: str, width: int) -> Optional[str]:
+        """Returns the path of a thumbnail, or None if it is not cached."""
+        entry = self.index.get(url)
+        if entry is None:
+            return None
+        return os.path.join(self.directory, self._file_name(entry["hash"], width))
+
+    def static_url_for(self, url: str, width: int) -> Optional[str]:
+        """
+        Returns the URL a thumbnail is served at, or None if it is not cached
+        (or its file was removed).
+        """
+        entry = self.index.get(url)
+        if entry is None:
+            return None
+        name = self._file_name(entry["hash"], width)
+        if not os.path.exists(os.path.join(self.directory, name)):
+            return None
+        return f"{self.static_url}/{name}?v={entry['hash'][:16]}"
+
+    def fetch(self, url: str) -> bool:
+        """
+        Downloads an image, unless it is unchanged since it was last
+        downloaded, and writes its thumbnails. Returns whether it changed.
+        """
+        with self.lock:
+            url_lock = self._url_locks.setdefault(url, threading.Lock())
+        with url_lock:
+            entry = self.index.get(url)
+            if entry is None:
+                # downloaded by another process since this one read the index
+                entry = self._read_index().get(url)
+                if entry is not None:
+                    with self.lock:
+                        self.index[url] = entry
+            request = urllib.request.Request(url)
+            if entry is not None and all(
+                os.path.exists(self.path(url, width)) for width in self.widths
+            ):
+                if entry.get("etag"):
+                    request.add_header("If-None-Match", entry["etag"])
+                if entry.get("last_modified"):
+                    request.add_header("If-Modified-Since", entry["last_modified"])
+            try:
+                with urllib.request.urlopen(
+                    request, timeout=DOWNLOAD_TIMEOUT_SECONDS
+                ) as response:
+                    image_bytes = response.read()
+                    headers = response.headers
+            except urllib.error.HTTPError as error:
+                if error.code == 304:
+                    return False
+                raise
+
+            content_hash = hashlib.sha256(image_bytes).hexdigest()
+            if (
+                entry is not None
+                and entry["hash"] == content_hash
+                and all(os.path.exists(self.path(url, width)) for width in self.widths)
+            ):
+                return False
+
+            os.makedirs(self.directory, exist_ok=True)
+            for width in self.widths:
+                path = os.path.join(
+                    self.directory, self._file_name(content_hash, width)
+                )
+                if not os.path.exists(path):
+                    tmp_path = _tmp_path(path)
+                    with open(tmp_path, "wb") as f:
+                        f.write(_resize(image_bytes, width))
+                    os.replace(tmp_path, path)
+
+            self._update_index(
+                lambda index: index.update(
+                    {
+                        url: {
+                            "hash": content_hash,
+                            "etag": headers.get("ETag"),
+                            "last_modified": headers.get("Last-Modified"),
+                        }
+                    }
+                )
+            )
+            return True
+
+    def get(self, url: str, width: int) -> Optional[str]:
+        """
+        Returns the served URL of a thumbnail, or None if it is not cached
+        yet, in which case the image is downloaded in the background: the
+        caller shows the remote image meanwhile, rather than waiting.
+        """
+        thumbnail = self.static_url_for(url, width)
+        if thumbnail is None:
+            self._queue(url)
+        return thumbnail
+
+    def _queue(self, url: str):
+        with self.lock:
+            failed_at = self._failed.get(url)
+            if url in self._queued or (
+                failed_at is not None
+                and time.monotonic() - failed_at < RETRY_FAILED_SECONDS
+            ):
+                return
+            self._queued.add(url)
+        self._executor.submit(self._fetch_queued, url)
+
+    def _fetch_queued(self, url: str):
+        try:
+            self.fetch(url)
+            with self.lock:
+                self._failed.pop(url, None)
+        except Exception as error:
+            logger.warning("Downloading %s failed: %s", url, error)
+            with self.lock:
+                self._failed[url] = time.monotonic()
+        finally:
+            with self.lock:
+                self._queued.discard(url)
+
+    def refresh(self, urls: Iterable[str]) -> int:
+        """
+        Downloads the new and changed images among `urls`, concurrently, and
+        removes the thumbnails of images no longer listed, once older than
+        `prune_grace`. Returns the number of images downloaded.
+        """
+        urls = sorted({url for url in urls if url})
+        self._failed.clear()
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+            results = list(executor.map(self._try_fetch, urls))
+
+        def drop_unlisted(index: Dict[str, dict]):
+            for url in set(index) - set(urls):
+                del index[url]
+
+        self._update_index(drop_unlisted)
+        with self._locked():
+            # as written by every process
+            kept = {
+                self._file_name(entry["hash"], width)
+                for entry in self._read_index().values()
+                for width in self.widths
+            }
+            removed_before = time.time() - self.prune_grace
+            for name in os.listdir(self.directory):
+                if not name.endswith(".jpg") or name in kept:
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    if os.path.getmtime(path) < removed_before:
+                        os.remove(path)
+                except FileNotFoundError:
+                    # removed by another process meanwhile
+                    pass
+        return sum(results)
+
+    def _try_fetch(self, url: str) -> bool:
+        try:
+            return self.fetch(url)
+        except Exception as error:
+            # the previous thumbnails, if any, are kept
+            logger.warning("Downloading %s failed: %s", url, error)
+            return False
+
+
+_thumbnails = ThumbnailCache()
+
+
+def refresh_member_images(members_df) -> int:
+    """Brings the thumbnails up to date with the `member_image_link` of `members_df`."""
+    return _thumbnails.refresh(members_df["member_image_link"].dropna().astype(str))
+
+
+def show_member_image(url: Optional[str], width: int, caption: Optional[str] = None):
+    """
+    Shows a member photo from its local thumbnail, or from `url` while the
+    thumbnail is made in the background, if it cannot be (or static serving
+    is off).
+
+    Parameters:
+    - url (Optional[str]): Link of the full-size photo.
+    - width (int): Width to show it at, one of `WIDTHS`.
+    - caption (Optional[str]): Caption under the photo.
+    """
+    if not isinstance(url, str) or not url:
+        if caption:
+            st.caption(caption)
+        return
+    thumbnail = (
+        _thumbnails.get(url, width)
+        if st.get_option("server.enableStaticServing")
+        else None
+    )
+    if thumbnail is None:
+        st.image(url, width=width, caption=caption)
+        return
+    alt = html.escape(caption or "")
+    st.markdown(
+        f'<img src="{thumbnail}" width="{width}" alt="{alt}">',
+        unsafe_allow_html=True,
+    )
+    if caption:
+        st.caption(caption)
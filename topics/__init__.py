@@ -0,0 +1,258 @@
+import threading
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from incremental import REVISION_MONTHS, shift_period, to_period
+from queries import execute_registered_query
+from utils import arrow_to_dataframe
+
+# Months compared by `TopicMatrix.trending` by default: the latest months,
+# and the months before them they are compared with.
+RECENT_MONTHS = 3
+BASELINE_MONTHS = 12
+
+
+def _month_index(period):
+    # months since year 0, of a period (year * 100 + month) or an array of them
+    return (period // 100) * 12 + period % 100 - 1
+
+
+def _period_range(first: int, last: int) -> np.ndarray:
+    # every month from `first` to `last`, as periods
+    months = np.arange(_month_index(first), _month_index(last) + 1)
+    return to_period(months // 12, months % 12 + 1)
+
+
+class TopicMatrix:
+    """
+    Speech counts by topic, month and member, as one sparse matrix with a row
+    per topic and a column per (month, member) with speeches. Counts by topic
+    and month (`by_month`, with a column for every month) and by topic and
+    member (`by_member`) are sums of its columns, so every question below is
+    answered by slicing them rather than by grouping speeches.
+
+    A matrix is never modified: `append` returns a new one.
+
+    Parameters:
+    - counts (pd.DataFrame): Speech counts with columns `topic_id`,
+      `topic_title`, `member_name`, `year`, `month` and `count_speeches`.
+    """
+
+    def __init__(self, counts: pd.DataFrame):
+        counts = counts[counts["count_speeches"] > 0]
+        periods = to_period(counts["year"], counts["month"]).to_numpy(np.int32)
+
+        self.topics = pd.Index(counts["topic_id"].unique(), name="topic_id")
+        self.titles = (
+            counts.drop_duplicates("topic_id")
+            .set_index("topic_id")["topic_title"]
+            .reindex(self.topics)
+        )
+        self.members = pd.Index(counts["member_name"].unique(), name="member_name")
+
+        # one column per (month, member) pair with speeches
+        member_codes = self.members.get_indexer(counts["member_name"])
+        pairs = pd.MultiIndex.from_arrays([periods, member_codes])
+        self.column_keys = pairs.unique()
+        self.counts = sparse.csr_matrix(
+            (
+                counts["count_speeches"].to_numpy(np.int32),
+                (
+                    self.topics.get_indexer(counts["topic_id"]),
+                    self.column_keys.get_indexer(pairs),
+                ),
+            ),
+            shape=(len(self.topics), len(self.column_keys)),
+            dtype=np.int32,
+        )
+        self.counts.sum_duplicates()
+
+        column_periods = self.column_keys.get_level_values(0).to_numpy()
+        column_members = self.column_keys.get_level_values(1).to_numpy()
+        self.periods = (
+            _period_range(column_periods.min(), column_periods.max())
+            if len(column_periods)
+            else np.empty(0, np.int64)
+        )
+        self.by_month = self._sum_columns(
+            np.searchsorted(self.periods, column_periods), len(self.periods)
+        )
+        self.by_member = self._sum_columns(column_members, len(self.members))
+
+    def _sum_columns(self, groups: np.ndarray, n_groups: int) -> sparse.csc_matrix:
+        # counts summed over the columns in each group, as topics x groups
+        indicator = sparse.csr_matrix(
+            (
+                np.ones(len(groups), np.int32),
+                (np.arange(len(groups)), groups),
+            ),
+            shape=(len(groups), n_groups),
+            dtype=np.int32,
+        )
+        return (self.counts @ indicator).tocsc()
+
+    @property
+    def latest_period(self) -> Optional[int]:
+        return int(self.periods[-1]) if len(self.periods) else None
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes used by the sparse matrices."""
+        return sum(
+            matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+            for matrix in [self.counts, self.by_month, self.by_member]
+        )
+
+    def to_frame(self) -> pd.DataFrame:
+        """Returns the counts as rows, in the form `TopicMatrix` is built from."""
+        counts = self.counts.tocoo()
+        periods = self.column_keys.get_level_values(0).to_numpy()[counts.col]
+        return pd.DataFrame(
+            {
+                "topic_id": self.topics[counts.row],
+                "topic_title": self.titles.to_numpy()[counts.row],
+                "member_name": self.members[
+                    self.column_keys.get_level_values(1).to_numpy()[counts.col]
+                ],
+                "year": periods // 100,
+                "month": periods % 100,
+                "count_speeches": counts.data,
+            }
+        )
+
+    def append(self, counts: pd.DataFrame, since_period: int) -> "TopicMatrix":
+        """
+        Returns a matrix with the months from `since_period` onwards replaced
+        by `counts`, which holds those months. It is built from the kept and
+        new counts at once, so it is as compact as one built from scratch.
+        """
+        kept = self.to_frame()
+        kept = kept[to_period(kept["year"], kept["month"]) < since_period]
+        return TopicMatrix(pd.concat([kept, counts], ignore_index=True))
+
+    def _topic_frame(self, rows: np.ndarray, **columns) -> pd.DataFrame:
+        return pd.DataFrame(
+            {
+                "topic_id": self.topics[rows],
+                "topic_title": self.titles.to_numpy()[rows],
+                **columns,
+            }
+        )
+
+    def trending(
+        self,
+        k: int = 10,
+        recent_months: int = RECENT_MONTHS,
+        baseline_months: int = BASELINE_MONTHS,
+    ) -> pd.DataFrame:
+        """
+        Returns the `k` topics whose speeches per month grew the most in the
+        latest `recent_months`, compared with the `baseline_months` before.
+        `growth` is the ratio of the two rates, each plus one speech a month
+        so that new topics do not rank by their first speech alone.
+        """
+        recent = np.asarray(self.by_month[:, -recent_months:].sum(axis=1)).ravel()
+        baseline = np.asarray(
+            self.by_month[:, -(recent_months + baseline_months) : -recent_months].sum(
+                axis=1
+            )
+        ).ravel()
+        recent_rate = recent / recent_months
+        baseline_rate = baseline / baseline_months
+        growth = (recent_rate + 1) / (baseline_rate + 1)
+
+        candidates = np.flatnonzero(recent)
+        top = candidates[np.argsort(-growth[candidates], kind="stable")[:k]]
+        return self._topic_frame(
+            top,
+            recent_per_month=recent_rate[top],
+            baseline_per_month=baseline_rate[top],
+            growth=growth[top],
+        )
+
+    def member_top_topics(self, member_name: str, k: int = 10) -> pd.DataFrame:
+        """Returns the `k` topics a member spoke on most, with their speech counts."""
+        if member_name not in self.members:
+            return self._topic_frame(np.empty(0, int), count_speeches=[])
+        column = self.by_member[:, self.members.get_loc(member_name)]
+        rows, counts = column.indices, column.data
+        top = np.argsort(-counts, kind="stable")[:k]
+        return self._topic_frame(rows[top], count_speeches=counts[top])
+
+    def topic_members(self, topic_id: str, k: int = 10) -> pd.Series:
+        """Returns the `k` members who spoke on a topic most, with their speech counts."""
+        row = self.by_member[self.topics.get_loc(topic_id)].tocsr()
+        top = np.argsort(-row.data, kind="stable")[:k]
+        return pd.Series(
+            row.data[top],
+            index=self.members[row.indices[top]],
+            name="count_speeches",
+        )
+
+    def topic_series(self, topic_id: str) -> pd.Series:
+        """Returns the speeches on a topic in every month, as a Series by month start."""
+        row = self.by_month[self.topics.get_loc(topic_id)].toarray().ravel()
+        return pd.Series(
+            row,
+            index=pd.to_datetime(
+                {"year": self.periods // 100, "month": self.periods % 100, "day": 1}
+            ),
+            name="count_speeches",
+        )
+
+    def lifetimes(self) -> pd.DataFrame:
+        """
+        Returns, for every topic, its first and latest month with speeches,
+        the months between them, the months with speeches and the speeches.
+        """
+        by_topic = self.by_month.tocsr()
+        by_topic.sort_indices()
+        starts, ends = by_topic.indptr[:-1], by_topic.indptr[1:]
+        first = self.periods[by_topic.indices[starts]]
+        latest = self.periods[by_topic.indices[ends - 1]]
+        return self._topic_frame(
+            np.arange(len(self.topics)),
+            first_period=first,
+            latest_period=latest,
+            lifetime_months=_month_index(latest) - _month_index(first) + 1,
+            active_months=np.diff(by_topic.indptr),
+            count_speeches=np.asarray(by_topic.sum(axis=1)).ravel(),
+        )
+
+
+class TopicTrends:
+    """
+    Holds the topic matrix of all speeches, loaded once and then kept up to
+    date by fetching only the counts of the months from `REVISION_MONTHS`
+    before the latest one it holds. Readers use `matrix`, which `update`
+    replaces in one step.
+
+    Parameters:
+    - query (str): Registered query returning speech counts by topic, member
+      and month, from its `@since_period` parameter onwards.
+    """
+
+    def __init__(self, query: str = "topic_counts_since"):
+        self.query = query
+        self.matrix: Optional[TopicMatrix] = None
+        self.lock = threading.Lock()
+
+    def _fetch(self, since_period: int) -> pd.DataFrame:
+        return arrow_to_dataframe(
+            execute_registered_query(self.query, since_period=since_period)
+        )
+
+    def update(self) -> TopicMatrix:
+        """Fetches the counts of new (and recently revised) months."""
+        with self.lock:
+            if self.matrix is None or self.matrix.latest_period is None:
+                self.matrix = TopicMatrix(self._fetch(0))
+            else:
+                since_period = shift_period(self.matrix.latest_period, -REVISION_MONTHS)
+                self.matrix = self.matrix.append(
+                    self._fetch(since_period), since_period
+                )
+            return self.matrix
@@ -1,10 +1,33 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
 import streamlit as st
-from google.oauth2 import service_account
-from google.cloud import bigquery
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import pandas as pd
+import pyarrow as pa
+
+from guard import (
+    QUERY_GUARD,
+    QueryBudgetError,
+    ResultTooLarge,
+    cost_guard,
+    with_fallback,
+)
+from instrumentation import record_execution, track_query
+from metrics import format_metric_columns
+from shared import shared_store
+from snapshots import query_snapshot, read_manifest
 
 EARLIEST_SITTING = "2012-09-10"
 
+PARLIAMENTS = {"13th Parliament": [13], "14th Parliament": [14], "All": [12, 13, 14]}
+
 PARTY_COLOURS = {
     "PAP": "#FF9999",  # pastel red
     "PSP": "#FFFF99",  # pastel yellow
@@ -21,27 +44,346 @@ PARTY_SHAPES = {
     "SPP": "cross",
 }
 
-# Create API client.
+# "bigquery" queries BigQuery directly, "snapshot" serves every query from the
+# local Parquet snapshots (see `python -m snapshots`) so the app can run offline.
+DATA_BACKEND = os.environ.get("PARL_DATA_BACKEND", "bigquery")
+
+# "swr" keeps registered query results until the data changes, reloading them
+# in the background (see `freshness`); "ttl" caches them for a fixed time.
+CACHE_MODE = os.environ.get("PARL_CACHE_MODE", "swr")
 
-credentials = service_account.Credentials.from_service_account_info(
-    st.secrets["gcp_service_account"]
-)
-client = bigquery.Client(credentials=credentials)
 project_id = "singapore-parliament-speeches"
 
+# Upper bound on the number of queries run at the same time by one rerun.
+MAX_CONCURRENT_QUERIES = 8
 
-@st.cache_data(ttl=6000)
-def run_query(query):
-    query_job = client.query(query)
-    rows_raw = query_job.result()
+# Upper bound on the number of results kept by each cached query function.
+MAX_CACHE_ENTRIES = 256
+
+# Token unlocking the admin view and profiling (`?admin=<token>`); both are
+# disabled when it is not set.
+ADMIN_TOKEN = os.environ.get("PARL_ADMIN_TOKEN")
+
+# BigQuery types of query parameter values. bool is checked before int and
+# datetime before date, as they are subclasses.
+QUERY_PARAMETER_TYPES = [
+    (bool, "BOOL"),
+    (int, "INT64"),
+    (float, "FLOAT64"),
+    (str, "STRING"),
+    (datetime, "DATETIME"),
+    (date, "DATE"),
+]
+
+
+def is_admin_request() -> bool:
+    """Returns whether the current request carries the admin token."""
+    if not ADMIN_TOKEN:
+        return False
+    return hmac.compare_digest(st.query_params.get("admin", ""), ADMIN_TOKEN)
+
+
+def make_client():
+    """
+    Builds a BigQuery client from the service account in the Streamlit secrets.
+    The Google client libraries are imported here rather than at the top of
+    the module, as they take a noticeable share of the app's start-up time and
+    are never used offline.
+
+    Its HTTP session keeps up to `MAX_CONCURRENT_QUERIES` connections open, so
+    that queries run together by `run_concurrently` reuse them rather than
+    opening new ones.
+    """
+    from google.auth.transport.requests import AuthorizedSession
+    from google.cloud import bigquery
+    from google.oauth2 import service_account
+    from requests.adapters import HTTPAdapter
+
+    credentials = service_account.Credentials.from_service_account_info(
+        st.secrets["gcp_service_account"]
+    ).with_scopes(bigquery.Client.SCOPE)
+    session = AuthorizedSession(credentials)
+    session.mount(
+        "https://",
+        HTTPAdapter(
+            pool_connections=MAX_CONCURRENT_QUERIES,
+            pool_maxsize=MAX_CONCURRENT_QUERIES,
+        ),
+    )
+    return bigquery.Client(
+        project=credentials.project_id, credentials=credentials, _http=session
+    )
+
+
+# Create API client on the first query, once per process. Not needed (nor
+# possible without credentials) offline.
+@st.cache_resource(show_spinner=False)
+def get_client():
+    return make_client()
+
+
+def query_parameter(name: str, value: Any):
+    """
+    Builds a BigQuery query parameter, referenced as `@name` in a query, from a
+    Python value. Lists and tuples become array parameters.
+    """
+    from google.cloud import bigquery
+
+    values = list(value) if isinstance(value, (list, tuple)) else [value]
+    parameter_type = next(
+        (
+            bq_type
+            for py_type, bq_type in QUERY_PARAMETER_TYPES
+            if isinstance(values[0], py_type)
+        ),
+        None,
+    )
+    if parameter_type is None:
+        raise TypeError(
+            f"Unsupported type for query parameter {name}: {type(values[0])}"
+        )
+
+    if isinstance(value, (list, tuple)):
+        return bigquery.ArrayQueryParameter(name, parameter_type, values)
+    return bigquery.ScalarQueryParameter(name, parameter_type, value)
+
+
+def dry_run_bytes(query, params: Optional[Dict[str, Any]] = None) -> int:
+    """
+    Returns the bytes a query would scan on BigQuery, from a dry run: the
+    query is validated and planned, but not run nor billed.
+    """
+    from google.cloud import bigquery
+
+    job_config = bigquery.QueryJobConfig(
+        dry_run=True,
+        use_query_cache=False,
+        query_parameters=[
+            query_parameter(name, value) for name, value in (params or {}).items()
+        ],
+    )
+    return get_client().query(query, job_config=job_config).total_bytes_processed
+
+
+def _snapshot_fallback(
+    query, params: Optional[Dict[str, Any]]
+) -> Optional[Callable[[], pa.Table]]:
+    # the query run on the local snapshots, if any were taken, in place of a
+    # query refused by the cost guard
+    if not read_manifest():
+        return None
+    return lambda: query_snapshot(query, project_id, params=params)
+
+
+def _refused(
+    error: QueryBudgetError,
+    query,
+    params: Optional[Dict[str, Any]],
+    start: float,
+) -> Tuple[pa.Table, Dict[str, Optional[int]]]:
+    # a query refused by the cost guard, served from the snapshots or raised
+    arrow_table = with_fallback(error, _snapshot_fallback(query, params))
+    cost_guard.check_rows(query, arrow_table.num_rows)
+    job_stats = {"bytes_processed": None, "slot_millis": None}
+    record_execution(time.perf_counter() - start, arrow_table.num_rows, **job_stats)
+    return arrow_table, job_stats
+
+
+def execute_query(
+    query, params: Optional[Dict[str, Any]] = None
+) -> Tuple[pa.Table, Dict[str, Optional[int]]]:
+    """
+    Runs a query on the configured backend.
+
+    With PARL_QUERY_GUARD=1, a BigQuery query over the byte budgets of the
+    cost guard (estimated by a dry run, once per query shape) is run on the
+    local snapshots instead, if there are any, and raises a
+    `guard.QueryBudgetError` otherwise. So is a query returning more rows than
+    allowed (`guard.ResultTooLarge`), whose rows are not fetched.
+
+    Parameters:
+    - query (str): Query in BigQuery dialect, with parameters referenced as `@name`.
+    - params (Optional[Dict[str, Any]]): Query parameter values, by name.
+
+    Returns:
+    - Tuple[pa.Table, Dict[str, Optional[int]]]: The result, and job statistics
+      (`bytes_processed`, `slot_millis`; None when served from snapshots).
+    """
+    start = time.perf_counter()
+    if DATA_BACKEND == "snapshot":
+        arrow_table = query_snapshot(query, project_id, params=params)
+        if QUERY_GUARD:
+            cost_guard.check_rows(query, arrow_table.num_rows)
+        job_stats = {"bytes_processed": None, "slot_millis": None}
+        record_execution(time.perf_counter() - start, arrow_table.num_rows, **job_stats)
+        return arrow_table, job_stats
+
+    from google.cloud import bigquery
+
+    if QUERY_GUARD:
+        try:
+            cost_guard.admit(
+                query,
+                cost_guard.estimate(
+                    query, lambda: dry_run_bytes(query, params), params
+                ),
+            )
+        except QueryBudgetError as error:
+            return _refused(error, query, params, start)
+
+    job_config = None
+    if params:
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                query_parameter(name, value) for name, value in params.items()
+            ]
+        )
+    query_job = get_client().query(query, job_config=job_config)
+    if QUERY_GUARD:
+        # waits for the job, and reads its row count without fetching a page
+        # of rows; to_arrow reuses the finished job's results
+        try:
+            cost_guard.check_rows(query, query_job.result(max_results=0).total_rows)
+        except ResultTooLarge as error:
+            # the job is billed, but its rows are not downloaded
+            return _refused(error, query, params, start)
+    arrow_table = query_job.to_arrow()
+    job_stats = {
+        "bytes_processed": query_job.total_bytes_processed,
+        "slot_millis": query_job.slot_millis,
+    }
+    record_execution(time.perf_counter() - start, arrow_table.num_rows, **job_stats)
+    return arrow_table, job_stats
+
+
+def query_to_arrow(query, params: Optional[Dict[str, Any]] = None) -> pa.Table:
+    """
+    Runs a query on the configured backend and returns the result as Arrow
+    record batches, without building a Python object per row.
+
+    On BigQuery the result is downloaded through the BigQuery Storage API when
+    `google-cloud-bigquery-storage` is installed, and paged over REST otherwise.
+    """
+    return execute_query(query, params)[0]
+
+
+def arrow_to_dataframe(arrow_table: pa.Table) -> pd.DataFrame:
+    """
+    Converts an Arrow table to a typed DataFrame. Arrow buffers are released
+    while converting, so the peak holds little more than one copy of the data.
+    Dtypes match those of a DataFrame built from a list of row dicts.
+    """
+    return arrow_table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def query_label(query: str) -> str:
+    """
+    Returns the name ad hoc queries are recorded under: 'sql:' and a hash of
+    the query with whitespace collapsed.
+    """
+    normalised = " ".join(query.split())
+    return f"sql:{hashlib.sha1(normalised.encode()).hexdigest()[:12]}"
+
+
+def shared_query_to_arrow(query) -> pa.Table:
+    """
+    Runs a query like `query_to_arrow`, through the cache shared by the server
+    processes when one is configured (see `shared`): the query then runs once
+    for all of them, and its result is kept as long as by `st.cache_data`.
+    """
+    store = shared_store()
+    if store is None:
+        return query_to_arrow(query)
+    return store.get_or_load(
+        ("sql", query), lambda: query_to_arrow(query), max_age=6000
+    )
+
+
+@st.cache_data(ttl=6000, max_entries=MAX_CACHE_ENTRIES, show_spinner=False)
+def _run_query_cached(query):
     # Convert to list of dicts. Required for st.cache_data to hash the return value.
-    rows = [dict(row) for row in rows_raw]
-    return rows
+    return shared_query_to_arrow(query).to_pylist()
+
+
+@st.cache_data(ttl=6000, max_entries=MAX_CACHE_ENTRIES, show_spinner=False)
+def _query_to_dataframe_cached(query):
+    # Built from Arrow rather than from run_query, so that each query is cached
+    # once, as a DataFrame.
+    return arrow_to_dataframe(shared_query_to_arrow(query))
+
+
+def run_query(query):
+    """Runs a query (cached) and returns the result as a list of dicts."""
+    with track_query(query_label(query)) as event:
+        result = _run_query_cached(query)
+        event.rows = len(result)
+    return result
 
 
-@st.cache_data(ttl=6000)
 def query_to_dataframe(query):
-    return pd.DataFrame(run_query(query))
+    """Runs a query (cached) and returns the result as a DataFrame."""
+    with track_query(query_label(query)) as event:
+        result = _query_to_dataframe_cached(query)
+        event.rows = len(result)
+    return result
+
+
+def run_concurrently(
+    tasks: Dict[str, Callable[[], Any]], max_workers: int = MAX_CONCURRENT_QUERIES
+) -> Iterator[Tuple[str, Any]]:
+    """
+    Runs independent data-loading functions (e.g. the `agg_data` getters) at the
+    same time on a bounded thread pool, so that loading them takes as long as
+    the slowest one rather than the sum of all of them.
+
+    Workers share the script run context of the caller, so cached functions
+    called from them read and populate the same `st.cache_data` caches as
+    when called directly.
+
+    Parameters:
+    - tasks (Dict[str, Callable[[], Any]]): Functions to run, by name.
+    - max_workers (int): Maximum number of functions running at once.
+
+    Returns:
+    - Iterator[Tuple[str, Any]]: (name, result) pairs, in order of completion.
+      Exceptions raised by a function are re-raised when its result is reached.
+    """
+    if not tasks:
+        return
+
+    # None when called outside of a script run, e.g. by the warm-up
+    ctx = get_script_run_ctx(suppress_warning=True)
+    with ThreadPoolExecutor(
+        max_workers=min(max_workers, len(tasks)),
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx),
+    ) as executor:
+        futures = {executor.submit(task): name for name, task in tasks.items()}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def run_query_batch(
+    queries: Dict[str, str],
+    as_dataframe: bool = False,
+    max_workers: int = MAX_CONCURRENT_QUERIES,
+) -> Iterator[Tuple[str, Any]]:
+    """
+    Runs independent queries at the same time through `run_query` (or
+    `query_to_dataframe` if `as_dataframe`), populating their caches.
+
+    Parameters:
+    - queries (Dict[str, str]): Queries to run, by name.
+    - as_dataframe (bool): Whether to return DataFrames instead of lists of dicts.
+    - max_workers (int): Maximum number of queries running at once.
+
+    Returns:
+    - Iterator[Tuple[str, Any]]: (name, result) pairs, in order of completion.
+    """
+    run = query_to_dataframe if as_dataframe else run_query
+    return run_concurrently(
+        {name: (lambda query=query: run(query)) for name, query in queries.items()},
+        max_workers=max_workers,
+    )
 
 
 def calculate_readability(row):
@@ -77,24 +419,4 @@ def process_metric_columns(df: pd.DataFrame) -> pd.DataFrame:
     if not isinstance(df, pd.DataFrame):
         raise ValueError("Input is not a DataFrame")
 
-    def format_percentage(value):
-        if pd.isna(value):
-            return value
-        return f"{value:.1f}%"
-
-    def format_count(value):
-        if pd.isna(value):
-            return value
-        return round(value)
-
-    # Identify columns with '%' in their names
-    percentage_columns = [col for col in df.columns if "%" in col]
-    count_columns = [col for col in df.columns if "#" in col]
-
-    for col in percentage_columns:
-        df[col] = df[col].apply(lambda x: format_percentage(x))
-
-    for col in count_columns:
-        df[col] = df[col].apply(lambda x: format_count(x))
-
-    return df
+    return format_metric_columns(df)